@@ -0,0 +1,17 @@
+from django.contrib import admin
+from .models import LLMCacheEntry, RecognizedImage
+
+
+@admin.register(RecognizedImage)
+class RecognizedImageAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'model', 'size', 'created_at']
+    search_fields = ['content_hash', 'description']
+    readonly_fields = ['created_at']
+
+
+@admin.register(LLMCacheEntry)
+class LLMCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['namespace', 'model', 'hits', 'expires_at', 'accessed_at', 'created_at']
+    list_filter = ['namespace', 'model']
+    search_fields = ['key', 'value']
+    readonly_fields = ['created_at']
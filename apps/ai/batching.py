@@ -0,0 +1,109 @@
+"""突发请求的微批处理。
+
+群聊热闹或者有人转发长聊天记录时，几秒内会有大量消息分类请求，每条都是一次单独的模型往返。
+MicroBatcher 把短时间窗口内到达的请求攒成一批交给 handler 一次处理，再把结果分发回各自等待的调用方：
+- 第一个请求到达后最多等待 window 秒，攒满 max_size 条立即发送
+- handler 接收条目列表，返回等长的结果列表；handler 抛出异常或返回的结果数不对时，没有拿到结果的调用方收到异常
+- 调用方被取消不影响同批其他请求
+
+批处理器按事件循环分别创建（同 http_clients，事件循环结束后随之释放），窗口和批大小每次获取时按最新配置更新。
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_totals = Counter()
+
+
+class MicroBatcher:
+    def __init__(self, name: str, handler, window: float, max_size: int):
+        self.name = name
+        self.handler = handler
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, item):
+        """加入当前批次并等待该条目的结果。"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # 保留任务引用，避免批次还没处理完就被垃圾回收
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        with _lock:
+            _totals[f'{self.name}:batches'] += 1
+            _totals[f'{self.name}:items'] += len(batch)
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            logger.exception("%s 批处理失败（%d 条）", self.name, len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        results = list(results)
+        if len(results) != len(batch):
+            logger.error("%s 批处理返回 %d 个结果，应为 %d 个", self.name, len(results), len(batch))
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+        # 结果数量不足时，剩下的调用方不能一直等下去
+        for _, future in batch[len(results):]:
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} 批处理没有返回该条目的结果"))
+
+
+_batchers = weakref.WeakKeyDictionary()
+
+
+def get_batcher(name: str, handler, window: float, max_size: int) -> MicroBatcher:
+    """返回当前事件循环上名为 name 的批处理器，不存在时创建；window / max_size 按本次传入的值更新。"""
+    loop = asyncio.get_running_loop()
+    batchers = _batchers.setdefault(loop, {})
+    batcher = batchers.get(name)
+    if batcher is None:
+        batcher = batchers[name] = MicroBatcher(name, handler, window, max_size)
+    else:
+        batcher.window = window
+        batcher.max_size = max(1, max_size)
+    return batcher
+
+
+def batch_stats() -> dict:
+    """{'名称': {'batches': 批次数, 'items': 条目数}}"""
+    with _lock:
+        result = {}
+        for key, value in _totals.items():
+            name, field = key.rsplit(':', 1)
+            result.setdefault(name, {'batches': 0, 'items': 0})[field] = value
+        return result
+
+
+def log_batch_stats():
+    for name, stats in sorted(batch_stats().items()):
+        logger.info("微批处理 %s: 共 %d 批 %d 条，平均每批 %.1f 条",
+                    name, stats['batches'], stats['items'],
+                    stats['items'] / stats['batches'] if stats['batches'] else 0.0)
@@ -0,0 +1,220 @@
+"""大模型调用结果缓存。
+
+重复分享的文章、反复出现的"收到/好的"、没有变化的任务列表都会发出完全相同的请求。
+这里按 (调用方, 模型, 提示词版本, 规范化后的输入) 计算缓存键：
+- 进程内 LRU（LLM_CACHE_MEMORY_SIZE 条）挡在前面，命中时不访问数据库
+- 数据库持久化（LLMCacheEntry），机器人重启后仍然有效，总条数超过 LLM_CACHE_MAX_ENTRIES 时按最近访问淘汰
+- 每个调用方有独立的 TTL（LLM_CACHE_TTLS）
+- 提示词版本取模板文本的哈希，修改提示词后旧结果自动失效
+
+只缓存模型成功返回的结果；调用失败时的兜底值不写入缓存。
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from apps.channel.blocking import run_blocking
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTLS = {
+    'classify_message': 7 * 24 * 3600,
+    'analyze_article': 30 * 24 * 3600,
+    'generate_reply': 24 * 3600,
+    'scheduler_summary': 6 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+
+# 每写入多少条检查一次数据库容量
+EVICT_CHECK_INTERVAL = 50
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class CacheKey:
+    __slots__ = ('namespace', 'model', 'digest')
+
+    def __init__(self, namespace, model, digest):
+        self.namespace = namespace
+        self.model = model
+        self.digest = digest
+
+
+def prompt_version(template: str) -> str:
+    return hashlib.sha256(template.encode('utf-8')).hexdigest()[:8]
+
+
+def normalize_input(value) -> str:
+    return WHITESPACE_RE.sub(' ', str(value or '')).strip()
+
+
+def cache_key(namespace: str, model: str, version: str, *parts) -> CacheKey:
+    raw = '\x1f'.join([namespace, model, version, *(normalize_input(p) for p in parts)])
+    return CacheKey(namespace, model, hashlib.sha256(raw.encode('utf-8')).hexdigest())
+
+
+def _enabled():
+    return getattr(settings, 'LLM_CACHE_ENABLED', True)
+
+
+def _ttl(namespace):
+    ttls = {**DEFAULT_TTLS, **getattr(settings, 'LLM_CACHE_TTLS', {})}
+    return ttls.get(namespace, DEFAULT_TTL)
+
+
+class _MemoryLRU:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, digest):
+        with self._lock:
+            item = self._items.get(digest)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= timezone.now():
+                del self._items[digest]
+                return None
+            self._items.move_to_end(digest)
+            return value
+
+    def set(self, digest, value, expires_at):
+        max_size = getattr(settings, 'LLM_CACHE_MEMORY_SIZE', 512)
+        with self._lock:
+            self._items[digest] = (value, expires_at)
+            self._items.move_to_end(digest)
+            while len(self._items) > max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_memory = _MemoryLRU()
+_stats_lock = threading.Lock()
+_stats = defaultdict(lambda: {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0})
+_writes = 0
+
+
+def _count(namespace, field):
+    with _stats_lock:
+        _stats[namespace][field] += 1
+
+
+def cache_get(key: CacheKey):
+    """返回缓存的结果，未命中时返回 None。"""
+    if not _enabled():
+        return None
+
+    value = _memory.get(key.digest)
+    if value is not None:
+        _count(key.namespace, 'memory_hits')
+        return value
+
+    from apps.ai.models import LLMCacheEntry
+
+    now = timezone.now()
+    try:
+        entry = LLMCacheEntry.objects.filter(key=key.digest, expires_at__gt=now).first()
+        if entry is not None:
+            LLMCacheEntry.objects.filter(id=entry.id).update(accessed_at=now, hits=entry.hits + 1)
+            value = json.loads(entry.value)
+    except Exception:
+        logger.exception("读取大模型缓存失败")
+        entry = None
+
+    if entry is None:
+        _count(key.namespace, 'misses')
+        return None
+
+    _memory.set(key.digest, value, entry.expires_at)
+    _count(key.namespace, 'db_hits')
+    logger.info("大模型缓存命中: %s", key.namespace)
+    return value
+
+
+def cache_set(key: CacheKey, value):
+    """写入缓存；value 必须可以 JSON 序列化。"""
+    global _writes
+    if not _enabled() or value is None:
+        return
+
+    from apps.ai.models import LLMCacheEntry
+
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=_ttl(key.namespace))
+    _memory.set(key.digest, value, expires_at)
+    try:
+        LLMCacheEntry.objects.update_or_create(
+            key=key.digest,
+            defaults={
+                'namespace': key.namespace,
+                'model': key.model,
+                'value': json.dumps(value, ensure_ascii=False),
+                'expires_at': expires_at,
+                'accessed_at': now,
+            },
+        )
+    except Exception:
+        logger.exception("写入大模型缓存失败")
+        return
+    _count(key.namespace, 'stores')
+
+    with _stats_lock:
+        _writes += 1
+        check = _writes % EVICT_CHECK_INTERVAL == 0
+    if check:
+        evict()
+
+
+def evict() -> int:
+    """删除过期条目，并在总条数超过上限时按最近访问时间淘汰，返回删除条数。"""
+    from apps.ai.models import LLMCacheEntry
+
+    removed, _ = LLMCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+    max_entries = getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 5000)
+    overflow = LLMCacheEntry.objects.count() - max_entries
+    if overflow > 0:
+        ids = list(LLMCacheEntry.objects.order_by('accessed_at').values_list('id', flat=True)[:overflow])
+        removed += LLMCacheEntry.objects.filter(id__in=ids).delete()[0]
+    if removed:
+        logger.info("大模型缓存淘汰 %d 条记录", removed)
+    return removed
+
+
+async def acache_get(key: CacheKey):
+    value = _memory.get(key.digest) if _enabled() else None
+    if value is not None:
+        _count(key.namespace, 'memory_hits')
+        return value
+    return await run_blocking(cache_get)(key)
+
+
+async def acache_set(key: CacheKey, value):
+    await run_blocking(cache_set)(key, value)
+
+
+def cache_stats() -> dict:
+    """进程内各调用方的命中统计。"""
+    with _stats_lock:
+        stats = {}
+        for namespace, counts in _stats.items():
+            hits = counts['memory_hits'] + counts['db_hits']
+            total = hits + counts['misses']
+            stats[namespace] = {**counts, 'hit_rate': round(hits / total, 3) if total else 0.0}
+        return stats
+
+
+def log_cache_stats():
+    for namespace, s in cache_stats().items():
+        logger.info("大模型缓存 %s: 内存命中 %d, 数据库命中 %d, 未命中 %d, 命中率 %.1f%%",
+                    namespace, s['memory_hits'], s['db_hits'], s['misses'], s['hit_rate'] * 100)
@@ -1,11 +1,17 @@
-import json
+import asyncio
 import logging
-from http import HTTPStatus
+import re
 
-import dashscope
-from dashscope import Generation
 from django.conf import settings
 
+from .batching import get_batcher
+from .cache import acache_get, acache_set, cache_get, cache_key, cache_set, prompt_version
+from .compaction import compact
+from .llm import acomplete_route, complete_route, parse_json
+from .local_classifier import local_classify
+from .routing import select
+from .rules import preclassify
+
 logger = logging.getLogger(__name__)
 
 CLASSIFICATION_PROMPT = """你是一个消息分类助手。请将以下消息分类为以下四个类别之一：
@@ -19,25 +25,30 @@ CLASSIFICATION_PROMPT = """你是一个消息分类助手。请将以下消息
 
 消息内容：{content}"""
 
-ARTICLE_CLASSIFICATION_PROMPT = """你是一个专业的文章分类助手。
-请根据文章标题和描述（如果有的话），将文章分类到以下唯一匹配的分类中：
-AI、产品、技术、生活、管理、其他
+BATCH_CLASSIFICATION_PROMPT = """你是一个消息分类助手。请把下面 {count} 条消息逐条分类为以下四个类别之一：
+
+- urgent: 紧急事项，需要立即处理（如紧急会议、线上事故、截止日期临近的任务）
+- important: 重要事项，需要跟进但不紧急（如工作任务、项目安排、待办事项）
+- normal: 普通消息，可以直接回复（如日常问候、简单问题、闲聊）
+- ignore: 可忽略的消息（如广告、无意义的消息、系统通知）
 
-只输出一个分类名称，不要输出其他任何解释和符号。
+每条消息以"【编号】"开头，各条之间相互独立。只返回一个 JSON 对象，键为编号，值为分类标签，不要返回其他内容，例如：
+{{"1": "normal", "2": "urgent"}}
 
-文章标题：{title}
-文章描述：{description}"""
+{items}"""
 
-ARTICLE_ANALYSIS_PROMPT = """你是一个专业的文章分析与评分专家。
-请以中立、客观的视角仔细阅读以下文章内容（如果是纯文本的 HTML 请提取核心文本），并结合当前的行业背景和相关热点信息，完成以下三个任务：
+ARTICLE_PROMPT = """你是一个专业的文章分类、分析与评分专家。
+请以中立、客观的视角仔细阅读以下文章内容（如果是纯文本的 HTML 请提取核心文本），并结合当前的行业背景和相关热点信息，完成以下四个任务：
 
-1. **提取来源**：如果能从内容中看出文章来源（例如公众号名称、网站名称、作者等），请提取出来。如果无法确定，请返回"未知来源"。
-2. **客观内容评分**：请摆脱强烈的情感色彩，客观评判文章的深度、原创性、逻辑结构和实际价值。给出一个1到5星的评分（必须是"⭐"、"⭐⭐"、"⭐⭐⭐"、"⭐⭐⭐⭐"、"⭐⭐⭐⭐⭐"之一）。如果是口水文、拼凑内容或者价值不高的营销文，请不要吝啬给出低分。
-3. **结构化核心要点**：不要写成一段冗长的文字。请用 3 到 4 个精炼的 Bullet Points（用小圆点"•"开头）提炼出文章最核心的要点、新颖观点或实用结论。
+1. **文章分类**：从以下分类中选择唯一匹配的一个：AI、产品、技术、生活、管理、其他。
+2. **提取来源**：如果能从内容中看出文章来源（例如公众号名称、网站名称、作者等），请提取出来。如果无法确定，请返回"未知来源"。
+3. **客观内容评分**：请摆脱强烈的情感色彩，客观评判文章的深度、原创性、逻辑结构和实际价值。给出一个1到5星的评分（必须是"⭐"、"⭐⭐"、"⭐⭐⭐"、"⭐⭐⭐⭐"、"⭐⭐⭐⭐⭐"之一）。如果是口水文、拼凑内容或者价值不高的营销文，请不要吝啬给出低分。
+4. **结构化核心要点**：不要写成一段冗长的文字。请用 3 到 4 个精炼的 Bullet Points（用小圆点"•"开头）提炼出文章最核心的要点、新颖观点或实用结论。
 
 请必须严格按照以下 JSON 格式输出，不要输出任何其他多余的字符或解释（确保能够被 JSON 解析）：
 
 {{
+  "category": "技术",
   "source": "来源名称",
   "rating": "⭐⭐⭐",
   "summary": "• 核心要点一\n\n• 核心要点二\n\n• 核心要点三"
@@ -51,109 +62,247 @@ URL: {url}
 {content}
 """
 
-def classify_message(content: str) -> str:
+MESSAGE_LABELS = ('urgent', 'important', 'normal', 'ignore')
+ARTICLE_CATEGORIES = ('AI', '产品', '技术', '生活', '管理', '其他')
+
+DEFAULT_ANALYSIS = {
+    "category": "其他",
+    "source": "未知来源",
+    "rating": "⭐⭐⭐",
+    "summary": "未能成功获取文章摘要。"
+}
+
+
+def _message_shortcut(content: str) -> tuple[str, str] | None:
+    """不需要调用大模型就能确定的分类（规则、本地分类器、未配置 API Key）。"""
+    # 确认、纯表情、纯链接、系统通知、告警关键词等明确的情况由规则直接判断
+    ruled = preclassify(content)
+    if ruled:
+        return ruled, 'rules'
+
+    # 本地分类器足够确定时不再调用大模型
+    local = local_classify(content)
+    if local:
+        return local, 'local'
+
     if not settings.DASHSCOPE_API_KEY:
         logger.warning("DASHSCOPE_API_KEY 未配置，使用默认分类 normal")
-        return 'normal'
-
-    try:
-        dashscope.api_key = settings.DASHSCOPE_API_KEY
-        response = Generation.call(
-            model='qwen-plus',
-            messages=[{'role': 'user', 'content': CLASSIFICATION_PROMPT.format(content=content)}],
-            result_format='message'
+        return 'normal', 'default'
+    return None
+
+
+def _message_request(content: str):
+    route = select('classify_message', chars=len(content))
+    key = cache_key('classify_message', route.model, prompt_version(CLASSIFICATION_PROMPT), content)
+    messages = [{'role': 'user', 'content': CLASSIFICATION_PROMPT.format(content=content)}]
+    return key, messages, route
+
+
+def _parse_message_label(result: str | None) -> str | None:
+    if result is None:
+        return None
+    result = result.strip().lower()
+    if result in MESSAGE_LABELS:
+        return result
+    logger.warning("AI 返回了未知分类: %s，使用默认 normal", result)
+    return None
+
+
+def classify_message_with_source(content: str) -> tuple[str, str]:
+    """返回 (分类, 来源)。来源为 rules / local / llm；大模型调用失败或未配置 API Key 使用默认分类时来源为 default。"""
+    shortcut = _message_shortcut(content)
+    if shortcut:
+        return shortcut
+
+    key, messages, route = _message_request(content)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached, 'llm'
+
+    label = _parse_message_label(complete_route('消息分类', route, messages))
+    if label is None:
+        return 'normal', 'default'
+    cache_set(key, label)
+    return label, 'llm'
+
+
+async def aclassify_message_with_source(content: str) -> tuple[str, str]:
+    """classify_message_with_source 的异步版本，直接 await 大模型接口，不占用线程。"""
+    shortcut = _message_shortcut(content)
+    if shortcut:
+        return shortcut
+
+    key, messages, route = _message_request(content)
+    cached = await acache_get(key)
+    if cached is not None:
+        return cached, 'llm'
+
+    if getattr(settings, 'AI_CLASSIFY_BATCH_ENABLED', False):
+        batcher = get_batcher(
+            'classify_message', _aclassify_batch,
+            window=getattr(settings, 'AI_CLASSIFY_BATCH_WINDOW', 0.2),
+            max_size=getattr(settings, 'AI_CLASSIFY_BATCH_MAX_SIZE', 10),
         )
+        try:
+            label = await batcher.submit(content)
+        except Exception:
+            logger.exception("批量消息分类失败，使用默认分类")
+            label = None
+    else:
+        label = _parse_message_label(await acomplete_route('消息分类', route, messages))
+    if label is None:
+        return 'normal', 'default'
+    await acache_set(key, label)
+    return label, 'llm'
 
-        if response.status_code == HTTPStatus.OK:
-            result = response.output.choices[0].message.content.strip().lower()
-            if result in ('urgent', 'important', 'normal', 'ignore'):
-                return result
-            logger.warning("AI 返回了未知分类: %s，使用默认 normal", result)
-            return 'normal'
-        else:
-            logger.error("消息分类失败: %s - %s", response.code, response.message)
-            return 'normal'
-    except Exception:
-        logger.exception("消息分类异常")
-        return 'normal'
 
-def classify_article(title: str, description: str = "") -> str:
+async def _aclassify_one(content: str) -> str | None:
+    _, messages, route = _message_request(content)
+    return _parse_message_label(await acomplete_route('消息分类', route, messages))
+
+
+def _parse_batch_labels(result: str | None, count: int) -> list:
+    """解析批量分类结果，返回与输入等长的列表，无法确定的条目为 None。"""
+    parsed = parse_json(result) if result is not None else None
+    if isinstance(parsed, list) and len(parsed) == count:
+        parsed = {str(i): label for i, label in enumerate(parsed, 1)}
+    if not isinstance(parsed, dict):
+        return [None] * count
+    labels = []
+    for i in range(1, count + 1):
+        label = str(parsed.get(str(i), '')).strip().lower()
+        labels.append(label if label in MESSAGE_LABELS else None)
+    return labels
+
+
+async def _aclassify_batch(contents: list[str]) -> list:
+    """一次调用分类多条消息；批量结果无法解析的条目逐条重新分类。"""
+    if len(contents) == 1:
+        return [await _aclassify_one(contents[0])]
+
+    items = '\n\n'.join(f"【{i}】{content}" for i, content in enumerate(contents, 1))
+    messages = [{'role': 'user', 'content': BATCH_CLASSIFICATION_PROMPT.format(count=len(contents), items=items)}]
+    # 按最长的一条选择模型档位，和单条分类保持一致
+    route = select('classify_message', chars=max(len(content) for content in contents))
+    labels = _parse_batch_labels(await acomplete_route('批量消息分类', route, messages), len(contents))
+
+    missing = [i for i, label in enumerate(labels) if label is None]
+    if missing:
+        logger.warning("批量消息分类有 %d/%d 条无法解析，逐条重新分类", len(missing), len(contents))
+        retried = await asyncio.gather(*(_aclassify_one(contents[i]) for i in missing))
+        for i, label in zip(missing, retried):
+            labels[i] = label
+    return labels
+
+
+def classify_message(content: str) -> str:
+    return classify_message_with_source(content)[0]
+
+
+async def aclassify_message(content: str) -> str:
+    return (await aclassify_message_with_source(content))[0]
+
+
+def _article_request(title: str, url: str, content: str):
+    # 去掉模板行和重复行，按信息密度在 token 预算内挑选段落（控制 token 成本）
+    compacted = compact(content or "")
+    content_preview = compacted['text']
+    if compacted['saved_tokens']:
+        logger.info("正文压缩 %s: 旧截取约 %d -> %d tokens，节省 %d",
+                    url or title, compacted['legacy_tokens'], compacted['output_tokens'], compacted['saved_tokens'])
+    route = select('analyze_article', chars=len(content_preview))
+    key = cache_key('analyze_article', route.model, prompt_version(ARTICLE_PROMPT), title, url, content_preview)
+    messages = [{'role': 'user', 'content': ARTICLE_PROMPT.format(title=title, url=url, content=content_preview)}]
+    return key, messages, route
+
+
+def _normalize_rating(value) -> str:
+    """统一成 1~5 个"⭐"：兼容模型返回数字、"4星"、"★★★★" 等写法。"""
+    text = str(value or '').strip()
+    count = text.count('⭐') or text.count('★')
+    if not count:
+        digits = re.search(r'[1-5]', text)
+        count = int(digits.group()) if digits else 0
+    return '⭐' * count if 1 <= count <= 5 else DEFAULT_ANALYSIS['rating']
+
+
+def _normalize_category(value) -> str:
+    # 兼容模型可能加上标点的情况
+    category = str(value or '').strip().strip('。，,.')
+    if category in ARTICLE_CATEGORIES:
+        return category
+    logger.warning(f"AI 预估了不在枚举中的分类: {category}，使用默认: 其他")
+    return '其他'
+
+
+def _parse_article(result_text: str | None) -> dict | None:
+    """校验并规范化文章分析结果；JSON 无法修复时返回 None。"""
+    if result_text is None:
+        return None
+    parsed = parse_json(result_text)
+    if not isinstance(parsed, dict):
+        logger.error(f"AI 解析文章返回的 JSON 格式错误: {result_text[:500]}")
+        return None
+
+    summary = parsed.get("summary") or "暂无摘要"
+    if isinstance(summary, list):
+        summary = "\n\n".join(str(item) for item in summary)
+    return {
+        "category": _normalize_category(parsed.get("category")),
+        "source": str(parsed.get("source") or "未知来源").strip(),
+        "rating": _normalize_rating(parsed.get("rating")),
+        "summary": str(summary).strip(),
+    }
+
+
+def analyze_article(title: str, url: str = "", content: str = "") -> dict:
+    """一次调用完成文章分类、来源提取、评分和概要，返回 {category, source, rating, summary}。"""
     if not settings.DASHSCOPE_API_KEY:
-        logger.warning("DASHSCOPE_API_KEY 未配置，文章分类默认使用: 其他")
-        return '其他'
-
-    try:
-        dashscope.api_key = settings.DASHSCOPE_API_KEY
-        response = Generation.call(
-            model='qwen-plus',
-            messages=[{'role': 'user', 'content': ARTICLE_CLASSIFICATION_PROMPT.format(title=title, description=description)}],
-            result_format='message'
-        )
+        logger.warning("DASHSCOPE_API_KEY 未配置，跳过文章分析，分类默认使用: 其他")
+        return dict(DEFAULT_ANALYSIS)
+
+    key, messages, route = _article_request(title, url, content)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+
+    result = _parse_article(complete_route('文章分析', route, messages))
+    if result is None:
+        return dict(DEFAULT_ANALYSIS)
+    cache_set(key, result)
+    return result
+
+
+async def aanalyze_article(title: str, url: str = "", content: str = "") -> dict:
+    """analyze_article 的异步版本。"""
+    if not settings.DASHSCOPE_API_KEY:
+        logger.warning("DASHSCOPE_API_KEY 未配置，跳过文章分析，分类默认使用: 其他")
+        return dict(DEFAULT_ANALYSIS)
+
+    key, messages, route = _article_request(title, url, content)
+    cached = await acache_get(key)
+    if cached is not None:
+        return cached
+
+    result = _parse_article(await acomplete_route('文章分析', route, messages))
+    if result is None:
+        return dict(DEFAULT_ANALYSIS)
+    await acache_set(key, result)
+    return result
+
+
+def classify_article(title: str, description: str = "") -> str:
+    return analyze_article(title, content=description)["category"]
+
+
+async def aclassify_article(title: str, description: str = "") -> str:
+    return (await aanalyze_article(title, content=description))["category"]
 
-        if response.status_code == HTTPStatus.OK:
-            result = response.output.choices[0].message.content.strip()
-            # 兼容模型可能加上标点的情况
-            result = result.strip('。，,.')
-            if result in ('AI', '产品', '技术', '生活', '管理', '其他'):
-                return result
-            logger.warning(f"AI 预估了不在枚举中的分类: {result}，使用默认: 其他")
-            return '其他'
-        else:
-            logger.error(f"文章分类失败: {response.code} - {response.message}")
-            return '其他'
-    except Exception as e:
-        logger.exception(f"文章分类异常: {e}")
-        return '其他'
 
 def analyze_article_content(title: str, url: str, content: str) -> dict:
     """使用大模型对网页内容进行分析：提取来源、评分并生成概要。"""
-    default_result = {
-        "source": "未知来源",
-        "rating": "⭐⭐⭐",
-        "summary": "未能成功获取文章摘要。"
-    }
+    return analyze_article(title, url, content)
 
-    if not settings.DASHSCOPE_API_KEY:
-        logger.warning("DASHSCOPE_API_KEY 未配置，跳过文章内容深度分析")
-        return default_result
-
-    # 截取正文前 5000 字符进行分析（控制 token 成本）
-    content_preview = content[:5000] if content else ""
-
-    try:
-        dashscope.api_key = settings.DASHSCOPE_API_KEY
-        response = Generation.call(
-            model='qwen-plus',
-            messages=[{'role': 'user', 'content': ARTICLE_ANALYSIS_PROMPT.format(title=title, url=url, content=content_preview)}],
-            result_format='message'
-        )
 
-        if response.status_code == HTTPStatus.OK:
-            result_text = response.output.choices[0].message.content.strip()
-            # 去除可能包含的 markdown 代码块包裹 (```json ... ```)
-            if result_text.startswith("```json"):
-                result_text = result_text[7:]
-            if result_text.startswith("```"):
-                result_text = result_text[3:]
-            if result_text.endswith("```"):
-                result_text = result_text[:-3]
-
-            result_text = result_text.strip()
-
-            try:
-                import json
-                parsed_result = json.loads(result_text)
-                return {
-                    "source": parsed_result.get("source", "未知来源"),
-                    "rating": parsed_result.get("rating", "⭐⭐⭐"),
-                    "summary": parsed_result.get("summary", "暂无摘要")
-                }
-            except json.JSONDecodeError as e:
-                logger.error(f"AI 解析文章返回的 JSON 格式错误: {result_text}, Error: {e}")
-                return default_result
-        else:
-            logger.error(f"文章分析失败: {response.code} - {response.message}")
-            return default_result
-    except Exception as e:
-        logger.exception(f"文章内容分析异常: {e}")
-        return default_result
+async def aanalyze_article_content(title: str, url: str, content: str) -> dict:
+    return await aanalyze_article(title, url, content)
@@ -0,0 +1,163 @@
+"""文章分析前的正文压缩。
+
+提取出的正文里仍然常有重复的页脚、分享 / 关注引导、版权声明等没有信息量的行，
+直接按字符截取前 5000 字会把 token 花在这些内容上，真正的正文反而被截掉。这里：
+- 合并空白，丢弃模板行（阅读原文、扫码关注、版权所有……）和重复行
+- 按信息密度给段落打分（有效字符占比、长度、是否是完整句子）
+- 在 AI_ARTICLE_TOKEN_BUDGET 以内优先保留得分高的段落，输出时恢复原文顺序，首段始终优先保留
+- 预算不超过旧做法（前 5000 字）的 token 数：英文等拉丁字母正文 5000 字只有约 1250 tokens，
+  按固定预算反而会比原来发送更多内容；节省量也相对这 5000 字计算，因为完整正文从来不会整篇发送
+
+token 数按 Qwen 分词器的经验值估算：中日韩字符约 0.7 个 token / 字，其他字符约 4 个字符 1 个 token。
+"""
+import logging
+import math
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CJK_TOKENS_PER_CHAR = 0.7
+OTHER_CHARS_PER_TOKEN = 4
+
+CJK_RE = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]')
+WORD_RE = re.compile(r'[\w一-鿿]', re.UNICODE)
+WHITESPACE_RE = re.compile(r'[ \t　\xa0]+')
+URL_RE = re.compile(r'https?://\S+')
+SENTENCE_END_RE = re.compile(r'[。！？；.!?;:：）)」”"]$')
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[。！？；!?;])')
+
+BOILERPLATE_RE = re.compile(
+    r'阅读原文|阅读全文|展开全文|点击(上方|下方|蓝字|关注)|扫码|扫一扫|长按(识别|二维码)|关注(我们|公众号)|'
+    r'分享到|分享给|转发|收藏|点赞|在看|赞赏|打赏|留言|评论区|上一篇|下一篇|相关推荐|猜你喜欢|热门文章|'
+    r'版权(所有|声明)|未经(授权|许可)|转载请|免责声明|ICP备|公网安备|copyright|all rights reserved|返回顶部',
+    re.I,
+)
+# 模板行一般很短；长段落里顺带提到"评论""转发"不算
+BOILERPLATE_MAX_CHARS = 30
+MIN_LINE_CHARS = 2
+# 超过这个长度的段落按句子切开再打分，避免整段因为超出预算被丢掉
+MAX_PARAGRAPH_TOKENS = 300
+# 压缩前的做法：直接截取正文前 5000 个字符
+LEGACY_PREVIEW_CHARS = 5000
+
+_lock = threading.Lock()
+_totals = Counter()
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    cjk = len(CJK_RE.findall(text))
+    other = len(text) - cjk
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + other / OTHER_CHARS_PER_TOKEN)
+
+
+def _clean_lines(text: str) -> list[str]:
+    """合并空白，去掉模板行、过短的行和重复行。"""
+    seen = set()
+    lines = []
+    for raw in text.splitlines():
+        line = WHITESPACE_RE.sub(' ', raw).strip()
+        if len(line) < MIN_LINE_CHARS:
+            continue
+        if len(line) <= BOILERPLATE_MAX_CHARS and BOILERPLATE_RE.search(line):
+            continue
+        key = line.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return lines
+
+
+def _split_long(line: str) -> list[str]:
+    if estimate_tokens(line) <= MAX_PARAGRAPH_TOKENS:
+        return [line]
+    chunks, current = [], ''
+    for sentence in SENTENCE_SPLIT_RE.split(line):
+        if current and estimate_tokens(current + sentence) > MAX_PARAGRAPH_TOKENS:
+            chunks.append(current)
+            current = ''
+        current += sentence
+    if current:
+        chunks.append(current)
+    # 没有标点的超长文本按字符硬切
+    max_chars = int(MAX_PARAGRAPH_TOKENS / CJK_TOKENS_PER_CHAR)
+    return [chunk[i:i + max_chars] for chunk in chunks for i in range(0, len(chunk), max_chars)]
+
+
+def _density(line: str) -> float:
+    """信息密度得分：有效字符占比 × 长度因子，完整句子加分，链接为主的行降权。"""
+    length = len(line)
+    words = len(WORD_RE.findall(line))
+    score = words / length * math.log1p(length)
+    if SENTENCE_END_RE.search(line):
+        score *= 1.3
+    urls = sum(len(url) for url in URL_RE.findall(line))
+    if urls:
+        score *= max(0.1, 1 - urls / length)
+    return score
+
+
+def compact(text: str, budget: int | None = None) -> dict:
+    """压缩正文，返回 {'text', 'input_tokens', 'legacy_tokens', 'output_tokens', 'saved_tokens'}。
+
+    input_tokens 是完整正文，legacy_tokens 是旧做法截取的前 5000 字，saved_tokens 相对 legacy_tokens 计算。
+    """
+    if budget is None:
+        budget = getattr(settings, 'AI_ARTICLE_TOKEN_BUDGET', 2000)
+    text = text or ''
+    input_tokens = estimate_tokens(text)
+    legacy_tokens = estimate_tokens(text[:LEGACY_PREVIEW_CHARS])
+    budget = min(budget, legacy_tokens)
+
+    lines = [chunk for line in _clean_lines(text) for chunk in _split_long(line)]
+    costs = [estimate_tokens(line) + 1 for line in lines]
+
+    if estimate_tokens('\n'.join(lines)) <= budget:
+        kept = lines
+    else:
+        # 首段一般是导语，优先保留；其余按信息密度从高到低装入预算
+        order = sorted(range(1, len(lines)), key=lambda i: _density(lines[i]), reverse=True)
+        chosen = set()
+        used = 0
+        for i in [0, *order]:
+            if used + costs[i] <= budget:
+                chosen.add(i)
+                used += costs[i]
+        kept = [line for i, line in enumerate(lines) if i in chosen]
+
+    result_text = '\n'.join(kept)
+    output_tokens = estimate_tokens(result_text)
+    result = {
+        'text': result_text,
+        'input_tokens': input_tokens,
+        'legacy_tokens': legacy_tokens,
+        'output_tokens': output_tokens,
+        'saved_tokens': max(0, legacy_tokens - output_tokens),
+    }
+    with _lock:
+        _totals['articles'] += 1
+        _totals['input_tokens'] += input_tokens
+        _totals['legacy_tokens'] += legacy_tokens
+        _totals['output_tokens'] += output_tokens
+    return result
+
+
+def compaction_stats() -> dict:
+    with _lock:
+        return dict(_totals)
+
+
+def log_compaction_stats():
+    stats = compaction_stats()
+    if stats.get('articles'):
+        saved = stats['legacy_tokens'] - stats['output_tokens']
+        logger.info("正文压缩: 共 %d 篇，完整正文约 %d tokens，旧截取约 %d tokens，发送约 %d tokens，"
+                    "相对旧截取节省 %d (%.1f%%)",
+                    stats['articles'], stats['input_tokens'], stats['legacy_tokens'], stats['output_tokens'], saved,
+                    saved / stats['legacy_tokens'] * 100 if stats['legacy_tokens'] else 0.0)
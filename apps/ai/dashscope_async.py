@@ -0,0 +1,153 @@
+"""DashScope HTTP API 的原生异步客户端。
+
+dashscope SDK 的 Generation.call / MultiModalConversation.call 都是阻塞调用，机器人里用
+sync_to_async 包一层后，每个进行中的请求都要占住一个线程，并发上限取决于线程池而不是接口本身。
+这里直接请求 DashScope 的 HTTP 接口：
+- 复用 http_clients 里按事件循环缓存的 dashscope 连接池
+- 每次调用都有连接超时和整体超时（DASHSCOPE_CONNECT_TIMEOUT / DASHSCOPE_TIMEOUT），可按调用覆盖
+- 调用方的任务被取消时请求随之取消，CancelledError 原样向上抛出
+- astream 以 SSE 方式逐段返回增量文本，用于流式回复
+
+调度器等同步代码仍然使用 SDK（见 apps/ai/llm.py）。
+"""
+import asyncio
+import json
+import logging
+from http import HTTPStatus
+
+import httpx
+from django.conf import settings
+
+from apps.channel.http_clients import get_async_client
+
+logger = logging.getLogger(__name__)
+
+TEXT_GENERATION_PATH = '/services/aigc/text-generation/generation'
+MULTIMODAL_GENERATION_PATH = '/services/aigc/multimodal-generation/generation'
+
+
+class DashScopeError(Exception):
+    """流式调用时接口返回的业务错误。"""
+
+    def __init__(self, status_code, code, message):
+        super().__init__(f"{code} - {message}")
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+
+class DashScopeResponse:
+    """与 SDK 返回值字段一致：status_code / code / message / request_id / output / usage。"""
+
+    __slots__ = ('status_code', 'code', 'message', 'request_id', 'output', 'usage')
+
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.code = data.get('code', '')
+        self.message = data.get('message', '')
+        self.request_id = data.get('request_id', '')
+        self.output = data.get('output') or {}
+        self.usage = data.get('usage') or {}
+
+    @property
+    def text(self) -> str:
+        """第一条候选回复的文本；多模态接口返回的 content 是 [{'text': ...}] 列表。"""
+        choices = self.output.get('choices') or []
+        if not choices:
+            return self.output.get('text') or ''
+        content = choices[0].get('message', {}).get('content', '')
+        if isinstance(content, list):
+            return ''.join(item.get('text', '') for item in content if isinstance(item, dict))
+        return content or ''
+
+
+def base_url() -> str:
+    return getattr(settings, 'DASHSCOPE_BASE_URL', 'https://dashscope.aliyuncs.com/api/v1').rstrip('/')
+
+
+def request_timeout(timeout: float | None = None) -> float:
+    return timeout if timeout is not None else getattr(settings, 'DASHSCOPE_TIMEOUT', 60.0)
+
+
+def _request(model, messages, multimodal, parameters):
+    path = MULTIMODAL_GENERATION_PATH if multimodal else TEXT_GENERATION_PATH
+    if not multimodal:
+        parameters.setdefault('result_format', 'message')
+    return base_url() + path, {'model': model, 'input': {'messages': messages}, 'parameters': parameters}
+
+
+def _timeouts(timeout):
+    total = request_timeout(timeout)
+    connect = min(getattr(settings, 'DASHSCOPE_CONNECT_TIMEOUT', 5.0), total)
+    return total, httpx.Timeout(total, connect=connect)
+
+
+async def acall(model: str, messages: list, multimodal: bool = False, timeout: float | None = None,
+                **parameters) -> DashScopeResponse:
+    """调用文本 / 多模态生成接口。
+
+    超过整体超时抛出 TimeoutError，网络错误抛出 httpx.HTTPError；接口返回的业务错误
+    不抛异常，通过 status_code / code / message 判断。
+    """
+    total, http_timeout = _timeouts(timeout)
+    url, body = _request(model, messages, multimodal, parameters)
+
+    client = get_async_client('dashscope')
+    # httpx 的超时只限制单次读写，整体耗时由 wait_for 兜底
+    response = await asyncio.wait_for(
+        client.post(
+            url,
+            headers={'Authorization': f'Bearer {settings.DASHSCOPE_API_KEY}'},
+            json=body,
+            timeout=http_timeout,
+        ),
+        timeout=total,
+    )
+
+    try:
+        data = response.json()
+    except ValueError:
+        data = {'code': str(response.status_code), 'message': response.text[:200]}
+    if response.status_code != HTTPStatus.OK and not data.get('code'):
+        data['code'] = str(response.status_code)
+    return DashScopeResponse(response.status_code, data)
+
+
+async def astream(model: str, messages: list, multimodal: bool = False, timeout: float | None = None,
+                  **parameters):
+    """以 SSE 方式调用生成接口，逐段产出新增的文本（incremental_output）。
+
+    整体耗时超过超时时间抛出 TimeoutError，接口返回错误时抛出 DashScopeError。
+    """
+    total, http_timeout = _timeouts(timeout)
+    parameters.setdefault('incremental_output', True)
+    url, body = _request(model, messages, multimodal, parameters)
+    deadline = asyncio.get_running_loop().time() + total
+
+    client = get_async_client('dashscope')
+    headers = {
+        'Authorization': f'Bearer {settings.DASHSCOPE_API_KEY}',
+        'Accept': 'text/event-stream',
+        'X-DashScope-SSE': 'enable',
+    }
+    async with client.stream('POST', url, headers=headers, json=body, timeout=http_timeout) as response:
+        if response.status_code != HTTPStatus.OK:
+            await response.aread()
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            raise DashScopeError(response.status_code, data.get('code') or str(response.status_code),
+                                 data.get('message') or response.text[:200])
+
+        async for line in response.aiter_lines():
+            if asyncio.get_running_loop().time() > deadline:
+                raise TimeoutError(f"DashScope 流式调用超过 {total} 秒")
+            if not line.startswith('data:'):
+                continue
+            data = json.loads(line[5:])
+            if data.get('code'):
+                raise DashScopeError(response.status_code, data['code'], data.get('message', ''))
+            chunk = DashScopeResponse(HTTPStatus.OK, data).text
+            if chunk:
+                yield chunk
@@ -1,14 +1,14 @@
-import json
 import logging
 from datetime import datetime
-from http import HTTPStatus
 
-import dashscope
-from dashscope import Generation
 from django.conf import settings
 
 from django.utils import timezone
 
+from .images import amodel_images, model_images
+from .llm import acomplete_route, complete_route, parse_json
+from .routing import select
+
 logger = logging.getLogger(__name__)
 
 EXTRACT_PROMPT = (
@@ -34,95 +34,136 @@ EXTRACT_PROMPT = (
 )
 
 
-def extract_task(content: str, image_urls: list = None, sender_name: str = None) -> dict:
-    default = {'title': content[:100], 'description': '', 'priority': 2, 'task_type': '\u5176\u4ed6', 'due_date': None}
+# \u56fe\u7247\u6d88\u606f\u7684\u4efb\u52a1\u63d0\u53d6\u65b9\u5f0f\uff08settings.AI_IMAGE_TASK_MODE\uff09\uff1a
+# - reuse: \u5148\u9010\u5f20\u8bc6\u522b\u56fe\u7247\uff0c\u63d0\u53d6\u4efb\u52a1\u65f6\u53ea\u628a\u8bc6\u522b\u6587\u5b57\u4ea4\u7ed9\u6587\u672c\u6a21\u578b\uff0c\u56fe\u7247\u53ea\u53d1\u9001\u4e00\u6b21
+# - multimodal: \u5148\u8bc6\u522b\u56fe\u7247\uff0c\u63d0\u53d6\u4efb\u52a1\u65f6\u518d\u628a\u56fe\u7247\u548c\u8bc6\u522b\u6587\u5b57\u4e00\u8d77\u53d1\u7ed9\u591a\u6a21\u6001\u6a21\u578b\uff08\u65e7\u884c\u4e3a\uff09
+# - merged: \u8df3\u8fc7\u5355\u72ec\u7684\u8bc6\u522b\uff0c\u4e00\u6b21\u591a\u6a21\u6001\u8c03\u7528\u76f4\u63a5\u4ece\u56fe\u7247\u4e2d\u63d0\u53d6\u4efb\u52a1
+IMAGE_TASK_MODES = ('reuse', 'multimodal', 'merged')
+
+
+def image_task_mode() -> str:
+    mode = getattr(settings, 'AI_IMAGE_TASK_MODE', 'reuse')
+    if mode not in IMAGE_TASK_MODES:
+        logger.warning("\u672a\u77e5\u7684 AI_IMAGE_TASK_MODE: %s\uff0c\u4f7f\u7528 reuse", mode)
+        return 'reuse'
+    return mode
+
+
+def task_image_urls(image_urls: list = None, mode: str = None) -> list | None:
+    """\u8fd4\u56de\u63d0\u53d6\u4efb\u52a1\u65f6\u9700\u8981\u9644\u5e26\u7684\u56fe\u7247\uff1breuse \u6a21\u5f0f\u4e0b\u56fe\u7247\u5df2\u8bc6\u522b\u4e3a\u6587\u5b57\uff0c\u4e0d\u518d\u91cd\u590d\u53d1\u9001\u3002"""
+    if not image_urls:
+        return None
+    mode = mode or image_task_mode()
+    return image_urls if mode in ('multimodal', 'merged') else None
+
+
+def _task_request(content: str, images: list | None, sender_name: str | None, recognized_images: int = 0):
+    """\u7ec4\u88c5\u4efb\u52a1\u63d0\u53d6\u8bf7\u6c42\uff0c\u8fd4\u56de (\u8def\u7531, messages, \u662f\u5426\u591a\u6a21\u6001)\u3002images \u4e3a\u9884\u5904\u7406\u540e\u7684\u56fe\u7247\u8f93\u5165\u3002"""
+    current_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    prompt_context = ""
+    if sender_name:
+        prompt_context = f"\n\u5f53\u524d\u8bf7\u6c42\u63d0\u53d6\u4efb\u52a1\u7684\u7528\u6237\u662f\uff1a\u3010{sender_name}\u3011\u3002\n" + \
+                         "\u8bf7\u6ce8\u610f\uff1a\n" + \
+                         "1. \u5982\u679c\u6d88\u606f\u4e2d\u5305\u542b\u591a\u4e2a\u4efb\u52a1\uff0c\u8bf7\u53ea\u63d0\u53d6\u5206\u914d\u7ed9\u8be5\u7528\u6237\uff08\u6216\u8005\u6d89\u53ca\u5168\u516c\u53f8/\u5168\u90e8\u95e8\uff09\u7684\u4efb\u52a1\uff0c\u76f4\u63a5\u5ffd\u7565\u660e\u786e\u5206\u914d\u7ed9\u5176\u4ed6\u4eba\u7684\u5177\u4f53\u4efb\u52a1\u3002\n" + \
+                         "2. \u4e0d\u8981\u628a\u4efb\u52a1\u62c6\u5f97\u592a\u7ec6\uff0c\u5c3d\u91cf\u4fdd\u6301\u4efb\u52a1\u7684\u5b8c\u6574\u6027\u548c\u8fde\u8d2f\u6027\u3002"
+
+    prompt = EXTRACT_PROMPT.format(current_time=current_time_str, content=content) + prompt_context
+
+    route = select('extract_task', chars=len(content or ''), images=len(images or []), recognized=recognized_images)
+    if images:
+        model = route.model
+        # qwen-vl \u6a21\u578b\u8981\u6c42 content \u662f\u4e00\u4e2a\u6570\u7ec4\u683c\u5f0f
+        content_list = [{'image': image} for image in images]
+        content_list.append({'text': prompt})
+        logger.info(f"\u4f7f\u7528\u591a\u6a21\u6001\u5927\u6a21\u578b {model} \u8fdb\u884c\u89e3\u6790\uff0c\u5305\u542b {len(images)} \u5f20\u56fe\u7247")
+        return route, [{'role': 'user', 'content': content_list}], True
+
+    return route, [{'role': 'user', 'content': prompt}], False
+
+
+def _priority(value) -> int:
+    try:
+        priority = int(value)
+    except (TypeError, ValueError):
+        return 2
+    return priority if 1 <= priority <= 4 else 2
+
+
+def _parse_tasks(text: str, content: str, default: dict):
+    """\u628a\u6a21\u578b\u8f93\u51fa\u89e3\u6790\u6210\u4efb\u52a1\u5217\u8868\uff1bJSON \u65e0\u6cd5\u4fee\u590d\u6216\u7ed3\u6784\u4e0d\u5bf9\u65f6\u8fd4\u56de default\uff0c\u7a7a\u5217\u8868\u8868\u793a\u6ca1\u6709\u76f8\u5173\u4efb\u52a1\u3002"""
+    data = parse_json(text)
+    if not isinstance(data, (dict, list)):
+        logger.error("\u4efb\u52a1\u63d0\u53d6\u7ed3\u679c\u4e0d\u662f\u5408\u6cd5\u7684 JSON: %s", text[:200])
+        return default
+    logger.info(f"\u4efb\u52a1\u63d0\u53d6\u7ed3\u679c: {data}")
+
+    # \u7edf\u4e00\u5904\u7406\u6210\u5217\u8868\uff08\u517c\u5bb9\u6a21\u578b\u5076\u5c14\u8fd4\u56de\u5355\u4e2a\u5bf9\u8c61\u7684\u60c5\u51b5\uff09\uff0c\u8df3\u8fc7\u4e0d\u662f\u5bf9\u8c61\u7684\u5143\u7d20
+    items = data if isinstance(data, list) else [data]
+    tasks = [item for item in items if isinstance(item, dict)]
+    if items and not tasks:
+        logger.error("\u4efb\u52a1\u63d0\u53d6\u7ed3\u679c\u4e2d\u6ca1\u6709\u4efb\u52a1\u5bf9\u8c61: %s", text[:200])
+        return default
+
+    results = []
+    for item in tasks:
+        result = {
+            'title': str(item.get('title') or content[:100])[:200],
+            'description': str(item.get('description') or ''),
+            'priority': _priority(item.get('priority')),
+            'task_type': str(item.get('task_type') or '\u5176\u4ed6')[:50],
+            'due_date': None,
+        }
+
+        if item.get('due_date'):
+            try:
+                dt = datetime.fromisoformat(str(item['due_date']))
+                if timezone.is_naive(dt):
+                    dt = timezone.make_aware(dt)
+                result['due_date'] = dt
+            except (ValueError, TypeError):
+                pass
+        results.append(result)
+
+    return results
+
+
+def _default_task(content: str) -> dict:
+    return {'title': content[:100], 'description': '', 'priority': 2, 'task_type': '\u5176\u4ed6', 'due_date': None}
+
+
+def extract_task(content: str, image_urls: list = None, sender_name: str = None, model_inputs: list = None,
+                 recognized_images: int = 0) -> dict:
+    """\u63d0\u53d6\u4efb\u52a1\uff1bmodel_inputs \u4e3a\u8bc6\u522b\u9636\u6bb5\u5df2\u7ecf\u9884\u5904\u7406\u597d\u7684\u56fe\u7247\u8f93\u5165\uff0c\u63d0\u4f9b\u65f6\u4e0d\u518d\u91cd\u65b0\u4e0b\u8f7d image_urls\u3002
+
+    recognized_images \u4e3a\u8bc6\u522b\u7ed3\u679c\u5df2\u62fc\u8fdb content \u7684\u56fe\u7247\u6570\uff08reuse \u6a21\u5f0f\uff09\uff0c\u7528\u4e8e\u9009\u62e9\u6a21\u578b\u6863\u4f4d\u3002
+    """
+    default = _default_task(content)
 
     if not settings.DASHSCOPE_API_KEY:
         logger.warning("DASHSCOPE_API_KEY \u672a\u914d\u7f6e\uff0c\u4f7f\u7528\u6d88\u606f\u5185\u5bb9\u4f5c\u4e3a\u4efb\u52a1\u6807\u9898")
         return default
 
-    try:
-        current_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        prompt_context = ""
-        if sender_name:
-            prompt_context = f"\n\u5f53\u524d\u8bf7\u6c42\u63d0\u53d6\u4efb\u52a1\u7684\u7528\u6237\u662f\uff1a\u3010{sender_name}\u3011\u3002\n" + \
-                             "\u8bf7\u6ce8\u610f\uff1a\n" + \
-                             "1. \u5982\u679c\u6d88\u606f\u4e2d\u5305\u542b\u591a\u4e2a\u4efb\u52a1\uff0c\u8bf7\u53ea\u63d0\u53d6\u5206\u914d\u7ed9\u8be5\u7528\u6237\uff08\u6216\u8005\u6d89\u53ca\u5168\u516c\u53f8/\u5168\u90e8\u95e8\uff09\u7684\u4efb\u52a1\uff0c\u76f4\u63a5\u5ffd\u7565\u660e\u786e\u5206\u914d\u7ed9\u5176\u4ed6\u4eba\u7684\u5177\u4f53\u4efb\u52a1\u3002\n" + \
-                             "2. \u4e0d\u8981\u628a\u4efb\u52a1\u62c6\u5f97\u592a\u7ec6\uff0c\u5c3d\u91cf\u4fdd\u6301\u4efb\u52a1\u7684\u5b8c\u6574\u6027\u548c\u8fde\u8d2f\u6027\u3002"
-
-        prompt = EXTRACT_PROMPT.format(current_time=current_time_str, content=content) + prompt_context
-
-        dashscope.api_key = settings.DASHSCOPE_API_KEY
-
-        # \u7ec4\u88c5 messages \u8f7d\u8377
-        if image_urls:
-            model = 'qwen-vl-max'
-            # qwen-vl \u6a21\u578b\u8981\u6c42 content \u662f\u4e00\u4e2a\u6570\u7ec4\u683c\u5f0f
-            content_list = []
-            for url in image_urls:
-                content_list.append({'image': url})
-            content_list.append({'text': prompt})
-
-            messages = [
-                {
-                    'role': 'user',
-                    'content': content_list
-                }
-            ]
-            logger.info(f"\u4f7f\u7528\u591a\u6a21\u6001\u5927\u6a21\u578b {model} \u8fdb\u884c\u89e3\u6790\uff0c\u5305\u542b {len(image_urls)} \u5f20\u56fe\u7247")
-        else:
-            model = 'qwen-max'
-            messages = [{'role': 'user', 'content': prompt}]
-
-        response = dashscope.MultiModalConversation.call(model=model, messages=messages) if image_urls else Generation.call(model=model, messages=messages, result_format='message')
-
-        if response.status_code == HTTPStatus.OK:
-            if image_urls:
-                text = response.output.choices[0].message.content[0].get('text', '').strip()
-            else:
-                text = response.output.choices[0].message.content.strip()
-
-            # \u6e05\u7406 Qwen \u53ef\u80fd\u8fd4\u56de\u7684 Markdown \u4ee3\u7801\u5757
-            if text.startswith('```json'):
-                text = text[7:]
-            if text.startswith('```'):
-                text = text[3:]
-            if text.endswith('```'):
-                text = text[:-3]
-            text = text.strip()
-
-            data = json.loads(text)
-            logger.info(f"\u4efb\u52a1\u63d0\u53d6\u7ed3\u679c: {data}")
-
-            # \u7edf\u4e00\u5904\u7406\u6210\u5217\u8868\uff08\u517c\u5bb9\u6a21\u578b\u5076\u5c14\u8fd4\u56de\u5355\u4e2a\u5bf9\u8c61\u7684\u60c5\u51b5\uff09
-            items = data if isinstance(data, list) else [data]
-
-            results = []
-            for item in items:
-                result = {
-                    'title': item.get('title') or content[:100],
-                    'description': item.get('description') or '',
-                    'priority': item.get('priority') or 2,
-                    'task_type': item.get('task_type') or '\u5176\u4ed6',
-                    'due_date': None,
-                }
-
-                if item.get('due_date'):
-                    try:
-                        dt = datetime.fromisoformat(item['due_date'])
-                        if timezone.is_naive(dt):
-                            dt = timezone.make_aware(dt)
-                        result['due_date'] = dt
-                    except (ValueError, TypeError):
-                        pass
-                results.append(result)
-
-            return results
-        else:
-            logger.error("\u4efb\u52a1\u63d0\u53d6\u5931\u8d25: %s - %s", response.code, response.message)
-            return default
-
-    except Exception:
-        logger.exception("\u4efb\u52a1\u63d0\u53d6\u5f02\u5e38")
+    images = (model_inputs or model_images(image_urls)) if image_urls else None
+    route, messages, multimodal = _task_request(content, images, sender_name, recognized_images)
+    text = complete_route('\u4efb\u52a1\u63d0\u53d6', route, messages, multimodal=multimodal)
+    if text is None:
+        return default
+    return _parse_tasks(text, content, default)
+
+
+async def aextract_task(content: str, image_urls: list = None, sender_name: str = None,
+                        model_inputs: list = None, recognized_images: int = 0) -> dict:
+    """extract_task \u7684\u5f02\u6b65\u7248\u672c\uff1a\u56fe\u7247\u4e0b\u8f7d\u548c\u6a21\u578b\u8c03\u7528\u90fd\u76f4\u63a5 await\u3002"""
+    default = _default_task(content)
+
+    if not settings.DASHSCOPE_API_KEY:
+        logger.warning("DASHSCOPE_API_KEY \u672a\u914d\u7f6e\uff0c\u4f7f\u7528\u6d88\u606f\u5185\u5bb9\u4f5c\u4e3a\u4efb\u52a1\u6807\u9898")
+        return default
+
+    images = (model_inputs or await amodel_images(image_urls)) if image_urls else None
+    route, messages, multimodal = _task_request(content, images, sender_name, recognized_images)
+    text = await acomplete_route('\u4efb\u52a1\u63d0\u53d6', route, messages, multimodal=multimodal)
+    if text is None:
         return default
+    return _parse_tasks(text, content, default)
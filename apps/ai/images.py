@@ -0,0 +1,171 @@
+"""调用视觉模型前的本地图片预处理。
+
+手机截图动辄几 MB、几千像素高，直接按 URL 交给模型时上传和推理都很慢。这里：
+- 每张图片只下载一次
+- 按 AI_IMAGE_MAX_EDGE 等比缩小，按 AI_IMAGE_FORMAT 重新编码（默认 JPEG，文字截图为主时 WEBP / PNG 更小），
+  丢弃 EXIF 等元数据
+- 长截图（高宽比超过 AI_IMAGE_TILE_RATIO）按宽度缩放后切成若干块，避免整图被压缩到看不清文字
+- 结果以 base64 data URI 的形式内联发送
+
+Pillow 是可选依赖：未安装、关闭预处理或处理失败时，原样使用图片 URL。
+"""
+import asyncio
+import base64
+import io
+import logging
+
+from django.conf import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow 未安装时退回 URL
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# 切块时相邻两块重叠的像素，避免一行文字被切断
+TILE_OVERLAP = 32
+
+FORMAT_MIME = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'PNG': 'image/png',
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def preprocess_enabled() -> bool:
+    return Image is not None and _setting('AI_IMAGE_PREPROCESS', True)
+
+
+def download_image(url: str) -> bytes | None:
+    from apps.channel.http_clients import get_sync_client
+
+    try:
+        response = get_sync_client('default').get(url)
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        logger.warning("下载图片失败 %s: %s", url[:100], e)
+        return None
+
+
+async def adownload_image(url: str) -> bytes | None:
+    from apps.channel.http_clients import get_async_client
+
+    try:
+        response = await get_async_client('default').get(url)
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        logger.warning("下载图片失败 %s: %s", url[:100], e)
+        return None
+
+
+def image_format() -> str:
+    fmt = str(_setting('AI_IMAGE_FORMAT', 'JPEG')).upper()
+    return fmt if fmt in FORMAT_MIME else 'JPEG'
+
+
+def _encode(img) -> bytes:
+    buffer = io.BytesIO()
+    # 重新编码时不传 exif / icc_profile，元数据随之丢弃
+    fmt = image_format()
+    if fmt == 'PNG':
+        img.save(buffer, format=fmt, optimize=True)
+    else:
+        img.save(buffer, format=fmt, quality=_setting('AI_IMAGE_QUALITY', 85))
+    return buffer.getvalue()
+
+
+def prepare_image(data: bytes) -> list[bytes]:
+    """缩放、重新编码图片；长截图切块。返回一张或多张图片的字节。"""
+    max_edge = _setting('AI_IMAGE_MAX_EDGE', 1600)
+    tile_ratio = _setting('AI_IMAGE_TILE_RATIO', 3.0)
+    max_tiles = max(1, _setting('AI_IMAGE_MAX_TILES', 4))
+
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        width, height = img.size
+
+        if tile_ratio and height > width * tile_ratio:
+            # 长截图：先把宽度缩到上限以内，再按 tile_ratio 的高宽比切块
+            if width > max_edge:
+                height = round(height * max_edge / width)
+                width = max_edge
+                img = img.resize((width, height), Image.LANCZOS)
+            tile_height = int(width * tile_ratio)
+            step = tile_height - TILE_OVERLAP
+            tops = list(range(0, max(height - TILE_OVERLAP, 1), step))
+            if len(tops) > max_tiles:
+                # 块数超限时改为均分，保证覆盖整张图
+                tile_height = -(-height // max_tiles) + TILE_OVERLAP
+                tops = [min(i * (tile_height - TILE_OVERLAP), height - tile_height) for i in range(max_tiles)]
+            tiles = []
+            for top in tops:
+                tile = img.crop((0, top, width, min(top + tile_height, height)))
+                # 极长的图均分后单块仍可能超过上限，再等比缩小
+                tile.thumbnail((max_edge, max_edge), Image.LANCZOS)
+                tiles.append(_encode(tile))
+            return tiles
+
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        return [_encode(img)]
+
+
+def to_data_uri(data: bytes) -> str:
+    return f'data:{FORMAT_MIME[image_format()]};base64,' + base64.b64encode(data).decode('ascii')
+
+
+def image_inputs(url: str, data: bytes | None = None) -> dict:
+    """把一张图片转换成模型输入。
+
+    返回 {'inputs': [...], 'original_bytes', 'sent_bytes'}；inputs 是 data URI 列表
+    （长截图会有多块），无法预处理时为 [url]。
+    """
+    result = {'inputs': [url], 'original_bytes': len(data) if data else 0, 'sent_bytes': 0}
+    if not preprocess_enabled():
+        return result
+
+    if data is None:
+        data = download_image(url)
+        if data is None:
+            return result
+        result['original_bytes'] = len(data)
+
+    try:
+        tiles = prepare_image(data)
+    except Exception as e:
+        logger.warning("图片预处理失败，使用原图 URL %s: %s", url[:100], e)
+        return result
+
+    result['inputs'] = [to_data_uri(tile) for tile in tiles]
+    result['sent_bytes'] = sum(len(tile) for tile in tiles)
+    logger.info("图片预处理: %d KB -> %d KB (%d 块)", len(data) // 1024, result['sent_bytes'] // 1024, len(tiles))
+    return result
+
+
+def model_images(image_urls: list[str]) -> list[str]:
+    """把一组图片 URL 转换成多模态模型的 image 输入（预处理后展开所有切块）。"""
+    inputs = []
+    for url in image_urls:
+        inputs.extend(image_inputs(url)['inputs'])
+    return inputs
+
+
+async def amodel_images(image_urls: list[str]) -> list[str]:
+    """model_images 的异步版本：并发下载，缩放 / 编码放到线程里执行。"""
+    if not preprocess_enabled():
+        return list(image_urls)
+
+    blobs = await asyncio.gather(*(adownload_image(url) for url in image_urls))
+    results = await asyncio.gather(*(
+        asyncio.to_thread(image_inputs, url, data) if data else asyncio.sleep(0, {'inputs': [url]})
+        for url, data in zip(image_urls, blobs)
+    ))
+    return [item for result in results for item in result['inputs']]
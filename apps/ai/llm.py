@@ -0,0 +1,234 @@
+"""大模型调用的公共封装。
+
+complete 走 dashscope SDK（同步，供调度器和管理命令使用），acomplete 走原生异步客户端
+（供机器人直接 await）。两者都只返回回复文本，失败时记录日志并返回 None，由调用方使用兜底结果。
+astream_complete 逐段产出增量文本，失败时记录日志并抛出 StreamError。
+*_route 版本按 routing.select 选出的路由依次尝试主模型和降级模型，并记录每个路由的耗时和错误。
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from http import HTTPStatus
+
+import dashscope
+import httpx
+import requests
+from dashscope import Generation, MultiModalConversation
+from django.conf import settings
+
+from .dashscope_async import DashScopeError, DashScopeResponse, acall, astream, base_url
+from .routing import Route, record
+
+logger = logging.getLogger(__name__)
+
+
+def response_text(response) -> str:
+    """取 SDK 返回值的第一条回复文本（兼容多模态接口的列表格式）。"""
+    content = response.output.choices[0].message.content
+    if isinstance(content, list):
+        return ''.join(item.get('text', '') for item in content if isinstance(item, dict))
+    return content or ''
+
+
+def strip_code_fence(text: str) -> str:
+    """去除模型可能包裹的 markdown 代码块（```json ... ```）。"""
+    text = text.strip()
+    if text.startswith('```json'):
+        text = text[7:]
+    if text.startswith('```'):
+        text = text[3:]
+    if text.endswith('```'):
+        text = text[:-3]
+    return text.strip()
+
+
+TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+
+
+def parse_json(text: str):
+    """尽量把模型输出解析成 JSON，无法修复时返回 None。
+
+    依次尝试：去掉代码块、允许字符串里出现换行等控制字符、只保留第一个 {…} / […] 之间的内容、
+    去掉多余的结尾逗号、补齐被截断的结尾括号。
+    """
+    text = strip_code_fence(text or '')
+    candidates = [text]
+
+    starts = [pos for pos in (text.find('{'), text.find('[')) if pos >= 0]
+    if starts:
+        start = min(starts)
+        end = max(text.rfind('}'), text.rfind(']'))
+        body = text[start:end + 1] if end > start else text[start:]
+        fixed = TRAILING_COMMA_RE.sub(r'\1', body)
+        candidates += [body, fixed]
+        # 输出被截断时补齐未闭合的字符串和括号
+        stack, in_string = _unclosed(fixed)
+        if stack:
+            closers = ''.join('}' if ch == '{' else ']' for ch in reversed(stack))
+            candidates.append(fixed + ('"' if in_string else '') + closers)
+
+    for candidate in candidates:
+        try:
+            return json.loads(candidate, strict=False)
+        except (json.JSONDecodeError, TypeError):
+            continue
+    return None
+
+
+def _unclosed(text: str) -> tuple[list, bool]:
+    """返回 (字符串外未闭合的 { / [，按出现顺序；结尾是否停在未闭合的字符串里)。"""
+    stack = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append(ch)
+        elif ch in '}]' and stack:
+            stack.pop()
+    return stack, in_string
+
+
+def _complete(purpose, model, messages, multimodal) -> tuple[str | None, str]:
+    """返回 (回复文本, 状态)，状态为 ok / error / timeout。"""
+    try:
+        dashscope.api_key = settings.DASHSCOPE_API_KEY
+        dashscope.base_http_api_url = base_url()
+        if multimodal:
+            response = MultiModalConversation.call(model=model, messages=messages)
+        else:
+            response = Generation.call(model=model, messages=messages, result_format='message')
+    except requests.Timeout:
+        logger.error("%s超时: model=%s", purpose, model)
+        return None, 'timeout'
+    except Exception:
+        logger.exception("%s异常", purpose)
+        return None, 'error'
+
+    if response.status_code == HTTPStatus.OK:
+        return response_text(response).strip(), 'ok'
+    logger.error("%s失败: %s - %s", purpose, response.code, response.message)
+    return None, 'error'
+
+
+async def _acomplete(purpose, model, messages, multimodal, timeout) -> tuple[str | None, str]:
+    try:
+        response: DashScopeResponse = await acall(model, messages, multimodal=multimodal, timeout=timeout)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        logger.error("%s超时: model=%s", purpose, model)
+        return None, 'timeout'
+    except Exception:
+        logger.exception("%s异常", purpose)
+        return None, 'error'
+
+    if response.status_code == HTTPStatus.OK:
+        return response.text.strip(), 'ok'
+    logger.error("%s失败: %s - %s", purpose, response.code, response.message)
+    return None, 'error'
+
+
+def complete(purpose: str, model: str, messages: list, multimodal: bool = False) -> str | None:
+    """同步调用模型，返回回复文本；失败时返回 None。purpose 用于日志（如 "消息分类"）。"""
+    return _complete(purpose, model, messages, multimodal)[0]
+
+
+async def acomplete(purpose: str, model: str, messages: list, multimodal: bool = False,
+                    timeout: float | None = None) -> str | None:
+    """异步调用模型，返回回复文本；失败或超时返回 None，任务取消时照常抛出 CancelledError。"""
+    return (await _acomplete(purpose, model, messages, multimodal, timeout))[0]
+
+
+def complete_route_with_model(purpose: str, route: Route, messages: list,
+                              multimodal: bool = False) -> tuple[str | None, str | None]:
+    """按路由依次尝试主模型和降级模型，返回 (第一个成功的回复, 给出回复的模型)；全部失败时为 (None, None)。"""
+    for index, model in enumerate(route.models):
+        if index:
+            logger.warning("%s: 改用降级模型 %s", purpose, model)
+        start = time.monotonic()
+        text, status = _complete(purpose, model, messages, multimodal)
+        record(route.task, model, time.monotonic() - start, status, fallback=index > 0)
+        if text is not None:
+            return text, model
+    return None, None
+
+
+def complete_route(purpose: str, route: Route, messages: list, multimodal: bool = False) -> str | None:
+    """按路由依次尝试主模型和降级模型，返回第一个成功的回复。"""
+    return complete_route_with_model(purpose, route, messages, multimodal)[0]
+
+
+async def acomplete_route_with_model(purpose: str, route: Route, messages: list,
+                                     multimodal: bool = False) -> tuple[str | None, str | None]:
+    """complete_route_with_model 的异步版本，规则里配置的 timeout 对每个模型单独生效。"""
+    for index, model in enumerate(route.models):
+        if index:
+            logger.warning("%s: 改用降级模型 %s", purpose, model)
+        start = time.monotonic()
+        text, status = await _acomplete(purpose, model, messages, multimodal, route.timeout)
+        record(route.task, model, time.monotonic() - start, status, fallback=index > 0)
+        if text is not None:
+            return text, model
+    return None, None
+
+
+async def acomplete_route(purpose: str, route: Route, messages: list, multimodal: bool = False) -> str | None:
+    """complete_route 的异步版本，规则里配置的 timeout 对每个模型单独生效。"""
+    return (await acomplete_route_with_model(purpose, route, messages, multimodal))[0]
+
+
+class StreamError(Exception):
+    """流式调用失败；status 为 error / timeout。"""
+
+    def __init__(self, status: str):
+        super().__init__(status)
+        self.status = status
+
+
+async def astream_complete(purpose: str, model: str, messages: list, timeout: float | None = None):
+    """流式调用模型，逐段产出增量文本；失败或超时时记录日志并抛出 StreamError。"""
+    try:
+        async for chunk in astream(model, messages, timeout=timeout):
+            yield chunk
+    except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+        logger.error("%s超时: model=%s", purpose, model)
+        raise StreamError('timeout') from e
+    except DashScopeError as e:
+        logger.error("%s失败: %s - %s", purpose, e.code, e.message)
+        raise StreamError('error') from e
+    except Exception as e:
+        logger.exception("%s异常", purpose)
+        raise StreamError('error') from e
+
+
+async def astream_route(purpose: str, route: Route, messages: list):
+    """按路由流式调用；一个字都没有返回就失败时换用降级模型，所有模型都失败时直接结束。
+
+    已经输出部分内容后失败不再切换模型，而是抛出 StreamError，调用方据此得知回复不完整。
+    """
+    for index, model in enumerate(route.models):
+        if index:
+            logger.warning("%s: 改用降级模型 %s", purpose, model)
+        start = time.monotonic()
+        produced = False
+        error = None
+        try:
+            async for chunk in astream_complete(purpose, model, messages, timeout=route.timeout):
+                produced = True
+                yield chunk
+        except StreamError as e:
+            error = e
+        status = error.status if error else ('ok' if produced else 'error')
+        record(route.task, model, time.monotonic() - start, status, fallback=index > 0)
+        if produced:
+            if error:
+                raise error
+            return
@@ -0,0 +1,159 @@
+"""基于历史标签训练的本地消息分类器。
+
+Message.ai_classification 里已经积累了大量由大模型给出的标签。train_message_classifier
+用字符 n-gram TF-IDF + 逻辑回归在 CPU 上训练一个小模型并保存到 AI_LOCAL_CLASSIFIER_PATH；
+这里在进程内只加载一次，单条打分在毫秒级。最高类别概率不低于 AI_LOCAL_CLASSIFIER_THRESHOLD
+时直接采用本地结果，否则仍调用大模型。
+
+scikit-learn / joblib 是可选依赖：未安装或模型文件不存在时本地分类自动关闭。
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import joblib
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+except ImportError:  # pragma: no cover - 未安装 scikit-learn 时关闭本地分类
+    joblib = None
+
+logger = logging.getLogger(__name__)
+
+LABELS = ('urgent', 'important', 'normal', 'ignore')
+# 只用大模型给出的标签训练。legacy 是 classification_source 字段上线前的历史标签（channel 0006 迁移标记），
+# 同样来自大模型；规则、本地模型和兜底分类的结果不参与训练
+TRAINING_SOURCES = ('llm', 'legacy')
+MENTION_RE = re.compile(r'@\S+\s*')
+# 过长的消息只取开头，和线上打分时保持一致
+MAX_CHARS = 2000
+
+_lock = threading.Lock()
+_model = None
+_loaded = False
+_counts = Counter()
+
+
+def available() -> bool:
+    return joblib is not None
+
+
+def model_path() -> Path:
+    return Path(getattr(settings, 'AI_LOCAL_CLASSIFIER_PATH', settings.BASE_DIR / 'data' / 'message_classifier.joblib'))
+
+
+def build_pipeline():
+    return Pipeline([
+        ('tfidf', TfidfVectorizer(
+            analyzer='char_wb', ngram_range=(1, 3), min_df=2, max_features=50000, sublinear_tf=True,
+        )),
+        ('clf', LogisticRegression(max_iter=1000, class_weight='balanced')),
+    ])
+
+
+def prepare_text(content: str) -> str:
+    return (content or '').strip()[:MAX_CHARS]
+
+
+def _legacy_input(content: str, message_type: str) -> str:
+    """没有保存 classification_input 的旧消息：尽量还原成线上分类时的输入。
+
+    图片消息的 content 是图片地址，分类时看到的识别结果没有保存，不参与训练；文本去掉 @ 提及。
+    """
+    if message_type == 'image':
+        return ''
+    return MENTION_RE.sub('', content or '')
+
+
+def training_data(since=None) -> tuple[list[str], list[str]]:
+    """读取大模型标注过的入站消息，返回 (分类输入文本列表, 标签列表)。"""
+    from apps.channel.models import Message
+
+    queryset = Message.objects.filter(
+        classification_source__in=TRAINING_SOURCES, direction='inbound', ai_classification__in=LABELS,
+    )
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+
+    texts, labels = [], []
+    rows = queryset.values_list('classification_input', 'content', 'message_type', 'ai_classification')
+    for classification_input, content, message_type, label in rows.iterator():
+        text = prepare_text(classification_input or _legacy_input(content, message_type))
+        if text:
+            texts.append(text)
+            labels.append(label)
+    return texts, labels
+
+
+def save_model(pipeline, path=None):
+    path = Path(path or model_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(pipeline, path)
+    reload()
+    return path
+
+
+def reload():
+    global _model, _loaded
+    with _lock:
+        _model = None
+        _loaded = False
+
+
+def get_model():
+    """加载一次模型；未安装依赖、未启用或模型文件不存在时返回 None。"""
+    global _model, _loaded
+    if _loaded:
+        return _model
+    with _lock:
+        if not _loaded:
+            path = model_path()
+            if available() and getattr(settings, 'AI_LOCAL_CLASSIFIER_ENABLED', True) and path.exists():
+                try:
+                    _model = joblib.load(path)
+                    logger.info("已加载本地消息分类器: %s", path)
+                except Exception:
+                    logger.exception("加载本地消息分类器失败: %s", path)
+            _loaded = True
+    return _model
+
+
+def predict(content: str) -> tuple[str, float] | None:
+    """返回 (分类, 概率)；模型不可用时返回 None。"""
+    model = get_model()
+    text = prepare_text(content)
+    if model is None or not text:
+        return None
+    proba = model.predict_proba([text])[0]
+    best = proba.argmax()
+    return str(model.classes_[best]), float(proba[best])
+
+
+def local_classify(content: str) -> str | None:
+    """概率达到阈值时返回本地分类结果，否则返回 None（由调用方继续调用大模型）。"""
+    result = predict(content)
+    if result is None:
+        return None
+
+    label, probability = result
+    threshold = getattr(settings, 'AI_LOCAL_CLASSIFIER_THRESHOLD', 0.8)
+    with _lock:
+        _counts['accepted' if probability >= threshold else 'below_threshold'] += 1
+    if probability >= threshold:
+        logger.info("本地分类器命中 -> %s (概率 %.2f)", label, probability)
+        return label
+    return None
+
+
+def log_local_stats():
+    with _lock:
+        counts = dict(_counts)
+    total = sum(counts.values())
+    if total:
+        logger.info("本地分类器: 共打分 %d 条，%d 条跳过大模型 (%.1f%%)",
+                    total, counts.get('accepted', 0), counts.get('accepted', 0) / total * 100)
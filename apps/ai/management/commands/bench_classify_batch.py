@@ -0,0 +1,93 @@
+import asyncio
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.ai import local_classifier
+from apps.ai.batching import MicroBatcher
+from apps.ai.classifier import _aclassify_batch, _aclassify_one
+from apps.ai.routing import route_stats
+from apps.channel.http_clients import aclose_clients
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = '模拟突发的消息分类请求，对比逐条调用和微批处理的吞吐、延迟和调用次数（不走缓存）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='消息文件，每行一条；默认使用大模型已分类的历史消息')
+        parser.add_argument('--count', type=int, default=50, help='同时到达的消息条数')
+        parser.add_argument('--window', type=float, default=None, help='批处理窗口（秒），默认 AI_CLASSIFY_BATCH_WINDOW')
+        parser.add_argument('--max-size', type=int, default=None, help='每批最多条数，默认 AI_CLASSIFY_BATCH_MAX_SIZE')
+
+    def handle(self, *args, **options):
+        if not settings.DASHSCOPE_API_KEY:
+            self.stderr.write(self.style.ERROR('请在 .env 中配置 DASHSCOPE_API_KEY'))
+            return
+
+        if options['file']:
+            texts = [line.strip() for line in Path(options['file']).read_text(encoding='utf-8').splitlines()]
+            labels = [None] * len(texts)
+        else:
+            texts, labels = local_classifier.training_data()
+        samples = [(text, label) for text, label in zip(texts, labels) if text][:options['count']]
+        if not samples:
+            self.stderr.write(self.style.ERROR('没有可用的消息'))
+            return
+
+        window = options['window'] if options['window'] is not None else settings.AI_CLASSIFY_BATCH_WINDOW
+        max_size = options['max_size'] or settings.AI_CLASSIFY_BATCH_MAX_SIZE
+        self.stdout.write(f"消息 {len(samples)} 条同时到达，批处理窗口 {window}s，每批最多 {max_size} 条")
+
+        single, batched = asyncio.run(self._compare([text for text, _ in samples], window, max_size))
+        self._report('逐条调用', single, samples)
+        self._report('微批处理', batched, samples)
+
+        agree = sum(a == b for a, b in zip(single['labels'], batched['labels']))
+        self.stdout.write(f"两种方式结果一致: {agree}/{len(samples)}")
+
+    async def _compare(self, contents, window, max_size):
+        try:
+            single = await self._burst(contents, _aclassify_one)
+            batcher = MicroBatcher('bench', _aclassify_batch, window=window, max_size=max_size)
+            batched = await self._burst(contents, batcher.submit)
+            return single, batched
+        finally:
+            await aclose_clients()
+
+    async def _burst(self, contents, classify):
+        """所有请求同时发出，返回各自的结果、耗时和总耗时。"""
+        before = sum(s['calls'] for s in route_stats().values())
+
+        async def timed(content):
+            start = time.perf_counter()
+            label = await classify(content)
+            return label, time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(timed(content) for content in contents))
+        return {
+            'labels': [label for label, _ in results],
+            'latencies': [seconds for _, seconds in results],
+            'elapsed': time.perf_counter() - start,
+            'calls': sum(s['calls'] for s in route_stats().values()) - before,
+        }
+
+    def _report(self, name, result, samples):
+        latencies = result['latencies']
+        failed = sum(label is None for label in result['labels'])
+        self.stdout.write(
+            f"{name}: 总耗时 {result['elapsed']:.2f} 秒，吞吐 {len(samples) / result['elapsed']:.1f} 条/秒，"
+            f"模型调用 {result['calls']} 次，单条 P50 {_percentile(latencies, 0.5) * 1000:.0f} ms / "
+            f"P95 {_percentile(latencies, 0.95) * 1000:.0f} ms，失败 {failed} 条"
+        )
+        labelled = [(label, expected) for label, (_, expected) in zip(result['labels'], samples) if expected]
+        if labelled:
+            agree = sum(label == expected for label, expected in labelled)
+            self.stdout.write(f"  与历史分类一致: {agree}/{len(labelled)} ({agree / len(labelled):.1%})")
@@ -0,0 +1,36 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.ai.compaction import compact
+from apps.channel.article_extractor import extract_article
+
+FIXTURE_DIR = Path(settings.BASE_DIR) / 'apps' / 'channel' / 'bench_fixtures'
+
+
+class Command(BaseCommand):
+    help = '对比正文压缩前后发送给文章分析的 token 数（使用 bench_fixtures 或指定的 HTML 文件）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='HTML 文件路径，默认使用 bench_fixtures 下的全部样例')
+        parser.add_argument('--budget', type=int, default=None, help='token 预算，默认 AI_ARTICLE_TOKEN_BUDGET')
+
+    def handle(self, *args, **options):
+        files = [Path(f) for f in options['files']] or sorted(FIXTURE_DIR.glob('*.html'))
+        budget = options['budget'] or getattr(settings, 'AI_ARTICLE_TOKEN_BUDGET', 2000)
+        self.stdout.write(f"token 预算: {budget}")
+
+        for path in files:
+            content = extract_article(path.read_text(encoding='utf-8'), str(path))['content']
+
+            start = time.perf_counter()
+            result = compact(content, budget=budget)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            self.stdout.write(
+                f"{path.name}: 正文 {len(content)} 字 / {result['input_tokens']} tokens，"
+                f"旧截取 {result['legacy_tokens']} tokens，压缩后 {result['output_tokens']} tokens "
+                f"(相对旧截取节省 {result['saved_tokens']})，耗时 {elapsed_ms:.2f} ms"
+            )
@@ -0,0 +1,67 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.ai import images
+from apps.ai.recognizer import _recognize
+
+
+class Command(BaseCommand):
+    help = '对比图片预处理前后发送给视觉模型的字节数和识别耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', action='append', default=[], help='图片 URL，可重复指定')
+        parser.add_argument('--file', action='append', default=[], help='本地图片路径，可重复指定（只统计字节数）')
+        parser.add_argument('--call-model', action='store_true', help='同时调用模型，对比原图 URL 与预处理后的识别耗时')
+
+    def handle(self, *args, **options):
+        if not images.preprocess_enabled():
+            self.stderr.write(self.style.ERROR('Pillow 未安装或 AI_IMAGE_PREPROCESS 已关闭'))
+            return
+        if options['call_model'] and not settings.DASHSCOPE_API_KEY:
+            self.stderr.write(self.style.ERROR('请在 .env 中配置 DASHSCOPE_API_KEY'))
+            return
+
+        samples = [(url, url, None) for url in options['image']]
+        samples += [(Path(path).name, None, Path(path).read_bytes()) for path in options['file']]
+        if not samples:
+            self.stderr.write(self.style.ERROR('请通过 --image 或 --file 指定图片'))
+            return
+
+        header = f"{'图片':<32}{'原图KB':>8}{'发送KB':>8}{'切块':>6}{'预处理ms':>10}"
+        if options['call_model']:
+            header += f"{'原图识别s':>10}{'预处理识别s':>12}"
+        self.stdout.write(header)
+
+        totals = [0, 0]
+        for name, url, data in samples:
+            if data is None:
+                data = images.download_image(url)
+                if data is None:
+                    self.stdout.write(f"{name[:30]:<32}  下载失败")
+                    continue
+
+            start = time.perf_counter()
+            prepared = images.image_inputs(url or name, data)
+            prep_ms = (time.perf_counter() - start) * 1000
+            totals[0] += prepared['original_bytes']
+            totals[1] += prepared['sent_bytes']
+            row = (f"{name[:30]:<32}{prepared['original_bytes'] / 1024:>8.0f}{prepared['sent_bytes'] / 1024:>8.0f}"
+                   f"{len(prepared['inputs']):>6}{prep_ms:>10.1f}")
+
+            if options['call_model'] and url:
+                start = time.perf_counter()
+                _recognize(url)
+                original_s = time.perf_counter() - start
+                start = time.perf_counter()
+                _recognize(url, data)
+                prepared_s = time.perf_counter() - start
+                row += f"{original_s:>10.2f}{prepared_s:>12.2f}"
+            self.stdout.write(row)
+
+        if totals[0]:
+            self.stdout.write(self.style.SUCCESS(
+                f"合计: {totals[0] / 1024:.0f} KB -> {totals[1] / 1024:.0f} KB（{totals[1] / totals[0]:.0%}）"
+            ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from apps.ai.cache import evict
+from apps.ai.models import LLMCacheEntry
+
+
+class Command(BaseCommand):
+    help = '查看大模型结果缓存的条数和累计命中次数（即节省的模型调用次数）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evict', action='store_true', help='删除过期条目并按容量上限淘汰')
+
+    def handle(self, *args, **options):
+        if options['evict']:
+            self.stdout.write(f"已淘汰 {evict()} 条记录")
+
+        now = timezone.now()
+        rows = (
+            LLMCacheEntry.objects.values('namespace')
+            .annotate(entries=Count('id'), hits=Sum('hits'))
+            .order_by('namespace')
+        )
+        self.stdout.write(f"{'调用方':<20}{'条数':>8}{'过期':>8}{'命中':>8}")
+        total_hits = 0
+        for row in rows:
+            expired = LLMCacheEntry.objects.filter(namespace=row['namespace'], expires_at__lte=now).count()
+            hits = row['hits'] or 0
+            total_hits += hits
+            self.stdout.write(f"{row['namespace']:<20}{row['entries']:>8}{expired:>8}{hits:>8}")
+        self.stdout.write("注：命中次数只统计数据库命中，进程内 LRU 命中见机器人定时输出的运行统计日志。")
+        self.stdout.write(self.style.SUCCESS(f"累计节省模型调用 {total_hits} 次"))
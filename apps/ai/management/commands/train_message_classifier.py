@@ -0,0 +1,83 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.ai import local_classifier
+
+
+class Command(BaseCommand):
+    help = '用历史消息的大模型分类标签训练本地分类器，并输出与大模型标签的一致率'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-samples', type=int, default=200, help='少于该条数时不训练')
+        parser.add_argument('--test-size', type=float, default=0.2, help='留出评估集的比例')
+        parser.add_argument('--days', type=int, default=0, help='只使用最近 N 天的消息（0 表示全部）')
+        parser.add_argument('--output', default='', help='模型保存路径，默认 AI_LOCAL_CLASSIFIER_PATH')
+        parser.add_argument('--eval-only', action='store_true', help='不训练，只评估已保存的模型')
+
+    def handle(self, *args, **options):
+        if not local_classifier.available():
+            self.stderr.write(self.style.ERROR('请先安装 scikit-learn：pip install scikit-learn'))
+            return
+
+        since = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+        texts, labels = local_classifier.training_data(since=since)
+        self.stdout.write(f"大模型标注的消息: {len(texts)} 条")
+
+        if options['eval_only']:
+            model = local_classifier.get_model()
+            if model is None:
+                self.stderr.write(self.style.ERROR(f'模型不存在: {local_classifier.model_path()}'))
+                return
+            if not texts:
+                self.stderr.write(self.style.ERROR('没有可用于评估的消息'))
+                return
+            self._report(model, texts, labels)
+            return
+
+        if len(texts) < options['min_samples'] or len(set(labels)) < 2:
+            self.stderr.write(self.style.ERROR(f"样本不足（至少 {options['min_samples']} 条且包含两种以上分类），跳过训练"))
+            return
+
+        from sklearn.model_selection import train_test_split
+
+        stratify = labels if min(labels.count(label) for label in set(labels)) >= 2 else None
+        train_x, test_x, train_y, test_y = train_test_split(
+            texts, labels, test_size=options['test_size'], random_state=42, stratify=stratify,
+        )
+
+        start = time.perf_counter()
+        model = local_classifier.build_pipeline().fit(train_x, train_y)
+        self.stdout.write(f"训练集 {len(train_x)} 条，耗时 {time.perf_counter() - start:.1f} 秒；评估集 {len(test_x)} 条")
+        self._report(model, test_x, test_y)
+
+        # 评估后用全部数据重新训练再保存
+        model = local_classifier.build_pipeline().fit(texts, labels)
+        path = local_classifier.save_model(model, options['output'] or None)
+        self.stdout.write(self.style.SUCCESS(f"模型已保存: {path}"))
+
+    def _report(self, model, texts, labels):
+        from sklearn.metrics import classification_report
+
+        threshold = getattr(settings, 'AI_LOCAL_CLASSIFIER_THRESHOLD', 0.8)
+        start = time.perf_counter()
+        for text in texts[:200]:
+            model.predict_proba([text])
+        per_message_ms = (time.perf_counter() - start) * 1000 / min(len(texts), 200)
+
+        proba = model.predict_proba(texts)
+        predicted = [str(model.classes_[row.argmax()]) for row in proba]
+        confident = [i for i, row in enumerate(proba) if row.max() >= threshold]
+        agree = sum(1 for p, y in zip(predicted, labels) if p == y)
+        confident_agree = sum(1 for i in confident if predicted[i] == labels[i])
+
+        self.stdout.write(classification_report(labels, predicted, zero_division=0))
+        self.stdout.write(f"与大模型标签一致率: {agree / len(labels):.1%}")
+        self.stdout.write(
+            f"置信度 ≥ {threshold:.2f} 的消息: {len(confident) / len(labels):.1%}（可跳过大模型），"
+            f"其中一致率 {confident_agree / len(confident):.1%}" if confident else f"没有消息达到置信度 {threshold:.2f}"
+        )
+        self.stdout.write(f"单条打分耗时: {per_message_ms:.3f} ms")
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-17 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecognizedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='内容哈希')),
+                ('model', models.CharField(max_length=50, verbose_name='模型')),
+                ('description', models.TextField(verbose_name='识别结果')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='图片大小')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '图片识别缓存',
+                'verbose_name_plural': '图片识别缓存',
+                'unique_together': {('content_hash', 'model')},
+            },
+        ),
+    ]
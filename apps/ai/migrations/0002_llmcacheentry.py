@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-17 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='缓存键')),
+                ('namespace', models.CharField(db_index=True, max_length=50, verbose_name='调用方')),
+                ('model', models.CharField(max_length=50, verbose_name='模型')),
+                ('value', models.TextField(verbose_name='结果(JSON)')),
+                ('hits', models.PositiveIntegerField(default=0, verbose_name='命中次数')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='过期时间')),
+                ('accessed_at', models.DateTimeField(db_index=True, verbose_name='访问时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '大模型结果缓存',
+                'verbose_name_plural': '大模型结果缓存',
+            },
+        ),
+    ]
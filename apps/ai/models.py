@@ -0,0 +1,37 @@
+from django.db import models
+
+
+class RecognizedImage(models.Model):
+    """图片识别结果缓存，按图片内容哈希索引，同一张图片转发多次只识别一次。"""
+    content_hash = models.CharField('内容哈希', max_length=64)
+    model = models.CharField('模型', max_length=50)
+    description = models.TextField('识别结果')
+    size = models.PositiveIntegerField('图片大小', default=0)
+    created_at = models.DateTimeField('创建时间', auto_now_add=True)
+
+    class Meta:
+        unique_together = ['content_hash', 'model']
+        verbose_name = '图片识别缓存'
+        verbose_name_plural = '图片识别缓存'
+
+    def __str__(self):
+        return f'{self.content_hash[:12]} - {self.description[:30]}'
+
+
+class LLMCacheEntry(models.Model):
+    """大模型调用结果缓存，键为 (函数, 模型, 提示词版本, 规范化输入) 的哈希。"""
+    key = models.CharField('缓存键', max_length=64, unique=True)
+    namespace = models.CharField('调用方', max_length=50, db_index=True)
+    model = models.CharField('模型', max_length=50)
+    value = models.TextField('结果(JSON)')
+    hits = models.PositiveIntegerField('命中次数', default=0)
+    expires_at = models.DateTimeField('过期时间', db_index=True)
+    accessed_at = models.DateTimeField('访问时间', db_index=True)
+    created_at = models.DateTimeField('创建时间', auto_now_add=True)
+
+    class Meta:
+        verbose_name = '大模型结果缓存'
+        verbose_name_plural = '大模型结果缓存'
+
+    def __str__(self):
+        return f'{self.namespace} - {self.key[:12]}'
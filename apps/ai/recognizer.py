@@ -1,49 +1,244 @@
+import asyncio
+import hashlib
 import logging
-from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
-import dashscope
-from dashscope import MultiModalConversation
 from django.conf import settings
+from django.utils import timezone
+
+from apps.channel.blocking import run_blocking
+
+from .images import adownload_image, download_image, image_inputs
+from .llm import acomplete_route_with_model, complete_route_with_model
+from .routing import select
 
 logger = logging.getLogger(__name__)
 
 RECOGNIZE_PROMPT = "请详细描述这张图片的内容，并提取图片中所有可见的文字信息（OCR）。"
 
 
+def _route():
+    return select('recognize_image', images=1)
+
+
+def _recognize_messages(inputs: list[str]) -> list:
+    return [{
+        'role': 'user',
+        'content': [
+            *({'image': item} for item in inputs),
+            {'text': RECOGNIZE_PROMPT},
+        ],
+    }]
+
+
+def _prepare(url: str, data: bytes | None) -> list[str]:
+    """预处理一张已下载的图片（缩放 / 重新编码 / 长图切块），下载失败时退回原图 URL。"""
+    return image_inputs(url, data)['inputs'] if data else [url]
+
+
+def _recognize(url: str, data: bytes | None = None,
+               inputs: list[str] | None = None) -> tuple[str | None, str, str | None]:
+    """调用多模态模型识别单张图片（长截图的多个切块一起发送），返回 (识别文本, 错误说明, 给出结果的模型)。
+
+    inputs 为已经预处理好的模型输入；未提供时由 data 预处理，data 也没有时直接发送 URL。
+    """
+    inputs = inputs or _prepare(url, data)
+    text, model = complete_route_with_model(
+        f"图片识别[{url[:100]}]", _route(), _recognize_messages(inputs), multimodal=True,
+    )
+    return (text, '', model) if text is not None else (None, '识别失败', None)
+
+
+async def _arecognize(url: str, inputs: list[str]) -> tuple[str | None, str, str | None]:
+    text, model = await acomplete_route_with_model(
+        f"图片识别[{url[:100]}]", _route(), _recognize_messages(inputs), multimodal=True,
+    )
+    return (text, '', model) if text is not None else (None, '识别失败', None)
+
+
+def _ttl_cutoff():
+    return timezone.now() - timedelta(days=getattr(settings, 'AI_RECOGNIZED_IMAGE_TTL_DAYS', 30))
+
+
+def _load_cached(hashes) -> dict:
+    """读取未过期的识别结果；同一张图片有多个模型的结果时优先取路由里靠前的模型。"""
+    from apps.ai.models import RecognizedImage
+
+    if not hashes:
+        return {}
+    models = _route().models
+    rows = RecognizedImage.objects.filter(
+        content_hash__in=hashes, model__in=models, created_at__gte=_ttl_cutoff(),
+    )
+    cached = {}
+    for row in sorted(rows, key=lambda r: models.index(r.model), reverse=True):
+        cached[row.content_hash] = row.description
+    return cached
+
+
+def _save_cached(content_hash, description, size, model):
+    """按实际给出结果的模型保存，主模型失败时降级模型的结果不会冒充主模型的结果。"""
+    from apps.ai.models import RecognizedImage
+
+    try:
+        RecognizedImage.objects.update_or_create(
+            content_hash=content_hash,
+            model=model,
+            defaults={'description': description, 'size': size, 'created_at': timezone.now()},
+        )
+    except Exception:
+        logger.exception("写入图片识别缓存失败")
+
+
+def prune_recognized_images(days=None) -> int:
+    """删除超过保留天数的图片识别缓存，返回删除条数。"""
+    from apps.ai.models import RecognizedImage
+
+    if days is None:
+        days = getattr(settings, 'AI_RECOGNIZED_IMAGE_TTL_DAYS', 30)
+    cutoff = timezone.now() - timedelta(days=days)
+    count, _ = RecognizedImage.objects.filter(created_at__lt=cutoff).delete()
+    if count:
+        logger.info("已删除 %d 条超过 %d 天的图片识别缓存", count, days)
+    return count
+
+
+def _content_hashes(blobs) -> list[str | None]:
+    return [hashlib.sha256(blob).hexdigest() if blob else None for blob in blobs]
+
+
+def _keys(hashes, use_cache=True) -> list[str]:
+    """每张图片的去重键：内容哈希，下载失败的按位置区分；不使用缓存时每张图片都单独识别。"""
+    return [(use_cache and content_hash) or f'url:{idx}' for idx, content_hash in enumerate(hashes)]
+
+
+def _pending(image_urls, blobs, keys, cached) -> dict:
+    """需要调用模型的图片：未命中缓存的每个哈希识别一次，下载失败的按 URL 各识别一次。"""
+    pending = {}
+    for url, blob, key in zip(image_urls, blobs, keys):
+        if key not in cached and key not in pending:
+            pending[key] = (url, blob)
+    return pending
+
+
+def _to_prepare(image_urls, blobs, keys, pending, keep_inputs) -> dict:
+    """需要预处理的图片：待识别的；keep_inputs 时还包括命中缓存的（后续任务提取要用）。"""
+    if not keep_inputs:
+        return pending
+    targets = {}
+    for url, blob, key in zip(image_urls, blobs, keys):
+        targets.setdefault(key, (url, blob))
+    return targets
+
+
+def _save_recognized(recognized, pending):
+    for key, (text, _, model) in recognized.items():
+        if text is not None and not key.startswith('url:'):
+            _save_cached(key, text, len(pending[key][1]), model)
+
+
+def _descriptions(keys, cached, recognized) -> list[str]:
+    if cached:
+        logger.info("图片识别缓存命中 %d 张", sum(1 for key in keys if key in cached))
+
+    results = []
+    for idx, key in enumerate(keys, 1):
+        if key in cached:
+            description = f"图{idx}: {cached[key]}"
+        else:
+            text, error, _ = recognized[key]
+            description = f"图{idx}: {text}" if text is not None else f"图{idx}: ({error})"
+        logger.info("图片 %d 识别完成: %s", idx, description[:100])
+        results.append(description)
+    return results
+
+
+def _model_inputs(keys, prepared) -> list[str]:
+    """按图片顺序展开预处理结果，作为多模态任务提取的 image 输入。"""
+    return [item for key in keys for item in prepared[key]]
+
+
+def _concurrency(image_urls) -> int:
+    return max(1, min(getattr(settings, 'AI_RECOGNIZE_CONCURRENCY', 4), len(image_urls)))
+
+
+def _recognize_all(image_urls: list[str], keep_inputs: bool, use_cache: bool) -> tuple[list[str], list[str] | None]:
+    with ThreadPoolExecutor(max_workers=_concurrency(image_urls)) as pool:
+        blobs = list(pool.map(download_image, image_urls))
+        keys = _keys(_content_hashes(blobs), use_cache)
+        cached = _load_cached({key for key in keys if not key.startswith('url:')})
+        pending = _pending(image_urls, blobs, keys, cached)
+        targets = _to_prepare(image_urls, blobs, keys, pending, keep_inputs)
+        prepared = dict(zip(targets, pool.map(lambda k: _prepare(*targets[k]), targets)))
+        recognized = dict(zip(pending, pool.map(lambda k: _recognize(pending[k][0], inputs=prepared[k]), pending)))
+
+    _save_recognized(recognized, pending)
+    return _descriptions(keys, cached, recognized), _model_inputs(keys, prepared) if keep_inputs else None
+
+
 def recognize_images(image_urls: list[str]) -> list[str]:
-    """逐张识别图片内容，返回每张图片的描述文本列表。"""
+    """并发识别图片内容，返回每张图片的描述文本列表（与输入顺序一致）。
+
+    先下载图片计算内容哈希：命中识别缓存的直接返回，同一条消息里重复的图片只识别一次，
+    其余经本地预处理（缩放 / 重新编码 / 长图切块）后按 AI_RECOGNIZE_CONCURRENCY 并发调用模型。
+    """
+    return recognize_images_with_inputs(image_urls, keep_inputs=False)[0]
+
+
+def recognize_images_with_inputs(image_urls: list[str], keep_inputs: bool = True,
+                                 use_cache: bool = True) -> tuple[list[str], list[str] | None]:
+    """识别图片并返回 (描述列表, 预处理后的模型输入)。
+
+    multimodal 模式下任务提取还要把图片发给模型，直接复用这里的输入，每张图片只下载和预处理一次。
+    use_cache=False 时不读写识别缓存、相同内容的图片也分别识别（压测对比用）。
+    """
     if not settings.DASHSCOPE_API_KEY:
         logger.warning("DASHSCOPE_API_KEY 未配置，跳过图片识别")
-        return []
+        return [], None
+    if not image_urls:
+        return [], None
+    return _recognize_all(image_urls, keep_inputs, use_cache)
 
-    dashscope.api_key = settings.DASHSCOPE_API_KEY
-    results = []
 
-    for idx, url in enumerate(image_urls, 1):
-        try:
-            response = MultiModalConversation.call(
-                model='qwen-vl-max',
-                messages=[{
-                    'role': 'user',
-                    'content': [
-                        {'image': url},
-                        {'text': RECOGNIZE_PROMPT},
-                    ],
-                }],
-            )
-
-            if response.status_code == HTTPStatus.OK:
-                text = response.output.choices[0].message.content[0].get('text', '').strip()
-                description = f"图{idx}: {text}"
-                logger.info("图片 %d 识别完成: %s", idx, description[:100])
-            else:
-                description = f"图{idx}: (识别失败: {response.code})"
-                logger.error("图片 %d 识别失败: %s - %s", idx, response.code, response.message)
-
-            results.append(description)
-
-        except Exception:
-            logger.exception("图片 %d 识别异常", idx)
-            results.append(f"图{idx}: (识别异常)")
+async def _arecognize_all(image_urls: list[str], keep_inputs: bool,
+                          use_cache: bool) -> tuple[list[str], list[str] | None]:
+    blobs = await asyncio.gather(*(adownload_image(url) for url in image_urls))
+    keys = _keys(_content_hashes(blobs), use_cache)
+    cached = await run_blocking(_load_cached)(
+        {key for key in keys if not key.startswith('url:')}
+    )
+    pending = _pending(image_urls, blobs, keys, cached)
 
-    return results
+    # 缩放 / 编码是 CPU 操作，放到线程里避免阻塞事件循环
+    targets = _to_prepare(image_urls, blobs, keys, pending, keep_inputs)
+    prepared = dict(zip(targets, await asyncio.gather(*(
+        asyncio.to_thread(_prepare, *targets[key]) for key in targets
+    ))))
+
+    semaphore = asyncio.Semaphore(_concurrency(image_urls))
+
+    async def run(key):
+        async with semaphore:
+            return await _arecognize(pending[key][0], prepared[key])
+
+    recognized = dict(zip(pending, await asyncio.gather(*(run(key) for key in pending))))
+
+    await run_blocking(_save_recognized)(recognized, pending)
+    return _descriptions(keys, cached, recognized), _model_inputs(keys, prepared) if keep_inputs else None
+
+
+async def arecognize_images(image_urls: list[str]) -> list[str]:
+    """recognize_images 的异步版本：下载和模型调用直接 await，同时识别的图片数仍受 AI_RECOGNIZE_CONCURRENCY 限制。"""
+    return (await arecognize_images_with_inputs(image_urls, keep_inputs=False))[0]
+
+
+async def arecognize_images_with_inputs(image_urls: list[str], keep_inputs: bool = True,
+                                        use_cache: bool = True) -> tuple[list[str], list[str] | None]:
+    """recognize_images_with_inputs 的异步版本。"""
+    if not settings.DASHSCOPE_API_KEY:
+        logger.warning("DASHSCOPE_API_KEY 未配置，跳过图片识别")
+        return [], None
+    if not image_urls:
+        return [], None
+    return await _arecognize_all(image_urls, keep_inputs, use_cache)
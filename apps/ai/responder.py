@@ -1,10 +1,11 @@
 import logging
-from http import HTTPStatus
 
-import dashscope
-from dashscope import Generation
 from django.conf import settings
 
+from .cache import acache_get, acache_set, cache_get, cache_key, cache_set, prompt_version
+from .llm import acomplete_route, astream_route, complete_route
+from .routing import select
+
 logger = logging.getLogger(__name__)
 
 REPLY_PROMPT = """你是一个友好的个人助手。请简洁地回复以下消息。
@@ -12,25 +13,71 @@ REPLY_PROMPT = """你是一个友好的个人助手。请简洁地回复以下
 
 消息内容：{content}"""
 
+FALLBACK_REPLY = '收到，我会尽快处理。'
+
+
+def _reply_request(content: str):
+    route = select('generate_reply', chars=len(content))
+    key = cache_key('generate_reply', route.model, prompt_version(REPLY_PROMPT), content)
+    messages = [{'role': 'user', 'content': REPLY_PROMPT.format(content=content)}]
+    return key, messages, route
+
 
 def generate_reply(content: str) -> str:
     if not settings.DASHSCOPE_API_KEY:
-        return '收到，我会尽快处理。'
-
-    try:
-        dashscope.api_key = settings.DASHSCOPE_API_KEY
-        response = Generation.call(
-            model='qwen-plus',
-            messages=[{'role': 'user', 'content': REPLY_PROMPT.format(content=content)}],
-            result_format='message'
-        )
-
-        if response.status_code == HTTPStatus.OK:
-            return response.output.choices[0].message.content.strip()
-        else:
-            logger.error("生成回复失败: %s - %s", response.code, response.message)
-            return '收到，我会尽快处理。'
-
-    except Exception:
-        logger.exception("生成回复异常")
-        return '收到，我会尽快处理。'
+        return FALLBACK_REPLY
+
+    key, messages, route = _reply_request(content)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+
+    reply = complete_route('生成回复', route, messages)
+    if not reply:
+        return FALLBACK_REPLY
+    cache_set(key, reply)
+    return reply
+
+
+async def agenerate_reply(content: str) -> str:
+    if not settings.DASHSCOPE_API_KEY:
+        return FALLBACK_REPLY
+
+    key, messages, route = _reply_request(content)
+    cached = await acache_get(key)
+    if cached is not None:
+        return cached
+
+    reply = await acomplete_route('生成回复', route, messages)
+    if not reply:
+        return FALLBACK_REPLY
+    await acache_set(key, reply)
+    return reply
+
+
+async def astream_reply(content: str):
+    """流式生成回复，逐段产出增量文本。
+
+    命中缓存时一次性产出完整回复；模型一个字都没有返回时产出兜底回复。完整回复在结束时写入缓存，
+    输出中途失败时抛出 StreamError，已产出的半截回复不写入缓存。
+    """
+    if not settings.DASHSCOPE_API_KEY:
+        yield FALLBACK_REPLY
+        return
+
+    key, messages, route = _reply_request(content)
+    cached = await acache_get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for chunk in astream_route('生成回复', route, messages):
+        parts.append(chunk)
+        yield chunk
+
+    reply = ''.join(parts).strip()
+    if not reply:
+        yield FALLBACK_REPLY
+        return
+    await acache_set(key, reply)
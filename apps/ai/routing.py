@@ -0,0 +1,151 @@
+"""按调用类型和输入规模选择 qwen 模型档位。
+
+原来每个函数写死一个模型：短短一句"帮我看下"也要等 qwen-max。这里用一张路由表决定模型：
+- 每个调用类型（classify_message / extract_task / ...）有一组按顺序匹配的规则，
+  规则可以限制 max_chars（输入字符数上限）、min_images（图片数下限）和 min_recognized
+  （已识别成文字的图片数下限），第一条满足的规则生效
+- 主模型超时或出错时按 AI_MODEL_FALLBACKS 依次换用其他档位
+- 每个 (调用类型, 模型) 记录调用次数、错误、超时和耗时分位数，机器人定时和退出时输出，用来调整路由表
+
+settings.AI_MODEL_ROUTES 按调用类型覆盖默认规则，settings.AI_MODEL_FALLBACKS 覆盖降级顺序，例如：
+    AI_MODEL_ROUTES = {'classify_message': [{'model': 'qwen-plus'}]}
+规则里还可以写 timeout（秒），只对异步调用生效。
+"""
+import logging
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROUTES = {
+    'classify_message': [
+        {'max_chars': 200, 'model': 'qwen-turbo'},
+        {'model': 'qwen-plus'},
+    ],
+    'analyze_article': [
+        {'model': 'qwen-plus'},
+    ],
+    'generate_reply': [
+        {'max_chars': 100, 'model': 'qwen-turbo'},
+        {'model': 'qwen-plus'},
+    ],
+    'extract_task': [
+        {'min_images': 1, 'model': 'qwen-vl-max'},
+        # reuse 模式下图片识别结果拼进了正文，文本很长但信息密度低，不需要 qwen-max
+        {'min_recognized': 1, 'model': 'qwen-plus'},
+        {'max_chars': 300, 'model': 'qwen-plus'},
+        {'model': 'qwen-max'},
+    ],
+    'recognize_image': [
+        {'model': 'qwen-vl-max'},
+    ],
+    'scheduler_summary': [
+        {'model': 'qwen-max'},
+    ],
+}
+
+DEFAULT_FALLBACKS = {
+    'qwen-max': ['qwen-plus'],
+    'qwen-plus': ['qwen-turbo'],
+    'qwen-turbo': ['qwen-plus'],
+    'qwen-vl-max': ['qwen-vl-plus'],
+    'qwen-vl-plus': ['qwen-vl-max'],
+}
+
+# 每个路由保留最近多少次调用的耗时用于计算分位数
+LATENCY_WINDOW = 200
+
+
+class Route:
+    __slots__ = ('task', 'models', 'timeout')
+
+    def __init__(self, task, models, timeout=None):
+        self.task = task
+        self.models = models
+        self.timeout = timeout
+
+    @property
+    def model(self) -> str:
+        """主模型，缓存键按它计算。"""
+        return self.models[0]
+
+
+def _routes(task):
+    overrides = getattr(settings, 'AI_MODEL_ROUTES', None) or {}
+    return overrides.get(task) or DEFAULT_ROUTES[task]
+
+
+def _fallbacks(model):
+    if not getattr(settings, 'AI_MODEL_FALLBACK_ENABLED', True):
+        return []
+    table = {**DEFAULT_FALLBACKS, **(getattr(settings, 'AI_MODEL_FALLBACKS', None) or {})}
+    return table.get(model, [])
+
+
+def select(task: str, chars: int = 0, images: int = 0, recognized: int = 0) -> Route:
+    """返回 task 在当前输入规模下的路由（主模型 + 降级模型）。
+
+    recognized 是已经识别成文字、拼进输入文本的图片数（这些图片本身不再发送）。
+    """
+    rules = _routes(task)
+    rule = next(
+        (r for r in rules
+         if chars <= r.get('max_chars', chars) and images >= r.get('min_images', 0)
+         and recognized >= r.get('min_recognized', 0)),
+        rules[-1],
+    )
+    models = [rule['model']]
+    for model in _fallbacks(rule['model']):
+        # 有图片时只能降级到同样支持图片的模型
+        if model not in models and (not images or '-vl-' in model):
+            models.append(model)
+    return Route(task, models, rule.get('timeout'))
+
+
+_lock = threading.Lock()
+_stats = defaultdict(lambda: {'calls': 0, 'errors': 0, 'timeouts': 0, 'fallbacks': 0,
+                              'latencies': deque(maxlen=LATENCY_WINDOW)})
+
+
+def record(task: str, model: str, seconds: float, status: str, fallback: bool = False):
+    """记录一次调用；status 为 ok / error / timeout。"""
+    with _lock:
+        stats = _stats[(task, model)]
+        stats['calls'] += 1
+        stats['latencies'].append(seconds)
+        if status == 'error':
+            stats['errors'] += 1
+        elif status == 'timeout':
+            stats['timeouts'] += 1
+        if fallback:
+            stats['fallbacks'] += 1
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def route_stats() -> dict:
+    """{'调用类型/模型': {calls, errors, timeouts, fallbacks, p50_ms, p95_ms}}"""
+    with _lock:
+        result = {}
+        for (task, model), stats in _stats.items():
+            latencies = list(stats['latencies'])
+            result[f'{task}/{model}'] = {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'timeouts': stats['timeouts'],
+                'fallbacks': stats['fallbacks'],
+                'p50_ms': round(_percentile(latencies, 0.5) * 1000) if latencies else 0,
+                'p95_ms': round(_percentile(latencies, 0.95) * 1000) if latencies else 0,
+            }
+        return result
+
+
+def log_route_stats():
+    for name, s in sorted(route_stats().items()):
+        logger.info("模型路由 %s: 调用 %d 次，错误 %d，超时 %d，作为降级 %d 次，P50 %d ms，P95 %d ms",
+                    name, s['calls'], s['errors'], s['timeouts'], s['fallbacks'], s['p50_ms'], s['p95_ms'])
@@ -0,0 +1,152 @@
+"""消息分类的规则前置判断。
+
+"好的"、纯表情、只有链接的消息、系统通知模板、带"线上事故/P0"的告警、以"【紧急】"开头的消息，
+结果一目了然，不需要再等一次大模型调用。规则按顺序匹配，第一条命中的规则给出分类和置信度；
+置信度不低于 AI_RULES_MIN_CONFIDENCE 时直接采用，否则仍交给大模型。
+
+规则表可以通过 settings.AI_CLASSIFY_RULES 整体替换，每条规则：
+    {'name': 规则名, 'pattern': 正则, 'label': 分类, 'confidence': 0~1, 'match': 'full' | 'search'}
+"""
+import logging
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LLM_FALLBACK = 'llm'
+
+URL_PATTERN = r'https?://[^\s一-鿿<>"\']+'
+
+DEFAULT_RULES = [
+    # 告警关键词优先判断，避免被后面的短句规则吞掉
+    {
+        'name': 'urgent_incident',
+        'pattern': r'线上事故|生产事故|线上故障|(?<![A-Za-z0-9])P0(?![0-9])|宕机|服务不可用',
+        'label': 'urgent',
+        'confidence': 0.9,
+        'match': 'search',
+    },
+    {
+        # 消息开头的显式紧急标记（"【紧急】…"、"紧急：…"、"URGENT: …"）。
+        # 句中的"紧急" / "urgent" 有歧义（"不是很紧急"、"紧急联系人"、"not urgent"），不在这里判断，交给大模型
+        'name': 'urgent_keyword',
+        'pattern': r'^\s*(?:[【\[]\s*(?:紧急|加急|特急|urgent)\s*[】\]]|(?:紧急|加急|特急|urgent)\s*[:：!！])',
+        'label': 'urgent',
+        'confidence': 0.9,
+        'match': 'search',
+    },
+    {
+        'name': 'acknowledgement',
+        'pattern': r'(好的?|好滴|好嘞|收到|了解|明白|知道了|嗯+|哦+|ok|okay|谢谢|多谢|感谢|辛苦了?|没问题|可以|行)'
+                   r'[\s,，.。!！~～啦呀哈]*',
+        'label': 'ignore',
+        'confidence': 0.95,
+        'match': 'full',
+    },
+    {
+        # 只有表情 / 标点 / 钉钉表情占位符（如 [微笑]）
+        'name': 'emoji_only',
+        'pattern': r'(?:[\s\W_]|\[[^\[\]]{1,6}\])+',
+        'label': 'ignore',
+        'confidence': 0.95,
+        'match': 'full',
+    },
+    {
+        # 只有链接：交给链接流水线保存到知识库即可
+        'name': 'link_only',
+        'pattern': rf'(?:\s*{URL_PATTERN}\s*)+',
+        'label': 'normal',
+        'confidence': 0.95,
+        'match': 'full',
+    },
+    {
+        'name': 'system_notice',
+        'pattern': r'撤回了一条消息|加入了群聊|退出了群聊|邀请.{1,20}加入了?群|验证码[:：]?\s*\d{4,8}|'
+                   r'^\[?(系统通知|系统消息|自动回复)\]?',
+        'label': 'ignore',
+        'confidence': 0.9,
+        'match': 'search',
+    },
+]
+
+
+class _Rule:
+    __slots__ = ('name', 'regex', 'label', 'confidence', 'full')
+
+    def __init__(self, conf):
+        self.name = conf['name']
+        self.regex = re.compile(conf['pattern'], re.I)
+        self.label = conf['label']
+        self.confidence = float(conf.get('confidence', 1.0))
+        self.full = conf.get('match', 'search') == 'full'
+
+    def matches(self, text):
+        return bool(self.regex.fullmatch(text) if self.full else self.regex.search(text))
+
+
+_compiled = None
+_compiled_from = None
+_lock = threading.Lock()
+_counts = Counter()
+
+
+def _rules():
+    global _compiled, _compiled_from
+    table = getattr(settings, 'AI_CLASSIFY_RULES', None) or DEFAULT_RULES
+    if _compiled_from is not table:
+        _compiled = [_Rule(conf) for conf in table]
+        _compiled_from = table
+    return _compiled
+
+
+def match_rule(content: str):
+    """返回 (分类, 置信度, 规则名)，没有规则命中时返回 None。"""
+    text = (content or '').strip()
+    if not text:
+        return None
+    for rule in _rules():
+        if rule.matches(text):
+            return rule.label, rule.confidence, rule.name
+    return None
+
+
+def preclassify(content: str) -> str | None:
+    """规则足够确定时返回分类，否则返回 None（由调用方继续调用大模型）。"""
+    if not getattr(settings, 'AI_RULES_ENABLED', True):
+        return None
+
+    result = match_rule(content)
+    threshold = getattr(settings, 'AI_RULES_MIN_CONFIDENCE', 0.9)
+    with _lock:
+        if result and result[1] >= threshold:
+            _counts[result[2]] += 1
+        else:
+            _counts[LLM_FALLBACK] += 1
+    if result and result[1] >= threshold:
+        logger.info("规则分类命中 %s -> %s (置信度 %.2f)", result[2], result[0], result[1])
+        return result[0]
+    return None
+
+
+def rule_stats() -> dict:
+    """各规则命中次数，以及跳过大模型的比例。"""
+    with _lock:
+        counts = dict(_counts)
+    total = sum(counts.values())
+    skipped = total - counts.get(LLM_FALLBACK, 0)
+    return {
+        'total': total,
+        'skipped_llm': skipped,
+        'skip_rate': round(skipped / total, 3) if total else 0.0,
+        'by_rule': counts,
+    }
+
+
+def log_rule_stats():
+    stats = rule_stats()
+    if stats['total']:
+        logger.info("规则分类: 共 %d 条消息，%d 条跳过大模型 (%.1f%%)，明细 %s",
+                    stats['total'], stats['skipped_llm'], stats['skip_rate'] * 100, stats['by_rule'])
@@ -0,0 +1,695 @@
+import asyncio
+import importlib
+import io
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.ai import cache, classifier, extractor, images, llm, local_classifier, recognizer, routing
+from apps.ai.batching import MicroBatcher, get_batcher
+from apps.ai.cache import acache_get, acache_set, cache_get, cache_key, cache_set, evict, prompt_version
+from apps.ai.compaction import LEGACY_PREVIEW_CHARS, compact, estimate_tokens
+from apps.ai.extractor import _parse_tasks
+from apps.ai.models import LLMCacheEntry
+from apps.ai.responder import FALLBACK_REPLY, _reply_request, astream_reply
+from apps.ai.rules import match_rule, preclassify
+from apps.channel import blocking
+from apps.channel.models import ChannelUser, Message
+
+
+def fake_stream(*chunks, error=None):
+    """替换 dashscope_async.astream：依次产出 chunks，最后可选地抛出 error。"""
+    async def astream(model, messages, timeout=None, **parameters):
+        for chunk in chunks:
+            yield chunk
+        if error is not None:
+            raise error
+    return astream
+
+
+async def collect(agen) -> list:
+    return [chunk async for chunk in agen]
+
+
+@override_settings(DASHSCOPE_API_KEY='test-key')
+class StreamReplyTests(TestCase):
+    async def test_streams_chunks_and_caches_reply(self):
+        with mock.patch.object(llm, 'astream', fake_stream('你好', '，有什么', '可以帮你？')):
+            chunks = await collect(astream_reply('流式回复测试'))
+
+        self.assertEqual(chunks, ['你好', '，有什么', '可以帮你？'])
+        key, _, _ = _reply_request('流式回复测试')
+        self.assertEqual(await acache_get(key), '你好，有什么可以帮你？')
+
+    async def test_cache_hit_yields_whole_reply(self):
+        with mock.patch.object(llm, 'astream', fake_stream('缓存', '内容')):
+            await collect(astream_reply('缓存命中测试'))
+        with mock.patch.object(llm, 'astream', fake_stream('不应调用')):
+            chunks = await collect(astream_reply('缓存命中测试'))
+
+        self.assertEqual(chunks, ['缓存内容'])
+
+    async def test_empty_stream_falls_back(self):
+        with mock.patch.object(llm, 'astream', fake_stream(error=llm.DashScopeError(500, 'InternalError', 'boom'))):
+            chunks = await collect(astream_reply('空回复测试'))
+
+        self.assertEqual(chunks, [FALLBACK_REPLY])
+        key, _, _ = _reply_request('空回复测试')
+        self.assertIsNone(await acache_get(key))
+
+    async def test_interrupted_stream_raises_and_skips_cache(self):
+        key, _, route = _reply_request('中断测试')
+        name = f'generate_reply/{route.model}'
+        errors = routing.route_stats().get(name, {}).get('errors', 0)
+        chunks = []
+        with mock.patch.object(llm, 'astream', fake_stream('半截', error=llm.DashScopeError(500, 'InternalError', 'boom'))):
+            with self.assertRaises(llm.StreamError):
+                async for chunk in astream_reply('中断测试'):
+                    chunks.append(chunk)
+
+        self.assertEqual(chunks, ['半截'])
+        self.assertIsNone(await acache_get(key))
+        self.assertEqual(routing.route_stats()[name]['errors'], errors + 1)
+
+
+class LLMCacheTests(TestCase):
+    def setUp(self):
+        cache._memory.clear()
+        # 异步用例在线程池里写入的缓存不在测试事务内，先清掉
+        LLMCacheEntry.objects.all().delete()
+
+    def test_key_normalizes_input_and_tracks_model_and_prompt(self):
+        base = cache_key('classify_message', 'qwen-turbo', prompt_version('模板'), '线上  告警\n')
+
+        self.assertEqual(base.digest, cache_key('classify_message', 'qwen-turbo', prompt_version('模板'), '线上 告警').digest)
+        self.assertNotEqual(base.digest, cache_key('classify_message', 'qwen-plus', prompt_version('模板'), '线上 告警').digest)
+        self.assertNotEqual(base.digest, cache_key('classify_message', 'qwen-turbo', prompt_version('模板2'), '线上 告警').digest)
+
+    def test_persists_beyond_memory(self):
+        key = cache_key('analyze_article', 'qwen-plus', 'v1', '文章')
+        cache_set(key, {'category': '技术'})
+        cache._memory.clear()
+
+        self.assertEqual(cache_get(key), {'category': '技术'})
+        self.assertEqual(LLMCacheEntry.objects.get(key=key.digest).hits, 1)
+
+    @override_settings(LLM_CACHE_TTLS={'generate_reply': 60})
+    def test_expired_entries_miss(self):
+        key = cache_key('generate_reply', 'qwen-turbo', 'v1', '过期')
+        cache_set(key, '回复')
+        cache._memory.clear()
+        LLMCacheEntry.objects.filter(key=key.digest).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertIsNone(cache_get(key))
+
+    def test_none_not_cached(self):
+        key = cache_key('generate_reply', 'qwen-turbo', 'v1', '失败')
+        cache_set(key, None)
+
+        self.assertIsNone(cache_get(key))
+        self.assertFalse(LLMCacheEntry.objects.filter(key=key.digest).exists())
+
+    @override_settings(LLM_CACHE_ENABLED=False)
+    def test_disabled(self):
+        key = cache_key('generate_reply', 'qwen-turbo', 'v1', '关闭')
+        cache_set(key, '回复')
+
+        self.assertIsNone(cache_get(key))
+
+    @override_settings(LLM_CACHE_MAX_ENTRIES=2)
+    def test_evict_least_recently_accessed(self):
+        keys = [cache_key('generate_reply', 'qwen-turbo', 'v1', f'淘汰{i}') for i in range(3)]
+        for i, key in enumerate(keys):
+            cache_set(key, str(i))
+        LLMCacheEntry.objects.filter(key=keys[0].digest).update(accessed_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(evict(), 1)
+        self.assertFalse(LLMCacheEntry.objects.filter(key=keys[0].digest).exists())
+
+
+class CacheConnectionTests(TestCase):
+    async def test_db_access_closes_worker_connections(self):
+        key = cache_key('generate_reply', 'qwen-turbo', 'v1', '连接清理')
+        with mock.patch.object(blocking.connections, 'close_all') as close_all:
+            await acache_set(key, '好的')
+            cache._memory.clear()
+            self.assertEqual(await acache_get(key), '好的')
+
+        self.assertEqual(close_all.call_count, 2)
+
+
+class ParseJsonTests(SimpleTestCase):
+    def test_plain_and_fenced(self):
+        self.assertEqual(llm.parse_json('{"a": 1}'), {'a': 1})
+        self.assertEqual(llm.parse_json('```json\n[1, 2]\n```'), [1, 2])
+
+    def test_surrounding_prose(self):
+        self.assertEqual(llm.parse_json('结果如下：{"1": "urgent"} 以上。'), {'1': 'urgent'})
+
+    def test_trailing_commas(self):
+        self.assertEqual(llm.parse_json('{"a": [1, 2,], "b": 3,}'), {'a': [1, 2], 'b': 3})
+
+    def test_control_characters_in_strings(self):
+        self.assertEqual(llm.parse_json('{"text": "第一行\n第二行\t"}'),
+                         {'text': '第一行\n第二行\t'})
+
+    def test_truncated_output(self):
+        # 截断在后一项中间时保留前面完整的项
+        self.assertEqual(llm.parse_json('[{"title": "写周报"}, {"title": "开'), [{'title': '写周报'}])
+        self.assertEqual(llm.parse_json('{"title": "开会'), {'title': '开会'})
+        self.assertEqual(llm.parse_json('{"a": {"b": [1, 2'), {'a': {'b': [1, 2]}})
+
+    def test_unrepairable(self):
+        self.assertIsNone(llm.parse_json('抱歉，我无法完成'))
+        self.assertIsNone(llm.parse_json(''))
+        self.assertIsNone(llm.parse_json(None))
+
+
+class RuleTests(SimpleTestCase):
+    def test_obvious_messages_skip_llm(self):
+        self.assertEqual(preclassify('好的~'), 'ignore')
+        self.assertEqual(preclassify('[微笑][微笑]'), 'ignore')
+        self.assertEqual(preclassify('https://example.com/a https://example.com/b'), 'normal')
+        self.assertEqual(preclassify('张三撤回了一条消息'), 'ignore')
+        self.assertEqual(preclassify('线上故障，支付接口 500'), 'urgent')
+        self.assertEqual(preclassify('P0 告警：订单服务不可用'), 'urgent')
+
+    def test_negated_or_fixed_phrases_not_urgent(self):
+        for text in ('non-urgent', 'urgently needed next quarter', 'not urgent', 'This is urgent, please check',
+                     '不是很紧急', '不紧急，下周再说', '紧急联系人填我', '这个不紧急：下周再看', 'P01 号工单'):
+            with self.subTest(text=text):
+                self.assertIsNone(match_rule(text))
+
+    def test_explicit_urgent_tag_skips_llm(self):
+        for text in ('紧急：客户投诉', '【加急】合同今天要盖章', ' [紧急] 发布回滚', 'URGENT: prod db is down'):
+            with self.subTest(text=text):
+                self.assertEqual(match_rule(text)[2], 'urgent_keyword')
+                self.assertEqual(preclassify(text), 'urgent')
+
+    @override_settings(AI_RULES_ENABLED=False)
+    def test_disabled(self):
+        self.assertIsNone(preclassify('好的'))
+
+
+class CompactionTests(SimpleTestCase):
+    def test_latin_text_never_exceeds_legacy_slice(self):
+        paragraph = 'This paragraph explains how the service handles retries and backoff in detail.'
+        text = '\n'.join(f'{i}. {paragraph}' for i in range(300))
+        legacy = estimate_tokens(text[:LEGACY_PREVIEW_CHARS])
+
+        result = compact(text, budget=2000)
+
+        self.assertEqual(result['legacy_tokens'], legacy)
+        self.assertLessEqual(result['output_tokens'], legacy)
+        self.assertEqual(result['saved_tokens'], legacy - result['output_tokens'])
+
+    def test_short_text_kept_whole(self):
+        text = '第一段导语，介绍文章背景。\n第二段正文，给出具体做法。'
+        result = compact(text)
+
+        self.assertEqual(result['text'], text)
+        self.assertEqual(result['saved_tokens'], 0)
+
+    def test_boilerplate_and_duplicates_dropped(self):
+        text = '正文第一段，说明问题。\n点击上方蓝字关注我们\n正文第一段，说明问题。\n版权所有 转载请注明出处\n正文第二段，给出结论。'
+        result = compact(text)
+
+        self.assertEqual(result['text'], '正文第一段，说明问题。\n正文第二段，给出结论。')
+        self.assertGreater(result['saved_tokens'], 0)
+
+    def test_budget_prefers_lead_and_dense_paragraphs(self):
+        lead = '导语：' + '本文介绍缓存设计。' * 5
+        dense = '关键结论：命中率提升到百分之九十，延迟下降一半。' * 3
+        noise = '—— ' * 40
+        result = compact('\n'.join([lead, noise, dense]), budget=estimate_tokens(lead + dense) + 2)
+
+        self.assertEqual(result['text'], f'{lead}\n{dense}')
+
+
+class TrainingDataTests(TestCase):
+    def setUp(self):
+        self.user = ChannelUser.objects.create(platform='dingtalk', platform_user_id='u1', name='张三')
+
+    def message(self, content, label, source, classification_input='', message_type='text'):
+        return Message.objects.create(
+            channel_user=self.user, platform='dingtalk', content=content, message_type=message_type,
+            ai_classification=label, classification_source=source, classification_input=classification_input,
+        )
+
+    def test_only_llm_labels_with_serving_input(self):
+        self.message('@机器人 线上告警', 'urgent', 'llm', classification_input='线上告警\n\n截图：500 错误')
+        self.message('随便聊聊', 'normal', 'default', classification_input='随便聊聊')
+        self.message('规则判断', 'ignore', 'rules', classification_input='规则判断')
+
+        texts, labels = local_classifier.training_data()
+
+        self.assertEqual(texts, ['线上告警\n\n截图：500 错误'])
+        self.assertEqual(labels, ['urgent'])
+
+    def test_legacy_labels_are_used(self):
+        self.message('@机器人 明天交周报', 'important', 'legacy')
+        self.message('https://img/1.png', 'important', 'legacy', message_type='image')
+        self.message('接口超时了', 'normal', '')
+
+        texts, labels = local_classifier.training_data()
+
+        self.assertEqual(texts, ['明天交周报'])
+        self.assertEqual(labels, ['important'])
+
+    def test_migration_marks_classified_messages_as_legacy(self):
+        from django.apps import apps
+
+        migration = importlib.import_module('apps.channel.migrations.0006_message_classification_source')
+        labelled = self.message('明天交周报', 'important', '')
+        unlabelled = self.message('还没分类', '', '')
+        migration.mark_legacy_classifications(apps, None)
+
+        labelled.refresh_from_db()
+        unlabelled.refresh_from_db()
+        self.assertEqual(labelled.classification_source, 'legacy')
+        self.assertEqual(unlabelled.classification_source, '')
+
+
+class LocalClassifierTests(TestCase):
+    important = ['明天下午交周报', '周五前提交周报', '记得交本周周报', '周报今天要交', '下周一交月度周报', '周报模板更新了请提交']
+    normal = ['中午吃什么呢', '今天中午吃面', '晚上吃火锅吗', '中午一起吃饭', '吃饭去不去', '中午吃点什么好']
+
+    def setUp(self):
+        LLMCacheEntry.objects.all().delete()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(
+            AI_LOCAL_CLASSIFIER_PATH=str(Path(tmp.name) / 'model.joblib'), DASHSCOPE_API_KEY='test',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(local_classifier.reload)
+
+        texts = self.important + self.normal
+        labels = ['important'] * len(self.important) + ['normal'] * len(self.normal)
+        local_classifier.save_model(local_classifier.build_pipeline().fit(texts, labels))
+
+    def test_confident_prediction_skips_llm(self):
+        with override_settings(AI_LOCAL_CLASSIFIER_THRESHOLD=0.5), \
+                mock.patch.object(classifier, 'complete_route') as complete_route:
+            result = classifier.classify_message_with_source('周报什么时候交')
+
+        self.assertEqual(result, ('important', 'local'))
+        complete_route.assert_not_called()
+
+    def test_below_threshold_falls_back_to_llm(self):
+        label, probability = local_classifier.predict('周报什么时候交')
+        self.assertEqual(label, 'important')
+
+        with override_settings(AI_LOCAL_CLASSIFIER_THRESHOLD=0.99), \
+                mock.patch.object(classifier, 'complete_route', return_value='urgent') as complete_route:
+            result = classifier.classify_message_with_source('周报什么时候交')
+
+        self.assertLess(probability, 0.99)
+        self.assertEqual(result, ('urgent', 'llm'))
+        complete_route.assert_called_once()
+
+
+class ParseTasksTests(SimpleTestCase):
+    default = {'title': '原始消息', 'description': '', 'priority': 2, 'task_type': '其他', 'due_date': None}
+
+    def parse(self, text):
+        return _parse_tasks(text, '原始消息', self.default)
+
+    def test_fenced_list(self):
+        tasks = self.parse('```json\n[{"title": "写周报", "priority": "1", "due_date": "2026-10-20 18:00:00"}]\n```')
+        self.assertEqual(len(tasks), 1)
+        self.assertEqual(tasks[0]['title'], '写周报')
+        self.assertEqual(tasks[0]['priority'], 1)
+        self.assertIsNotNone(tasks[0]['due_date'])
+
+    def test_single_object_and_bad_fields(self):
+        tasks = self.parse('{"title": "修复告警", "priority": "high", "due_date": "下周"}')
+        self.assertEqual(tasks, [{'title': '修复告警', 'description': '', 'priority': 2,
+                                  'task_type': '其他', 'due_date': None}])
+
+    def test_skips_non_dict_items(self):
+        tasks = self.parse('["写周报", {"title": "开会"}, 3]')
+        self.assertEqual([task['title'] for task in tasks], ['开会'])
+
+    def test_wrong_shape_falls_back_to_default(self):
+        self.assertIs(self.parse('["写周报", "开会"]'), self.default)
+        self.assertIs(self.parse('"只是一句话"'), self.default)
+        self.assertIs(self.parse('不是 JSON'), self.default)
+
+    def test_empty_list_means_no_tasks(self):
+        self.assertEqual(self.parse('[]'), [])
+
+
+class MicroBatcherTests(SimpleTestCase):
+    async def test_concurrent_submits_share_one_batch(self):
+        calls = []
+
+        async def handler(items):
+            calls.append(items)
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher('test', handler, window=0.01, max_size=10)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+        self.assertEqual(results, [0, 2, 4, 6, 8])
+        self.assertEqual(calls, [[0, 1, 2, 3, 4]])
+
+    async def test_max_size_flushes_immediately(self):
+        calls = []
+
+        async def handler(items):
+            calls.append(list(items))
+            return items
+
+        batcher = MicroBatcher('test', handler, window=10, max_size=2)
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(4))), timeout=1)
+
+        self.assertEqual(results, [0, 1, 2, 3])
+        self.assertEqual(calls, [[0, 1], [2, 3]])
+
+    async def test_short_result_fails_unmatched_callers(self):
+        async def handler(items):
+            return items[:1]
+
+        batcher = MicroBatcher('test', handler, window=0.01, max_size=10)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True), timeout=1,
+        )
+
+        self.assertEqual(results[0], 0)
+        self.assertIsInstance(results[1], RuntimeError)
+        self.assertIsInstance(results[2], RuntimeError)
+
+    async def test_get_batcher_follows_settings(self):
+        async def handler(items):
+            return items
+
+        first = get_batcher('settings-test', handler, window=0.2, max_size=10)
+        second = get_batcher('settings-test', handler, window=0.05, max_size=3)
+
+        self.assertIs(first, second)
+        self.assertEqual((second.window, second.max_size), (0.05, 3))
+
+
+class BatchClassifyTests(SimpleTestCase):
+    async def classify(self, batch_reply, contents):
+        replies = iter([batch_reply] + ['normal'] * len(contents))
+        complete = mock.AsyncMock(side_effect=lambda *args, **kwargs: next(replies))
+        with mock.patch.object(classifier, 'acomplete_route', complete):
+            labels = await classifier._aclassify_batch(contents)
+        return labels, complete
+
+    async def test_batch_reply_split_to_callers(self):
+        labels, complete = await self.classify('{"1": "urgent", "2": "ignore"}', ['线上故障', '广告'])
+
+        self.assertEqual(labels, ['urgent', 'ignore'])
+        self.assertEqual(complete.await_count, 1)
+
+    async def test_missing_labels_retried_one_by_one(self):
+        labels, complete = await self.classify('{"1": "urgent", "3": "bogus"}', ['线上故障', '吃了吗', '周末愉快'])
+
+        self.assertEqual(labels, ['urgent', 'normal', 'normal'])
+        self.assertEqual(complete.await_count, 3)
+
+    async def test_unparseable_batch_falls_back_per_item(self):
+        labels, complete = await self.classify('抱歉，我无法完成', ['a', 'b', 'c'])
+
+        self.assertEqual(labels, ['normal', 'normal', 'normal'])
+        self.assertEqual(complete.await_count, 4)
+
+
+def png_bytes(color) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@override_settings(DASHSCOPE_API_KEY='test-key', AI_IMAGE_PREPROCESS=False, AI_RECOGNIZE_CONCURRENCY=2)
+class RecognizerTests(TestCase):
+    blobs = {'https://img/a.png': b'aaa', 'https://img/b.png': b'bbb', 'https://img/c.png': b'ccc'}
+
+    async def test_concurrent_in_order_and_cached(self):
+        running = peak = 0
+
+        async def recognize(purpose, route, messages, multimodal=False):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return '描述' + messages[0]['content'][0]['image'][-5], route.model
+
+        download = mock.AsyncMock(side_effect=lambda url: self.blobs[url])
+        complete = mock.AsyncMock(side_effect=recognize)
+        with mock.patch.object(recognizer, 'adownload_image', download), \
+                mock.patch.object(recognizer, 'acomplete_route_with_model', complete):
+            first = await recognizer.arecognize_images(list(self.blobs))
+            complete.reset_mock()
+            again = await recognizer.arecognize_images(list(self.blobs))
+
+        self.assertEqual(first, ['图1: 描述a', '图2: 描述b', '图3: 描述c'])
+        self.assertEqual(peak, 2)
+        self.assertEqual(again, first)
+        complete.assert_not_awaited()
+
+    def test_sync_failure_marked_per_image(self):
+        def recognize(purpose, route, messages, multimodal=False):
+            return (None, None) if messages[0]['content'][0]['image'].endswith('b.png') else ('截图', route.model)
+
+        # 内容与上一个用例不同，避免命中它写入的识别缓存
+        blobs = {url: blob * 2 for url, blob in self.blobs.items()}
+        with mock.patch.object(recognizer, 'download_image', side_effect=lambda url: blobs[url]), \
+                mock.patch.object(recognizer, 'complete_route_with_model', side_effect=recognize):
+            results = recognizer.recognize_images(list(blobs))
+
+        self.assertEqual(results, ['图1: 截图', '图2: (识别失败)', '图3: 截图'])
+
+
+    def test_fallback_result_cached_under_answering_model(self):
+        from apps.ai.models import RecognizedImage
+
+        with mock.patch.object(recognizer, 'download_image', return_value=b'fallback'), \
+                mock.patch.object(llm, '_complete', side_effect=[(None, 'timeout'), ('降级结果', 'ok')]):
+            results = recognizer.recognize_images(['https://img/f.png'])
+
+        self.assertEqual(results, ['图1: 降级结果'])
+        row = RecognizedImage.objects.get(description='降级结果')
+        self.assertEqual(row.model, 'qwen-vl-plus')
+
+    def test_expired_entries_not_served_and_pruned(self):
+        from apps.ai.models import RecognizedImage
+
+        blob = b'expired'
+        with mock.patch.object(recognizer, 'download_image', return_value=blob), \
+                mock.patch.object(recognizer, 'complete_route_with_model', return_value=('旧结果', 'qwen-vl-max')):
+            recognizer.recognize_images(['https://img/e.png'])
+        RecognizedImage.objects.filter(description='旧结果').update(created_at=timezone.now() - timedelta(days=31))
+
+        with override_settings(AI_RECOGNIZED_IMAGE_TTL_DAYS=30), \
+                mock.patch.object(recognizer, 'download_image', return_value=blob), \
+                mock.patch.object(recognizer, 'complete_route_with_model', return_value=('新结果', 'qwen-vl-max')) as call:
+            results = recognizer.recognize_images(['https://img/e.png'])
+            call.assert_called_once()
+            self.assertEqual(results, ['图1: 新结果'])
+            RecognizedImage.objects.create(content_hash='0' * 64, model='qwen-vl-max', description='过期')
+            RecognizedImage.objects.filter(description='过期').update(created_at=timezone.now() - timedelta(days=31))
+
+            self.assertEqual(recognizer.prune_recognized_images(), 1)
+        self.assertFalse(RecognizedImage.objects.filter(description='过期').exists())
+        self.assertTrue(RecognizedImage.objects.filter(description='新结果').exists())
+
+@override_settings(DASHSCOPE_API_KEY='test-key', AI_IMAGE_PREPROCESS=True)
+class MultimodalImageReuseTests(TestCase):
+    async def test_images_downloaded_once_for_recognition_and_extraction(self):
+        blobs = {'https://img/1.png': png_bytes('red'), 'https://img/2.png': png_bytes('blue')}
+        downloads = []
+
+        async def download(url):
+            downloads.append(url)
+            return blobs[url]
+
+        recognize = mock.AsyncMock(return_value=('一张截图', 'qwen-vl-max'))
+        extract = mock.AsyncMock(return_value='[]')
+        with mock.patch.object(recognizer, 'adownload_image', download), \
+                mock.patch.object(recognizer, 'acomplete_route_with_model', recognize), \
+                mock.patch.object(extractor, 'acomplete_route', extract), \
+                mock.patch.object(extractor, 'amodel_images', mock.AsyncMock()) as refetch:
+            descriptions, prepared = await recognizer.arecognize_images_with_inputs(list(blobs))
+            tasks = await extractor.aextract_task('看图', image_urls=list(blobs), model_inputs=prepared)
+
+        self.assertEqual(descriptions, ['图1: 一张截图', '图2: 一张截图'])
+        self.assertEqual(sorted(downloads), sorted(blobs))
+        refetch.assert_not_awaited()
+        self.assertEqual(tasks, [])
+        sent = extract.await_args.args[2][0]['content']
+        self.assertEqual([item['image'] for item in sent if 'image' in item], prepared)
+        self.assertTrue(all(item.startswith('data:image/') for item in prepared))
+
+    async def test_uncached_recognition_skips_cache_and_dedupe(self):
+        from apps.ai.models import RecognizedImage
+
+        blob = png_bytes('green')
+        recognize = mock.AsyncMock(return_value=('一张截图', 'qwen-vl-max'))
+        with mock.patch.object(recognizer, 'adownload_image', mock.AsyncMock(return_value=blob)), \
+                mock.patch.object(recognizer, 'acomplete_route_with_model', recognize):
+            await recognizer.arecognize_images(['https://img/a.png', 'https://img/a.png'])
+            self.assertEqual(recognize.await_count, 1)
+            stored = await RecognizedImage.objects.acount()
+
+            recognize.reset_mock()
+            await recognizer.arecognize_images_with_inputs(
+                ['https://img/a.png', 'https://img/a.png'], keep_inputs=False, use_cache=False,
+            )
+            self.assertEqual(recognize.await_count, 2)
+            self.assertEqual(await RecognizedImage.objects.acount(), stored)
+
+
+@override_settings(AI_MODEL_ROUTES={}, AI_MODEL_FALLBACKS={}, AI_MODEL_FALLBACK_ENABLED=True)
+class RoutingTests(SimpleTestCase):
+    def test_recognized_image_text_uses_plus(self):
+        self.assertEqual(routing.select('extract_task', chars=1200).model, 'qwen-max')
+        self.assertEqual(routing.select('extract_task', chars=1200, recognized=2).model, 'qwen-plus')
+        # 图片本身仍要发送时走多模态模型
+        self.assertEqual(routing.select('extract_task', chars=1200, images=2, recognized=2).model, 'qwen-vl-max')
+
+    @override_settings(DASHSCOPE_API_KEY='test')
+    async def test_reuse_mode_extraction_routes_by_recognized_images(self):
+        extract = mock.AsyncMock(return_value='[]')
+        with mock.patch.object(extractor, 'acomplete_route', extract):
+            await extractor.aextract_task('看图\n\n' + '识别文字' * 200, recognized_images=3)
+
+        self.assertEqual(extract.await_args.args[1].model, 'qwen-plus')
+
+    def test_rules_match_in_order_by_chars_and_images(self):
+        self.assertEqual(routing.select('classify_message', chars=50).models, ['qwen-turbo', 'qwen-plus'])
+        self.assertEqual(routing.select('classify_message', chars=500).models, ['qwen-plus', 'qwen-turbo'])
+        self.assertEqual(routing.select('extract_task', chars=100).model, 'qwen-plus')
+        self.assertEqual(routing.select('extract_task', chars=100, images=1).models, ['qwen-vl-max', 'qwen-vl-plus'])
+
+    @override_settings(AI_MODEL_ROUTES={'classify_message': [{'max_chars': 10, 'model': 'qwen-turbo', 'timeout': 3},
+                                                             {'model': 'qwen-max'}]},
+                       AI_MODEL_FALLBACKS={'qwen-vl-max': ['qwen-plus', 'qwen-vl-plus']})
+    def test_settings_override_routes_and_fallbacks(self):
+        short = routing.select('classify_message', chars=5)
+        self.assertEqual((short.model, short.timeout), ('qwen-turbo', 3))
+        self.assertEqual(routing.select('classify_message', chars=50).models, ['qwen-max', 'qwen-plus'])
+        # 有图片时不会降级到纯文本模型
+        self.assertEqual(routing.select('recognize_image', images=1).models, ['qwen-vl-max', 'qwen-vl-plus'])
+
+    @override_settings(AI_MODEL_FALLBACK_ENABLED=False)
+    def test_fallback_can_be_disabled(self):
+        self.assertEqual(routing.select('classify_message', chars=50).models, ['qwen-turbo'])
+
+
+@override_settings(AI_MODEL_ROUTES={}, AI_MODEL_FALLBACKS={}, AI_MODEL_FALLBACK_ENABLED=True)
+class RouteFallbackTests(SimpleTestCase):
+    def setUp(self):
+        routing._stats.clear()
+        self.addCleanup(routing._stats.clear)
+
+    async def test_falls_back_when_primary_times_out(self):
+        route = routing.select('classify_message', chars=50)
+        call = mock.AsyncMock(side_effect=[(None, 'timeout'), ('normal', 'ok')])
+        with mock.patch.object(llm, '_acomplete', call):
+            text = await llm.acomplete_route('消息分类', route, [])
+
+        self.assertEqual(text, 'normal')
+        self.assertEqual([c.args[1] for c in call.await_args_list], ['qwen-turbo', 'qwen-plus'])
+        stats = routing.route_stats()
+        self.assertEqual(stats['classify_message/qwen-turbo']['timeouts'], 1)
+        self.assertEqual(stats['classify_message/qwen-turbo']['fallbacks'], 0)
+        self.assertEqual(stats['classify_message/qwen-plus']['calls'], 1)
+        self.assertEqual(stats['classify_message/qwen-plus']['fallbacks'], 1)
+
+    def test_all_models_failing_returns_none(self):
+        route = routing.select('analyze_article')
+        with mock.patch.object(llm, '_complete', return_value=(None, 'error')) as call:
+            self.assertIsNone(llm.complete_route('文章分析', route, []))
+
+        self.assertEqual(call.call_count, 2)
+        stats = routing.route_stats()
+        self.assertEqual(stats['analyze_article/qwen-plus']['errors'], 1)
+        self.assertEqual(stats['analyze_article/qwen-turbo']['errors'], 1)
+
+    def test_stats_latency_percentiles(self):
+        for ms in range(1, 101):
+            routing.record('generate_reply', 'qwen-turbo', ms / 1000, 'ok')
+
+        stats = routing.route_stats()['generate_reply/qwen-turbo']
+        self.assertEqual(stats['calls'], 100)
+        self.assertEqual((stats['p50_ms'], stats['p95_ms']), (51, 96))
+        self.assertEqual((stats['errors'], stats['timeouts'], stats['fallbacks']), (0, 0, 0))
+
+
+def jpeg_bytes(size, exif=None) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, format='JPEG', exif=exif or b'')
+    return buffer.getvalue()
+
+
+@override_settings(AI_IMAGE_PREPROCESS=True, AI_IMAGE_MAX_EDGE=1600, AI_IMAGE_FORMAT='JPEG',
+                   AI_IMAGE_TILE_RATIO=3.0, AI_IMAGE_MAX_TILES=4)
+class PrepareImageTests(SimpleTestCase):
+    def open(self, data):
+        from PIL import Image
+
+        return Image.open(io.BytesIO(data))
+
+    def test_downscales_past_limit(self):
+        tiles = images.prepare_image(jpeg_bytes((4000, 3000)))
+
+        self.assertEqual(len(tiles), 1)
+        self.assertEqual(self.open(tiles[0]).size, (1600, 1200))
+
+    def test_passthrough_under_limit(self):
+        tiles = images.prepare_image(png_bytes('red'))
+
+        self.assertEqual(len(tiles), 1)
+        img = self.open(tiles[0])
+        self.assertEqual((img.format, img.size), ('JPEG', (40, 30)))
+
+    def test_tall_image_tiled_with_overlap(self):
+        tiles = [self.open(tile) for tile in images.prepare_image(jpeg_bytes((500, 4000)))]
+
+        # 每块高 = 宽 × 3，相邻两块重叠 TILE_OVERLAP，最后一块到底
+        step = 1500 - images.TILE_OVERLAP
+        self.assertEqual([tile.size for tile in tiles], [(500, 1500), (500, 1500), (500, 4000 - 2 * step)])
+
+    @override_settings(AI_IMAGE_MAX_EDGE=200)
+    def test_very_tall_image_capped_at_max_tiles(self):
+        tiles = [self.open(tile) for tile in images.prepare_image(jpeg_bytes((400, 8000)))]
+
+        # 宽度先缩到 200（高 4000），均分成 4 块后每块仍超过最长边，再等比缩小
+        self.assertEqual(len(tiles), 4)
+        self.assertTrue(all(tile.size[1] == 200 and tile.size[0] < 200 for tile in tiles))
+
+    def test_exif_applied_then_stripped(self):
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: 顺时针旋转 90°
+        exif[0x010F] = 'TestCamera'
+        tiles = images.prepare_image(jpeg_bytes((400, 300), exif=exif.tobytes()))
+
+        img = self.open(tiles[0])
+        self.assertEqual(img.size, (300, 400))
+        self.assertEqual(dict(img.getexif()), {})
+
+    def test_image_inputs_falls_back_to_url(self):
+        url = 'https://img/broken.png'
+        self.assertEqual(images.image_inputs(url, b'not an image')['inputs'], [url])
+        with override_settings(AI_IMAGE_PREPROCESS=False):
+            self.assertEqual(images.image_inputs(url, png_bytes('blue'))['inputs'], [url])
+
+        result = images.image_inputs(url, png_bytes('blue'))
+        self.assertTrue(result['inputs'][0].startswith('data:image/jpeg;base64,'))
+        self.assertGreater(result['sent_bytes'], 0)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ChannelUser, Message
+from .models import ChannelUser, Message, PageCache
 
 
 @admin.register(ChannelUser)
@@ -15,3 +15,9 @@ class MessageAdmin(admin.ModelAdmin):
     list_filter = ['platform', 'direction', 'ai_classification', 'processed']
     search_fields = ['content']
     readonly_fields = ['created_at']
+
+
+@admin.register(PageCache)
+class PageCacheAdmin(admin.ModelAdmin):
+    list_display = ['title', 'url', 'size', 'validated_at', 'accessed_at']
+    search_fields = ['title', 'url']
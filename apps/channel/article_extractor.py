@@ -0,0 +1,251 @@
+"""基于 lxml 的单遍文章提取器。
+
+一次遍历 DOM 同时拿到标题、发布时间、来源和正文：
+- <head> 中的 meta 标签（og:title / article:published_time / og:site_name 等）
+- <script> 中的微信时间戳 (create_time / ct) 和公众号名称，只在脚本文本里匹配，不扫描整页 HTML
+- 正文跳过脚本、导航、页脚、分享栏等模板区域，并丢弃以链接为主的短行（导航菜单、标签云）
+- 页面存在 <article> / <main> / 公众号 js_content 等正文容器时，只保留容器内的文本
+
+钉钉和企业微信两条链路共用这里的实现。
+"""
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+
+import lxml.html
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+SKIP_TAGS = frozenset({
+    'style', 'noscript', 'iframe', 'svg', 'canvas', 'nav', 'footer', 'aside',
+    'form', 'button', 'select', 'textarea', 'template', 'object', 'embed',
+})
+
+BLOCK_TAGS = frozenset({
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'section', 'article', 'main', 'header', 'blockquote', 'pre',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'tr', 'td', 'th', 'table', 'dd', 'dt', 'figure', 'figcaption', 'hr',
+})
+
+# 完整匹配 class / id 中的某个 token，避免误伤 js_share_content 之类的正文容器
+BOILERPLATE_TOKEN_RE = re.compile(
+    r'^(nav|navbar|navigation|menu|footer|site-footer|site-header|sidebar|side-bar|share|share-box|'
+    r'comments?|copyright|cookies?|cookie-banner|banner|breadcrumbs?|toolbar|ads?|advert\w*|'
+    r'related\w*|recommend\w*)$',
+    re.I,
+)
+MAIN_TOKEN_RE = re.compile(
+    r'^(js_content|article_content|article-content|post-content|entry-content|markdown-body|'
+    r'article-body|rich_media_content)$',
+    re.I,
+)
+
+WECHAT_TIME_RE = re.compile(r'create_time\s*[=:]\s*"([^"]+)"|\bct\s*=\s*"(\d{10})"')
+WECHAT_NICKNAME_RE = re.compile(r'\bnickname\s*=\s*(?:htmlDecode\()?"([^"]+)"')
+DATE_RE = re.compile(r'\b(20[12]\d[-/年](?:0?[1-9]|1[012])[-/月](?:0?[1-9]|[12][0-9]|3[01])日?)')
+WHITESPACE_RE = re.compile(r'\s+')
+
+TITLE_META_KEYS = ('og:title', 'twitter:title')
+TIME_META_KEYS = (
+    'article:published_time', 'og:article:published_time', 'publishdate', 'pubdate',
+    'publish_date', 'datepublished',
+)
+SOURCE_META_KEYS = ('og:site_name', 'application-name', 'author')
+
+# 以链接文字为主且很短的行视为导航/标签
+LINK_LINE_MAX_CHARS = 40
+LINK_LINE_RATIO = 0.8
+MIN_MAIN_CHARS = 200
+
+
+def normalize_publish_date(value) -> str | None:
+    """把各种来源的发布时间统一为带时区的 ISO 8601 字符串，无法识别时返回 None。"""
+    if not value:
+        return None
+    value = str(value).strip()
+
+    # 微信的 Unix 时间戳是 UTC 时间，转换为北京时间 (UTC+8)
+    if value.isdigit() and len(value) == 10:
+        return datetime.fromtimestamp(int(value), tz=timezone.utc).astimezone(BEIJING_TZ).isoformat()
+
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=BEIJING_TZ)
+        return dt.isoformat()
+    except ValueError:
+        pass
+
+    match = DATE_RE.search(value)
+    if match:
+        raw_date = match.group(1).replace('年', '-').replace('月', '-').replace('日', '').replace('/', '-')
+        try:
+            return datetime.strptime(raw_date, "%Y-%m-%d").replace(tzinfo=BEIJING_TZ).isoformat()
+        except ValueError:
+            return None
+    return None
+
+
+def _tokens(el):
+    classes = el.get('class')
+    tokens = classes.split() if classes else []
+    el_id = el.get('id')
+    if el_id:
+        tokens.append(el_id)
+    return tokens
+
+
+class _TextCollector:
+    """按行收集文本，同时统计每行的链接文字占比和是否位于正文容器内。"""
+
+    def __init__(self):
+        self.lines = []
+        self.parts = []
+        self.chars = 0
+        self.link_chars = 0
+        self.in_main = False
+
+    def add(self, text, in_link, in_main):
+        text = WHITESPACE_RE.sub(' ', text)
+        if not text.strip():
+            return
+        self.parts.append(text)
+        length = len(text.strip())
+        self.chars += length
+        if in_link:
+            self.link_chars += length
+        self.in_main = self.in_main or in_main
+
+    def newline(self):
+        if not self.parts:
+            return
+        line = ''.join(self.parts).strip()
+        link_only = (self.chars <= LINK_LINE_MAX_CHARS and self.link_chars >= self.chars * LINK_LINE_RATIO)
+        if line and not link_only:
+            self.lines.append((line, self.in_main))
+        self.parts = []
+        self.chars = self.link_chars = 0
+        self.in_main = False
+
+    def text(self):
+        self.newline()
+        main_lines = [line for line, in_main in self.lines if in_main]
+        if sum(len(line) for line in main_lines) >= MIN_MAIN_CHARS:
+            return '\n'.join(main_lines)
+        return '\n'.join(line for line, _ in self.lines)
+
+
+def extract_article(html, url: str = '') -> dict:
+    """从 HTML 中提取 {'title', 'publish_date', 'source', 'content'}。"""
+    result = {'title': None, 'publish_date': None, 'source': None, 'content': ''}
+    if not html:
+        return result
+
+    if isinstance(html, str) and html.lstrip().startswith('<?xml'):
+        # 带编码声明的 XML 头在 str 输入下会被 lxml 拒绝
+        html = html.split('?>', 1)[-1]
+
+    try:
+        # libxml2 默认嵌套超过 256 层就停止解析，整页正文都会丢失；huge_tree 取消这个限制（页面大小由抓取层限制）
+        root = lxml.html.fromstring(html, parser=lxml.html.HTMLParser(huge_tree=True))
+    except (etree.ParserError, ValueError) as e:
+        logger.warning("HTML 解析失败 %s: %s", url, e)
+        return result
+
+    meta = {}
+    title_text = None
+    script_time = None
+    script_source = None
+    source_element_text = None
+    collector = _TextCollector()
+
+    link_depth = 0
+    main_depth = 0
+    # 显式栈做深度优先遍历，避免深层嵌套的页面触发递归上限
+    stack = [(root, False, False)]
+    while stack:
+        el, leaving, is_main = stack.pop()
+        tag = el.tag
+
+        if leaving:
+            if tag == 'a':
+                link_depth -= 1
+            if is_main:
+                main_depth -= 1
+            if tag in BLOCK_TAGS:
+                collector.newline()
+            if el.tail:
+                collector.add(el.tail, link_depth > 0, main_depth > 0)
+            continue
+
+        if not isinstance(tag, str):
+            # 注释 / 处理指令，只保留尾随文本
+            if el.tail:
+                collector.add(el.tail, link_depth > 0, main_depth > 0)
+            continue
+
+        if tag == 'meta':
+            key = (el.get('property') or el.get('name') or el.get('itemprop') or '').lower()
+            content = el.get('content')
+            if key and content and key not in meta:
+                meta[key] = content.strip()
+        elif tag == 'title':
+            if title_text is None and el.text:
+                title_text = el.text.strip()
+        elif tag == 'script':
+            script = el.text or ''
+            if script_time is None:
+                match = WECHAT_TIME_RE.search(script)
+                if match:
+                    script_time = match.group(1) or match.group(2)
+            if script_source is None:
+                match = WECHAT_NICKNAME_RE.search(script)
+                if match:
+                    script_source = match.group(1)
+
+        tokens = _tokens(el) if tag not in ('meta', 'title', 'script') else None
+        if tokens is None or tag in SKIP_TAGS or any(BOILERPLATE_TOKEN_RE.match(t) for t in tokens):
+            # meta / title / script 以及模板区域不进入正文，只保留尾随文本
+            if el.tail:
+                collector.add(el.tail, link_depth > 0, main_depth > 0)
+            continue
+
+        if source_element_text is None and 'js_name' in tokens:
+            source_element_text = el.text_content().strip() or None
+
+        if tag in BLOCK_TAGS:
+            collector.newline()
+        if tag == 'a':
+            link_depth += 1
+        is_main = tag in ('article', 'main') or el.get('itemprop') == 'articleBody' or any(MAIN_TOKEN_RE.match(t) for t in tokens)
+        if is_main:
+            main_depth += 1
+        if el.text:
+            collector.add(el.text, link_depth > 0, main_depth > 0)
+
+        stack.append((el, True, is_main))
+        stack.extend((child, False, False) for child in reversed(el))
+
+    result['title'] = next((meta[k] for k in TITLE_META_KEYS if meta.get(k)), None) or title_text or None
+
+    publish_date = None
+    for key in TIME_META_KEYS:
+        publish_date = normalize_publish_date(meta.get(key))
+        if publish_date:
+            break
+    if not publish_date and script_time:
+        publish_date = normalize_publish_date(script_time)
+
+    content = collector.text()
+    if not publish_date:
+        # 兜底：正文中形如 "2024-02-27" / "2024年2月27日" 的日期
+        match = DATE_RE.search(content)
+        if match:
+            publish_date = normalize_publish_date(match.group(1))
+
+    result['publish_date'] = publish_date
+    result['source'] = source_element_text or script_source or next((meta[k] for k in SOURCE_META_KEYS if meta.get(k)), None)
+    result['content'] = content
+    return result
@@ -0,0 +1,24 @@
+"""在线程池里执行阻塞调用。"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections
+
+
+def run_blocking(func):
+    """把阻塞调用（Notion、ORM 读写）放到独立线程执行。
+
+    sync_to_async 默认 thread_sensitive=True，所有调用会排队在同一个线程里，
+    多个调用并发时就又退化成了串行，所以这里显式关闭。
+    线程池里的线程不会走请求结束的清理，所以调用前后自行清理该线程的数据库连接，
+    避免连接泄漏或复用已断开的连接。
+    """
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+
+    return sync_to_async(run, thread_sensitive=False)
@@ -1,25 +1,71 @@
+import asyncio
 import json
 import logging
 import re
+import time
 
-import httpx
-from bs4 import BeautifulSoup
 from dingtalk_stream import AckMessage, ChatbotHandler
 
+from apps.channel import idempotency
+from apps.channel.tracing import annotate, finish_trace, span, start_trace
 from apps.channel.models import ChannelUser, Message
-from apps.ai.classifier import classify_message, classify_article
-from apps.ai.extractor import extract_task
-from apps.ai.responder import generate_reply
+from apps.ai.classifier import aclassify_message_with_source
+from apps.ai.extractor import aextract_task, image_task_mode, task_image_urls
+from apps.ai.llm import StreamError
+from apps.ai.responder import agenerate_reply, astream_reply
 from apps.todo.models import Task
-from apps.todo.notion_client import save_link_to_knowledge_base
+
+from .cards import StreamingCard, streaming_enabled
+from .links import ingest_urls
+from .worker import MessageWorkerPool
 
 logger = logging.getLogger(__name__)
 
+STREAM_INTERRUPTED_NOTE = '\n\n（回复生成中断，内容可能不完整）'
+
 
 class YgaiBotHandler(ChatbotHandler):
     """处理钉钉机器人收到的消息"""
 
+    def __init__(self, async_ack=False, workers=4, queue_size=100):
+        super().__init__()
+        # async_ack 模式下回调立即 ack，消息交给后台 worker 池处理
+        self.async_ack = async_ack
+        self.pool = MessageWorkerPool(self.handle_message, workers=workers, queue_size=queue_size) if async_ack else None
+
     async def process(self, callback):
+        if not self.async_ack:
+            return await self.handle_message(callback)
+
+        if not self.pool.submit(callback):
+            try:
+                self.reply_text('当前消息较多，请稍后重新发送。', callback)
+            except Exception:
+                logger.exception("回复队列已满提示失败")
+        return AckMessage.STATUS_OK, 'OK'
+
+    async def handle_message(self, callback):
+        """完整的消息处理流水线，结果通过 sessionWebhook 回复。
+
+        同一 msgId 的重复投递如果第一次还在处理中，等待其完成后直接 ack，不重复处理。
+        """
+        msg_id = (callback.data or {}).get('msgId', '')
+        pending = idempotency.begin('dingtalk', msg_id)
+        if pending is not None:
+            logger.info("消息 %s 正在处理中，等待第一次处理完成", msg_id)
+            return await asyncio.shield(pending)
+
+        result = (AckMessage.STATUS_OK, 'OK')
+        # 以 msgId 作为关联 ID 记录各阶段耗时（MESSAGE_TRACE_ENABLED 开启时）
+        trace = start_trace('dingtalk', msg_id)
+        try:
+            result = await self._handle_message(callback)
+        finally:
+            idempotency.finish('dingtalk', msg_id, result)
+            finish_trace(trace)
+        return result
+
+    async def _handle_message(self, callback):
         try:
             from django.db import close_old_connections
             close_old_connections()
@@ -87,6 +133,7 @@ class YgaiBotHandler(ChatbotHandler):
                 return AckMessage.STATUS_OK, 'OK'
 
             logger.info("收到消息 from %s: %s (附带 %d 张图片)", sender_nick, text, len(download_codes))
+            annotate(msgtype=msgtype, chars=len(text), images=len(download_codes))
 
             # 1. 如果是群聊中@机器人，钉钉会将@机器人的文本也带过来（如 "@YGAI 帮我写个请假条"）
             clean_text = text
@@ -96,255 +143,59 @@ class YgaiBotHandler(ChatbotHandler):
                     at_dingtalk_id = at_user.get('dingtalkId')
                     clean_text = clean_text.replace(f'@{at_dingtalk_id}', '').strip()
 
-            # URL 提取与信息获取
+            # 2. 识别/创建渠道用户
+            with span('channel_user'):
+                channel_user, _ = await sync_to_async(ChannelUser.objects.get_or_create)(
+                    platform='dingtalk',
+                    platform_user_id=sender_id,
+                    defaults={'name': sender_nick},
+                )
+
+            # 在任何耗时操作之前先保存原始消息，msgId 已存在说明是重复投递
+            with span('claim_message'):
+                message = await sync_to_async(idempotency.claim_message)(
+                    channel_user=channel_user,
+                    platform='dingtalk',
+                    content=text,
+                    message_type=msg_record_type,
+                    direction='inbound',
+                    platform_message_id=msg_id,
+                )
+            if message is None:
+                return AckMessage.STATUS_OK, 'OK'
+
+            # URL 提取与信息获取（多个链接并发处理，结果保持原始顺序）
             urls = re.findall(r'https?://[^\s\u4e00-\u9fff<>"\'\n\r]+', clean_text)
-            url_infos = []
             if urls:
-                logger.info("检测到 %d 个 URL，准备开始处理: %s", len(urls), urls)
-                async with httpx.AsyncClient(timeout=30.0, follow_redirects=True, headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'}) as client:
-                    for url in urls:
-                        logger.info("开始处理 URL: %s", url)
-                        # 检查链接是否已经存在
-                        from apps.todo.notion_client import check_link_exists_in_knowledge_base
-                        logger.info("正在查询 Notion 判断 URL 是否已存在: %s", url)
-                        existing_info = await sync_to_async(check_link_exists_in_knowledge_base)(url)
-                        if existing_info and existing_info.get("exists"):
-                            logger.info("URL 已存在于知识库，跳过抓取与保存: %s", url)
-                            url_infos.append({
-                                "url": url,
-                                "title": existing_info["title"],
-                                "category": existing_info["category"],
-                                "rating": existing_info["rating"],
-                                "summary": existing_info["summary"],
-                                "is_existing": True
-                            })
-                            continue
-
-                        title = url
-                        publish_date = None
-                        response = None
-                        content_text = ""
-
-                        # 检查是否是小红书链接
-                        is_xiaohongshu = "xiaohongshu.com" in url or "xhslink.com" in url
-
-                        if is_xiaohongshu:
-                            logger.info("检测到小红书链接，尝试使用 Cookie 无头提取模式...")
-                            import os
-                            import json
-                            
-                            # 尝试获取小红书 Cookie 环境变量，请在 .env 中配置，否则可能提不到正文
-                            from django.conf import settings
-                            xhs_cookie = getattr(settings, 'XIAOHONGSHU_COOKIE', os.environ.get('XIAOHONGSHU_COOKIE', ''))
-
-                            # 注意：必须传入正确的请求头，且 Cookie 不能为空！
-                            xhs_headers = {
-                                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-                            }
-                            if xhs_cookie:
-                                xhs_headers['Cookie'] = xhs_cookie
-                                logger.info(f"成功读取配置的小红书 Cookie: {xhs_cookie[:15]}...")
-                            else:
-                                logger.warning("未配置小红书 Cookie，将以游客身份访问，很可能被拦截")
-
-                            title = "小红书分享"
-                            content_text = "由于未配置有效的 Cookie 或该笔记已被删除/隐藏/需验证身份，无法读取正文。"
-
-                            try:
-                                import urllib.parse
-                                # 解析URL参数
-                                parsed_url = urllib.parse.urlparse(url)
-                                qs = urllib.parse.parse_qs(parsed_url.query)
-
-                                # 极其重要：
-                                # 1. 必须清洗掉分享链接带来的身份追踪后果 (app_platform, share_channel等)
-                                # 2. 但对于视频或深度加密笔记，必须保留 xsec_token 和 xsec_source，否则后端判定无权访问
-                                keep_qs = {}
-                                if 'xsec_token' in qs:
-                                    keep_qs['xsec_token'] = qs['xsec_token'][0]
-                                if 'xsec_source' in qs:
-                                    keep_qs['xsec_source'] = qs['xsec_source'][0]
-
-                                pure_base_url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
-                                safe_url = pure_base_url + "?" + urllib.parse.urlencode(keep_qs) if keep_qs else pure_base_url
-
-                                logger.info(f"构造安全小红书链接 (去除追踪，保留验证): {safe_url}")
-
-                                # 注意！！！客户端本身可能自带了全局 header，我们用全新的独立的客户端去请求
-                                async with httpx.AsyncClient(timeout=15.0, follow_redirects=True) as isolated_client:
-                                    xhs_response = await isolated_client.get(safe_url, headers=xhs_headers)
-
-                                # 使用正则提取 window.__INITIAL_STATE__ 数据字典
-                                match = re.search(r'window\.__INITIAL_STATE__=({.*?})</script>', xhs_response.text)
-                                if match:
-                                    json_str = match.group(1).replace('undefined', 'null')
-                                    try:
-                                        data = json.loads(json_str)
-                                        note_details = data.get('note', {}).get('noteDetailMap', {})
-                                        
-                                        # 如果键值里只有 'null'，意味着风控拦截或者笔记不存在
-                                        if note_details and 'null' not in note_details.keys():
-                                            first_key = list(note_details.keys())[0]
-                                            note_info = note_details[first_key].get('note', {})
-                                            
-                                            extracted_title = note_info.get('title', '')
-                                            extracted_desc = note_info.get('desc', '')
-                                            
-                                            if extracted_title:
-                                                title = extracted_title
-                                            if extracted_desc:
-                                                content_text = extracted_desc
-                                            
-                                            logger.info(f"成功突破小红书防线并提取正文：{title[:20]}...")
-                                        else:
-                                            logger.info("小红书访问成功，但返回的笔记状态为空，可能已被删除或该链接 Cookie 无权访问。")
-                                    except Exception as json_err:
-                                        logger.warning(f"解析小红书 JSON 失败: {json_err}")
-                                else:
-                                    logger.warning("未找到小红书 __INITIAL_STATE__。Cookie 已失效、被拦截或链接访问不合法。")
-                            except Exception as e:
-                                logger.error(f"小红书无头请求异常: {e}")
-                        else:
-                            logger.info("准备发起 HTTP GET 请求抓取网页内容: %s", url)
-                            import asyncio
-                            for attempt in range(3):
-                                try:
-                                    response = await client.get(url)
-                                    logger.info("HTTP GET 请求成功! URL: %s, 状态码: %s, 尝试次数: %d", url, response.status_code, attempt + 1)
-                                    break
-                                except Exception as e:
-                                    logger.warning("HTTP GET 请求失败 (尝试 %d/3) %s: %s", attempt + 1, url, e)
-                                    if attempt < 2:
-                                        logger.info("等待 2 秒后重试...")
-                                        await asyncio.sleep(2)
-                                    else:
-                                        logger.error("HTTP GET 请求彻底失败 URL: %s", url)
-
-                            try:
-                                if response and response.status_code == 200:
-                                    logger.info("开始解析网页内容...")
-                                    soup = BeautifulSoup(response.text, 'html.parser')
-
-                                    # 1. 尝试获取标题
-                                    # 微信文章的真实标题一般在 meta 标签中，优先取 og:title
-                                    og_title = soup.find('meta', property='og:title')
-                                    if og_title and og_title.get('content'):
-                                        title = og_title['content'].strip()
-                                    elif soup.title and soup.title.string:
-                                        title = soup.title.string.strip()
-
-                                    # 2. 尝试获取文章发布时间
-                                    # 从 Open Graph 获取
-                                    og_time = soup.find('meta', property='article:published_time') or soup.find('meta', property='og:article:published_time')
-                                    if og_time and og_time.get('content'):
-                                        publish_date = og_time['content'].strip()
-                                    else:
-                                        # 从常见的 meta name 获取
-                                        meta_time = soup.find('meta', attrs={'name': 'publishdate'}) or soup.find('meta', attrs={'name': 'pubdate'})
-                                        if meta_time and meta_time.get('content'):
-                                            publish_date = meta_time['content'].strip()
-                                        else:
-                                            # 特殊处理微信文章的发布时间 (微信页面中通常有一个特定属性或注释，这里尝试获取 js 变量)
-                                            time_match = re.search(r'create_time\s*=\s*"([^"]+)"', response.text) or re.search(r'ct\s*=\s*"(\d{10})"', response.text)
-                                            if time_match:
-                                                time_val = time_match.group(1)
-                                                if time_val.isdigit() and len(time_val) == 10:
-                                                    from datetime import datetime, timezone, timedelta
-                                                    # 微信的 Unix 时间戳已经是 UTC 时间，将其转换为北京时间 (UTC+8) 的带时区格式
-                                                    # 先获取 UTC 的 datetime 对象
-                                                    dt_utc = datetime.fromtimestamp(int(time_val), tz=timezone.utc)
-                                                    # 再转换为北京时间的 datetime 对象
-                                                    dt_beijing = dt_utc.astimezone(timezone(timedelta(hours=8)))
-                                                    publish_date = dt_beijing.isoformat()
-                                                else:
-                                                    publish_date = time_val
-                                            else:
-                                                # 如果找不到任何时间，对于非微信的文章也尝试用正则抓取类似 "2024-02-27" 这样的日期
-                                                date_match = re.search(r'\b(20[12]\d[-/年](0?[1-9]|1[012])[-/月](0?[1-9]|[12][0-9]|3[01])[日]?)\b', response.text)
-                                                if date_match:
-                                                    import datetime as dt_lib
-                                                    raw_date = date_match.group(1).replace('年', '-').replace('月', '-').replace('日', '').replace('/', '-')
-                                                    try:
-                                                        # 尝试转换为标准的带时区 ISO 格式
-                                                        parsed_date = dt_lib.datetime.strptime(raw_date, "%Y-%m-%d")
-                                                        publish_date = parsed_date.replace(tzinfo=dt_lib.timezone(dt_lib.timedelta(hours=8))).isoformat()
-                                                    except ValueError:
-                                                        publish_date = raw_date
-
-                                    content_text = soup.get_text(separator='\n', strip=True)
-                            except Exception as e:
-                                logger.warning("获取 URL 标题或时间失败 %s: %s", url, e)
-
-                        logger.info("准备进行 AI 分析分类: %s", title)
-                        category = await sync_to_async(classify_article)(title)
-                        logger.info("AI 分类完毕: %s", category)
-
-                        # 使用 AI 进行深度分析：提取真实来源、评分、概要
-                        logger.info("准备调用 AI 分析网页全文内容")
-                        from apps.ai.classifier import analyze_article_content
-                        analysis_result = await sync_to_async(analyze_article_content)(title, url, content_text)
-                        logger.info("AI 分析网页全文内容完毕")
-
-                        source = analysis_result.get("source", sender_nick)
-                        if source == "未知来源":
-                            source = sender_nick
-
-                        rating = analysis_result.get("rating", "⭐⭐⭐")
-                        summary = analysis_result.get("summary", "暂无摘要")
-
-                        logger.info("AI 网页分析结果 - URL: %s | 标题: %s | 分类: %s | 发布时间: %s | 来源: %s | 评分: %s",
-                                    url, title, category, publish_date, source, rating)
-
-                        try:
-                            await sync_to_async(save_link_to_knowledge_base)(url, title, source, category, publish_date, rating, summary)
-                            url_infos.append({
-                                "url": url,
-                                "title": title,
-                                "category": category,
-                                "rating": rating,
-                                "summary": summary
-                            })
-                        except Exception as e:
-                            logger.error("保存 URL 到 Notion 失败 %s: %s", url, e)
-
-            # 2. 识别/创建渠道用户
-            channel_user, _ = await sync_to_async(ChannelUser.objects.get_or_create)(
-                platform='dingtalk',
-                platform_user_id=sender_id,
-                defaults={'name': sender_nick},
-            )
+                with span('urls', count=len(urls)):
+                    url_infos = await ingest_urls(urls, sender_nick)
+            else:
+                url_infos = []
 
             # 3. 准备图片 URLs (多张图片)
             image_urls = []
             if download_codes:
-                from .utils import get_download_url
-                for code in download_codes:
-                    url = await get_download_url(code, incoming.get('robotCode', ''))
-                    if url:
-                        image_urls.append(url)
-
-            # 4. 保存原始消息
-            # 如果是多张图片，我们将 URLs 用逗号连接存入数据库
-            saved_content = text
-            if msgtype == 'picture':
-                saved_content = ",".join(image_urls) if image_urls else text
-
-            message = await sync_to_async(Message.objects.create)(
-                channel_user=channel_user,
-                platform='dingtalk',
-                content=saved_content,
-                message_type=msg_record_type,
-                direction='inbound',
-                platform_message_id=msg_id,
-            )
-
-            # 5. 逐张识别图片内容
+                from .utils import resolve_download_urls
+                with span('resolve_images', count=len(download_codes)):
+                    resolved = await resolve_download_urls(download_codes, incoming.get('robotCode', ''))
+                image_urls = [item['url'] for item in resolved if item['url']]
+
+            # 4. 纯图片消息把图片 URLs 用逗号连接存入数据库
+            if msgtype == 'picture' and image_urls:
+                message.content = ",".join(image_urls)
+                await sync_to_async(message.save)(update_fields=['content'])
+
+            # 5. 逐张识别图片内容（merged 模式下图片只在提取任务时发送一次，这里跳过）
+            image_mode = image_task_mode()
             image_descriptions = []
-            if image_urls:
-                from apps.ai.recognizer import recognize_images
-                image_descriptions = await sync_to_async(recognize_images)(image_urls)
+            prepared_images = None
+            if image_urls and image_mode != 'merged':
+                from apps.ai.recognizer import arecognize_images_with_inputs
+                with span('recognize_images', count=len(image_urls)):
+                    # multimodal 模式下识别时预处理好的图片直接用于任务提取，每张图片只下载一次
+                    image_descriptions, prepared_images = await arecognize_images_with_inputs(
+                        image_urls, keep_inputs=image_mode == 'multimodal',
+                    )
                 logger.info("图片识别结果: %s", image_descriptions)
 
             # 6. AI 分类 (将图片识别文本拼入，让分类更准确)
@@ -354,23 +205,37 @@ class YgaiBotHandler(ChatbotHandler):
                 full_text = clean_text
 
             if not full_text:
-                classification = 'important'
+                classification, classification_source = 'important', 'default'
             else:
-                classification = await sync_to_async(classify_message)(full_text)
+                with span('classify') as classify_span:
+                    classification, classification_source = await aclassify_message_with_source(full_text)
+                    classify_span.set(source=classification_source)
+
+            if image_urls and image_mode == 'merged' and classification not in ('urgent', 'important'):
+                # merged 模式下分类看不到图片内容，图片消息统一交给任务提取判断
+                classification, classification_source = 'important', 'default'
 
             message.ai_classification = classification
-            message.processed = True
-            await sync_to_async(message.save)(update_fields=['ai_classification', 'processed'])
+            message.classification_source = classification_source
+            message.classification_input = full_text
+            with span('save_message'):
+                await sync_to_async(message.save)(
+                    update_fields=['ai_classification', 'classification_source', 'classification_input'],
+                )
             logger.info("AI 分类结果: %s", classification)
+            annotate(classification=classification)
 
             is_group = incoming.get('conversationType') == '2'
+            # 流式卡片已经把回复展示给用户时，不再重复发送文本
+            replied = False
 
             # 7. 根据分类处理
             if classification in ('urgent', 'important'):
-                if image_urls:
-                    task_info_list = await sync_to_async(extract_task)(full_text, image_urls=image_urls, sender_name=sender_nick)
-                else:
-                    task_info_list = await sync_to_async(extract_task)(full_text, sender_name=sender_nick)
+                with span('extract_task'):
+                    task_info_list = await aextract_task(
+                        full_text, image_urls=task_image_urls(image_urls, image_mode), sender_name=sender_nick,
+                        model_inputs=prepared_images, recognized_images=len(image_descriptions),
+                    )
 
                 # 如果提取出的是单个字典，转成列表统一处理
                 if isinstance(task_info_list, dict):
@@ -383,15 +248,16 @@ class YgaiBotHandler(ChatbotHandler):
                     reply_lines = [f"✅ 已为您记录 {len(task_info_list)} 个任务:"]
 
                     for idx, task_info in enumerate(task_info_list, 1):
-                        task = await sync_to_async(Task.objects.create)(
-                            title=task_info.get('title') or clean_text[:100],
-                            description=task_info.get('description') or '',
-                            priority=1 if classification == 'urgent' else task_info.get('priority', 2),
-                            task_type=task_info.get('task_type', '其他'),
-                            source='dingtalk',
-                            source_message_id=str(message.id),
-                            due_date=task_info.get('due_date'),
-                        )
+                        with span('create_task'):
+                            task = await sync_to_async(Task.objects.create)(
+                                title=task_info.get('title') or clean_text[:100],
+                                description=task_info.get('description') or '',
+                                priority=1 if classification == 'urgent' else task_info.get('priority', 2),
+                                task_type=task_info.get('task_type', '其他'),
+                                source='dingtalk',
+                                source_message_id=str(message.id),
+                                due_date=task_info.get('due_date'),
+                            )
 
                         priority_display = await sync_to_async(task.get_priority_display)()
                         task_reply = f"{idx}. {task.title} (执行人: {sender_nick})"
@@ -430,21 +296,33 @@ class YgaiBotHandler(ChatbotHandler):
                         reply += f"\n\n [{info['category']}] {info['title']} ({status_mark})\n\n   评分：{info['rating']}\n\n   概要：\n\n{info['summary']}"
                 elif not is_group and classification == 'normal':
                     # 只有在单聊且没有提取到链接时，才对普通消息进行回复
-                    reply = await sync_to_async(generate_reply)(text)
+                    with span('generate_reply') as reply_span:
+                        reply = await self._stream_reply(text, incoming) if streaming_enabled() else None
+                        replied = reply is not None
+                        if reply is None:
+                            reply = await agenerate_reply(text)
+                        reply_span.set(streamed=replied)
                 else:
                     reply = None
             else:
                 reply = None
 
             if reply:
-                self.reply_text(reply, callback)
-                await sync_to_async(Message.objects.create)(
-                    channel_user=channel_user,
-                    platform='dingtalk',
-                    content=reply,
-                    message_type='text',
-                    direction='outbound',
-                )
+                if not replied:
+                    with span('send_reply'):
+                        self.reply_text(reply, callback)
+                with span('save_reply'):
+                    await sync_to_async(Message.objects.create)(
+                        channel_user=channel_user,
+                        platform='dingtalk',
+                        content=reply,
+                        message_type='text',
+                        direction='outbound',
+                    )
+
+            # 全部完成后才标记已处理；中途进程退出时重新投递的消息会接管这条记录重新处理
+            message.processed = True
+            await sync_to_async(message.save)(update_fields=['processed'])
 
         except Exception as e:
             sender = locals().get('sender_nick', '未知用户')
@@ -456,6 +334,40 @@ class YgaiBotHandler(ChatbotHandler):
 
         return AckMessage.STATUS_OK, 'OK'
 
+    async def _stream_reply(self, text: str, incoming: dict):
+        """流式生成回复并逐步写入 AI 卡片，返回最终回复；卡片创建失败时返回 None，由调用方改用普通回复。
+
+        输出中途失败时返回已有内容加上中断说明，卡片置为失败状态。
+        """
+        started = time.monotonic()
+        card = StreamingCard(incoming)
+        if not await card.start('思考中…'):
+            return None
+
+        parts = []
+        first_token = None
+        try:
+            async for chunk in astream_reply(text):
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                parts.append(chunk)
+                await card.update(''.join(parts))
+        except StreamError:
+            # 已经输出部分内容后中断：保留已有内容并注明不完整，卡片置为失败状态
+            reply = ''.join(parts).strip() + STREAM_INTERRUPTED_NOTE
+            await card.fail(reply)
+            logger.warning("流式回复中断: 已输出 %d 字，总耗时 %.2f 秒", len(''.join(parts)), time.monotonic() - started)
+            return reply
+        except Exception:
+            await card.fail(''.join(parts) or '抱歉，生成回复失败。')
+            raise
+
+        reply = ''.join(parts).strip()
+        await card.finish(reply)
+        logger.info("流式回复完成: 首字 %.2f 秒，总耗时 %.2f 秒，卡片更新 %d 次",
+                    first_token or 0.0, time.monotonic() - started, card.updates)
+        return reply
+
     def reply_text(self, text: str, callback):
         # 兼容 SDK 差异：有些版本的 callback.data 就是包含 senderStaffId 的字典，但在某些 SDK 的实现里
         # ChatbotHandler 需要将 callback 转型或自己发起 HTTP 请求。这里我们安全地给它包一层对象。
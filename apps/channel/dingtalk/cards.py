@@ -0,0 +1,166 @@
+"""可流式更新的钉钉 AI 卡片。
+
+单聊普通消息的回复要等大模型生成完整内容才能发出，用户要干等好几秒。
+配置了 DINGTALK_STREAM_CARD_TEMPLATE_ID（钉钉卡片平台里创建的 AI 卡片模板）后，机器人先投放一张
+"思考中"的卡片，再把模型的增量输出持续写进卡片：
+- 两次更新至少间隔 DINGTALK_STREAM_CARD_INTERVAL 秒，避免触发钉钉接口限流；间隔内的更新不丢弃，
+  只保留最新文本，在间隔结束时补发一次
+- 每次都发送完整文本（isFull），中间某次更新失败不会让卡片内容错乱
+- 结束时写入最终文本并把卡片置为完成状态
+
+卡片接口复用 token_manager 和 dingtalk_api 连接池，任何一步失败都只记录日志，由调用方决定是否退回普通文本回复。
+"""
+import asyncio
+import logging
+import time
+import uuid
+
+from django.conf import settings
+
+from apps.channel.http_clients import get_async_client
+
+from .token import OPENAPI_ENDPOINT, token_manager
+
+logger = logging.getLogger(__name__)
+
+# AI 卡片模板约定的 flowStatus 取值
+FLOW_PROCESSING = '1'
+FLOW_FINISHED = '3'
+FLOW_FAILED = '5'
+
+
+def streaming_enabled() -> bool:
+    return bool(getattr(settings, 'DINGTALK_STREAM_CARD_TEMPLATE_ID', ''))
+
+
+class StreamingCard:
+    def __init__(self, incoming: dict):
+        self.incoming = incoming
+        self.template_id = getattr(settings, 'DINGTALK_STREAM_CARD_TEMPLATE_ID', '')
+        self.content_key = getattr(settings, 'DINGTALK_STREAM_CARD_CONTENT_KEY', 'content')
+        self.interval = getattr(settings, 'DINGTALK_STREAM_CARD_INTERVAL', 0.5)
+        self.out_track_id = uuid.uuid4().hex
+        self.started = False
+        self.updates = 0
+        self._last_update = 0.0
+        self._last_text = ''
+        # 节流期间最新的待发送文本，以及间隔结束时补发它的任务
+        self._pending = None
+        self._trailing = None
+        # 同一时间只有一个流式更新请求，避免较早的完整文本晚于较新的到达
+        self._lock = asyncio.Lock()
+
+    async def _request(self, method, path, body) -> bool:
+        try:
+            token = await token_manager.aget()
+            response = await get_async_client('dingtalk_api').request(
+                method,
+                f'{OPENAPI_ENDPOINT}{path}',
+                headers={'x-acs-dingtalk-access-token': token},
+                json=body,
+            )
+            if response.status_code == 401:
+                token_manager.invalidate(token)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.error("钉钉卡片接口 %s 调用失败: %s", path, e)
+            return False
+
+    def _open_space(self) -> dict:
+        robot_code = self.incoming.get('robotCode', '') or settings.DINGTALK_APP_KEY
+        if self.incoming.get('conversationType') == '2':
+            return {
+                'openSpaceId': f"dtv1.card//IM_GROUP.{self.incoming.get('conversationId', '')}",
+                'imGroupOpenSpaceModel': {'supportForward': True},
+                'imGroupOpenDeliverModel': {'robotCode': robot_code},
+            }
+        return {
+            'openSpaceId': f"dtv1.card//IM_ROBOT.{self.incoming.get('senderStaffId', '')}",
+            'imRobotOpenSpaceModel': {'supportForward': True},
+            'imRobotOpenDeliverModel': {'spaceType': 'IM_ROBOT', 'robotCode': robot_code},
+        }
+
+    async def start(self, placeholder: str = '') -> bool:
+        """创建并投放卡片，成功返回 True。"""
+        self.started = await self._request('POST', '/v1.0/card/instances/createAndDeliver', {
+            'cardTemplateId': self.template_id,
+            'outTrackId': self.out_track_id,
+            'callbackType': 'STREAM',
+            'cardData': {'cardParamMap': {'flowStatus': FLOW_PROCESSING, self.content_key: placeholder}},
+            **self._open_space(),
+        })
+        return self.started
+
+    async def _stream(self, text, finalize=False, failed=False) -> bool:
+        ok = await self._request('PUT', '/v1.0/card/streaming', {
+            'outTrackId': self.out_track_id,
+            'guid': uuid.uuid4().hex,
+            'key': self.content_key,
+            'content': text,
+            'isFull': True,
+            'isFinalize': finalize,
+            'isError': failed,
+        })
+        if ok:
+            self.updates += 1
+            self._last_text = text
+        return ok
+
+    async def update(self, text: str, force: bool = False):
+        """写入目前为止的完整文本。
+
+        距离上次更新不足 interval 秒时（force 除外）先记下文本，间隔结束时补发最新的一次。
+        """
+        if not self.started or text == self._last_text:
+            return
+        self._pending = text
+        delay = self._last_update + self.interval - time.monotonic()
+        if force or delay <= 0:
+            await self._flush()
+        elif self._trailing is None:
+            self._trailing = asyncio.create_task(self._flush_later(delay))
+
+    async def _flush_later(self, delay):
+        await asyncio.sleep(delay)
+        self._trailing = None
+        await self._flush()
+
+    async def _flush(self):
+        async with self._lock:
+            text, self._pending = self._pending, None
+            if text is None or text == self._last_text:
+                return
+            self._last_update = time.monotonic()
+            await self._stream(text)
+
+    def _cancel_trailing(self):
+        """最终文本会覆盖所有中间状态，还没补发的更新直接丢弃。"""
+        self._pending = None
+        if self._trailing is not None:
+            self._trailing.cancel()
+            self._trailing = None
+
+    async def finish(self, text: str) -> bool:
+        """写入最终文本并把卡片置为完成状态。"""
+        if not self.started:
+            return False
+        self._cancel_trailing()
+        async with self._lock:
+            ok = await self._stream(text, finalize=True)
+        await self._request('PUT', '/v1.0/card/instances', {
+            'outTrackId': self.out_track_id,
+            'cardData': {'cardParamMap': {'flowStatus': FLOW_FINISHED, self.content_key: text}},
+        })
+        return ok
+
+    async def fail(self, text: str):
+        if not self.started:
+            return
+        self._cancel_trailing()
+        async with self._lock:
+            await self._stream(text, finalize=True, failed=True)
+        await self._request('PUT', '/v1.0/card/instances', {
+            'outTrackId': self.out_track_id,
+            'cardData': {'cardParamMap': {'flowStatus': FLOW_FAILED, self.content_key: text}},
+        })
@@ -1,42 +1,16 @@
 import logging
-import time
 
 import httpx
 from django.conf import settings
 
-logger = logging.getLogger(__name__)
-
-OPENAPI_ENDPOINT = 'https://api.dingtalk.com'
+from .token import OPENAPI_ENDPOINT, token_manager
 
-_access_token_cache = {
-    'token': '',
-    'expires_at': 0,
-}
+logger = logging.getLogger(__name__)
 
 
 def get_access_token() -> str:
-    """获取新版 API 的 access_token（v1.0/oauth2/accessToken）。"""
-    now = time.time()
-    if _access_token_cache['token'] and _access_token_cache['expires_at'] > now:
-        return _access_token_cache['token']
-
-    resp = httpx.post(
-        f'{OPENAPI_ENDPOINT}/v1.0/oauth2/accessToken',
-        json={
-            'appKey': settings.DINGTALK_APP_KEY,
-            'appSecret': settings.DINGTALK_APP_SECRET,
-        },
-    )
-    resp.raise_for_status()
-    data = resp.json()
-
-    token = data.get('accessToken')
-    if not token:
-        raise RuntimeError(f"Failed to get DingTalk access token: {data}")
-
-    _access_token_cache['token'] = token
-    _access_token_cache['expires_at'] = now + data.get('expireIn', 7200) - 60
-    return token
+    """获取新版 API 的 access_token（v1.0/oauth2/accessToken），由进程级 TokenManager 缓存。"""
+    return token_manager.get()
 
 
 def send_message(content: str, user_ids: list[str] | str | None = None) -> dict:
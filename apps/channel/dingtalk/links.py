@@ -0,0 +1,190 @@
+import asyncio
+import logging
+
+from django.conf import settings
+
+from apps.channel import fetch_policy, page_cache
+from apps.channel.blocking import run_blocking
+from apps.channel.fetcher import fetch_page, media_page
+from apps.channel.http_clients import get_async_client
+from apps.channel.sites import FETCH_FULL, FETCH_STREAM, get_site
+from apps.channel.tracing import span
+from apps.ai.classifier import aanalyze_article
+from apps.todo.notion_client import check_link_exists_in_knowledge_base, save_link_to_knowledge_base
+
+logger = logging.getLogger(__name__)
+
+
+async def _fetch_full(site, url):
+    """完整下载并交给站点解析，不走网页缓存（如带 Cookie 的小红书）。"""
+    page = site.default_page(url)
+    client = get_async_client(site.profile)
+    try:
+        response = await fetch_policy.call(url, lambda timeout: client.get(url, timeout=timeout))
+        if response.status_code == 200:
+            page = site.parse(response.text, url)
+        else:
+            logger.warning("%s 请求返回状态码 %s: %s", site.name, response.status_code, url)
+    except Exception as e:
+        logger.error(f"{site.name} 请求异常 {url}: {e}")
+    return page
+
+
+async def _fetch_streamed(site, url):
+    """流式下载：优先使用网页缓存，否则抓取 HTML 并交给站点解析。"""
+    try:
+        cached, entry = await page_cache.get_fresh_page(url)
+    except Exception as e:
+        logger.warning("读取网页缓存失败 %s: %s", url, e)
+        cached, entry = None, None
+    if cached:
+        return cached
+
+    # 缓存过期时带上 ETag / Last-Modified 做条件请求
+    headers = page_cache.conditional_headers(entry) if entry else {}
+    client = get_async_client(site.profile)
+    response = None
+
+    logger.info("准备发起 HTTP GET 请求抓取网页内容: %s", url)
+    try:
+        response = await fetch_policy.call(url, lambda timeout: fetch_page(client, url, headers=headers, timeout=timeout))
+        logger.info("HTTP GET 请求完成 URL: %s, 状态码: %s", url, response.status_code)
+    except fetch_policy.CircuitOpenError as e:
+        logger.warning("跳过抓取 %s: %s", url, e)
+    except Exception as e:
+        logger.error("HTTP GET 请求彻底失败 URL: %s: %r", url, e)
+
+    if response is not None and response.status_code == 304 and entry:
+        logger.info("网页未变化 (304)，使用缓存: %s", url)
+        return await page_cache.revalidated_page(entry)
+
+    if response is None and entry:
+        logger.info("抓取失败，使用过期的网页缓存: %s", url)
+        return page_cache.stale_page(entry)
+
+    if response is None or response.status_code != 200:
+        return site.default_page(url)
+
+    if response.media:
+        page = media_page(response, url)
+    else:
+        try:
+            logger.info("开始解析网页内容...")
+            page = site.parse(response.text, url)
+        except Exception as e:
+            logger.warning("获取 URL 标题或时间失败 %s: %s", url, e)
+            page = site.default_page(url)
+
+    # 解析失败得到的兜底页面不写缓存，否则整个 TTL 内都会命中这个空结果
+    if page == site.default_page(url):
+        logger.warning("网页解析失败，不写入缓存: %s", url)
+        return page
+    try:
+        await page_cache.astore(url, response, page)
+    except Exception as e:
+        logger.warning("写入网页缓存失败 %s: %s", url, e)
+    return page
+
+
+FETCHERS = {
+    FETCH_FULL: _fetch_full,
+    FETCH_STREAM: _fetch_streamed,
+}
+
+
+async def fetch_site_page(url):
+    """按域名选择站点提取器，用它声明的 profile / 规范化 / 抓取策略 / 解析逻辑获取页面。"""
+    site = get_site(url)
+    canonical_url = site.canonicalize(url)
+    if canonical_url != url:
+        logger.info("%s 链接规范化: %s", site.name, canonical_url)
+    return await FETCHERS[site.fetch_strategy](site, canonical_url)
+
+
+async def ingest_url(url, sender_nick):
+    """单个链接的完整流水线：知识库查重 → 抓取 → AI 分类/分析 → 存入 Notion。
+
+    返回用于回复的链接信息字典；保存失败时返回 None。
+    """
+    logger.info("开始处理 URL: %s", url)
+    # 检查链接是否已经存在
+    logger.info("正在查询 Notion 判断 URL 是否已存在: %s", url)
+    with span('notion_dedupe'):
+        existing_info = await run_blocking(check_link_exists_in_knowledge_base)(url)
+    if existing_info and existing_info.get("exists"):
+        logger.info("URL 已存在于知识库，跳过抓取与保存: %s", url)
+        return {
+            "url": url,
+            "title": existing_info["title"],
+            "category": existing_info["category"],
+            "rating": existing_info["rating"],
+            "summary": existing_info["summary"],
+            "is_existing": True
+        }
+
+    with span('fetch'):
+        page = await fetch_site_page(url)
+    title, publish_date, content_text = page['title'], page['publish_date'], page['content']
+
+    # 一次调用完成分类、来源提取、评分和概要
+    logger.info("准备调用 AI 分析网页全文内容: %s", title)
+    with span('analyze', chars=len(content_text or '')):
+        analysis_result = await aanalyze_article(title, url, content_text)
+    category = analysis_result.get("category") or "其他"
+    logger.info("AI 分析网页全文内容完毕")
+
+    # 来源优先级：AI 从正文识别 > 页面元信息（公众号名 / og:site_name）> 发送人
+    source = analysis_result.get("source") or "未知来源"
+    if source == "未知来源":
+        source = page.get('source') or sender_nick
+
+    rating = analysis_result.get("rating", "⭐⭐⭐")
+    summary = analysis_result.get("summary", "暂无摘要")
+
+    logger.info("AI 网页分析结果 - URL: %s | 标题: %s | 分类: %s | 发布时间: %s | 来源: %s | 评分: %s",
+                url, title, category, publish_date, source, rating)
+
+    try:
+        with span('notion_save'):
+            await run_blocking(save_link_to_knowledge_base)(url, title, source, category, publish_date, rating, summary)
+    except Exception as e:
+        logger.error("保存 URL 到 Notion 失败 %s: %s", url, e)
+        return None
+
+    return {
+        "url": url,
+        "title": title,
+        "category": category,
+        "rating": rating,
+        "summary": summary
+    }
+
+
+async def ingest_urls(urls, sender_nick, concurrency=None):
+    """并发处理一条消息中的所有链接，结果按原始链接顺序返回。
+
+    concurrency 限制同时进行的流水线数量，默认取 settings.DINGTALK_LINK_CONCURRENCY。
+    单个链接失败只会被记录并跳过，不影响其他链接。
+    """
+    if not urls:
+        return []
+
+    if concurrency is None:
+        concurrency = getattr(settings, 'DINGTALK_LINK_CONCURRENCY', 4)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    logger.info("检测到 %d 个 URL，准备开始处理 (并发上限 %d): %s", len(urls), concurrency, urls)
+
+    async def _guarded(url):
+        async with semaphore:
+            try:
+                # 每个链接一个 span，查重 / 抓取 / 分析 / 保存记录为它的子 span
+                with span('url', url=url):
+                    return await ingest_url(url, sender_nick)
+            except Exception:
+                logger.exception("处理 URL 时出现未预期的异常，已跳过: %s", url)
+                return None
+
+    results = await asyncio.gather(*(_guarded(url) for url in urls))
+
+    return [info for info in results if info]
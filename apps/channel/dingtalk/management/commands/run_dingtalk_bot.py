@@ -1,17 +1,40 @@
+import argparse
+import asyncio
 import logging
+import signal
 
 import dingtalk_stream
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from apps.channel.dingtalk.bot import YgaiBotHandler
+from apps.channel.dingtalk.token import token_manager
+from apps.channel.http_clients import close_clients
 
 logger = logging.getLogger(__name__)
 
 
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
 class Command(BaseCommand):
     help = '启动钉钉 Stream 机器人监听'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--async-ack', action=argparse.BooleanOptionalAction, default=settings.DINGTALK_ASYNC_ACK,
+            help='收到消息立即 ack，由后台 worker 池处理（--no-async-ack 关闭，默认 DINGTALK_ASYNC_ACK）',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.DINGTALK_WORKERS,
+            help='后台 worker 数量（仅 --async-ack 模式生效）',
+        )
+        parser.add_argument(
+            '--queue-size', type=int, default=settings.DINGTALK_QUEUE_SIZE,
+            help='消息队列容量，队列满时拒绝新消息（仅 --async-ack 模式生效）',
+        )
+
     def handle(self, *args, **options):
         app_key = settings.DINGTALK_APP_KEY
         app_secret = settings.DINGTALK_APP_SECRET
@@ -24,13 +47,29 @@ class Command(BaseCommand):
 
         credential = dingtalk_stream.Credential(app_key, app_secret)
         client = dingtalk_stream.DingTalkStreamClient(credential)
-        client.register_callback_handler(
-            dingtalk_stream.ChatbotMessage.TOPIC,
-            YgaiBotHandler(),
+        handler = YgaiBotHandler(
+            async_ack=options['async_ack'],
+            workers=options['workers'],
+            queue_size=options['queue_size'],
         )
+        client.register_callback_handler(dingtalk_stream.ChatbotMessage.TOPIC, handler)
+
+        if token_manager.warm():
+            self.stdout.write('钉钉 access_token 已预热')
 
-        from apps.todo.scheduler import start_scheduler
+        from apps.todo.scheduler import runtime_stats_job, start_scheduler
         start_scheduler()
 
+        if options['async_ack']:
+            self.stdout.write(f"异步 ack 模式: {options['workers']} 个 worker，队列容量 {options['queue_size']}")
         self.stdout.write(self.style.SUCCESS('钉钉 Stream Bot 启动中...'))
-        client.start_forever()
+        # docker stop 发送 SIGTERM，按 Ctrl-C 同样处理，才能走到下面的退出流程
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+        try:
+            client.start_forever()
+        finally:
+            if handler.pool is not None:
+                # 已 ack 但还在队列里的消息在退出前处理完
+                asyncio.run(handler.pool.stop(timeout=settings.DINGTALK_DRAIN_TIMEOUT))
+            runtime_stats_job()
+            close_clients()
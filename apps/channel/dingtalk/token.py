@@ -0,0 +1,134 @@
+"""钉钉 OpenAPI access_token 的进程级缓存。
+
+同步（定时通知、发消息）和异步（机器人下载图片）调用方共用同一个 token：
+- token 在过期前 DINGTALK_TOKEN_REFRESH_MARGIN 秒就开始刷新
+- 同一时间只有一个刷新请求，其他线程/协程等待它的结果（同一事件循环里的协程共享一个刷新任务，
+  不会各占一个线程去排队等锁）；如果旧 token 还没真正过期，正在刷新时其他调用方直接使用旧 token，不排队
+- 接口返回 401 时按失效的 token 调用 invalidate，已经被刷新替换掉的旧 token 不会把新 token 清掉
+- 机器人启动时预热，处理第一条消息时不需要再请求 token
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from apps.channel.http_clients import get_sync_client
+
+logger = logging.getLogger(__name__)
+
+OPENAPI_ENDPOINT = 'https://api.dingtalk.com'
+
+
+def _request_token():
+    """请求新 token，返回 (token, 有效秒数)。"""
+    resp = get_sync_client('dingtalk_api').post(
+        f'{OPENAPI_ENDPOINT}/v1.0/oauth2/accessToken',
+        json={
+            'appKey': settings.DINGTALK_APP_KEY,
+            'appSecret': settings.DINGTALK_APP_SECRET,
+        },
+    )
+    resp.raise_for_status()
+    data = resp.json()
+
+    token = data.get('accessToken')
+    if not token:
+        raise RuntimeError(f"Failed to get DingTalk access token: {data}")
+    return token, data.get('expireIn', 7200)
+
+
+class TokenManager:
+    def __init__(self, fetch=_request_token):
+        self._fetch = fetch
+        # _lock 串行化刷新请求；_state_lock 只保护 token 和过期时间的读写，持有时间很短
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._token = ''
+        self._expires_at = 0.0
+        self.refreshes = 0
+        # 每个事件循环里正在进行的刷新任务
+        self._refreshing = {}
+
+    def _margin(self):
+        return getattr(settings, 'DINGTALK_TOKEN_REFRESH_MARGIN', 300)
+
+    def _cached(self, with_margin=True):
+        margin = self._margin() if with_margin else 0
+        with self._state_lock:
+            if self._token and self._expires_at - margin > time.time():
+                return self._token
+        return None
+
+    def get(self) -> str:
+        """返回可用的 token，必要时刷新。刷新失败时抛出异常。"""
+        token = self._cached()
+        if token:
+            return token
+
+        # 临近过期但仍可用：已有线程在刷新时不等待，直接用旧 token
+        stale = self._cached(with_margin=False)
+        if not self._lock.acquire(blocking=stale is None):
+            return stale
+        try:
+            token = self._cached()
+            if token:
+                return token
+            token, expires_in = self._fetch()
+            with self._state_lock:
+                self._token = token
+                self._expires_at = time.time() + expires_in
+            self.refreshes += 1
+            logger.info("钉钉 access_token 已刷新，有效期 %s 秒", expires_in)
+            return token
+        finally:
+            self._lock.release()
+
+    async def aget(self) -> str:
+        """异步版本：命中缓存时不切换线程；需要刷新时同一事件循环里的协程共享一个刷新任务。"""
+        token = self._cached()
+        if token:
+            return token
+
+        loop = asyncio.get_running_loop()
+        task = self._refreshing.get(loop)
+        if task is not None and not task.done():
+            stale = self._cached(with_margin=False)
+            if stale:
+                # 本循环里已有协程在刷新，旧 token 仍可用时不等待
+                return stale
+        else:
+            task = loop.create_task(asyncio.to_thread(self.get))
+            self._refreshing[loop] = task
+            task.add_done_callback(lambda done: self._refresh_done(loop, done))
+        # 单个调用方被取消时不取消共享的刷新任务
+        return await asyncio.shield(task)
+
+    def _refresh_done(self, loop, task):
+        if self._refreshing.get(loop) is task:
+            del self._refreshing[loop]
+
+    def invalidate(self, token: str | None = None):
+        """接口返回 token 无效时调用，下次获取会重新请求。
+
+        传入请求时使用的 token：如果它已经被刷新替换掉，说明新 token 是在它失效之后拿到的，不再清除。
+        """
+        with self._state_lock:
+            if token is not None and token != self._token:
+                return
+            self._token = ''
+            self._expires_at = 0.0
+
+    def warm(self) -> bool:
+        if not settings.DINGTALK_APP_KEY or not settings.DINGTALK_APP_SECRET:
+            return False
+        try:
+            self.get()
+            return True
+        except Exception as e:
+            logger.warning("预热钉钉 access_token 失败: %s", e)
+            return False
+
+
+token_manager = TokenManager()
@@ -1,25 +1,39 @@
-import httpx
+import asyncio
 import logging
+
 from django.conf import settings
 
+from apps.channel.http_clients import get_async_client
+
+from .token import OPENAPI_ENDPOINT, token_manager
+
 logger = logging.getLogger(__name__)
 
 async def get_dingtalk_access_token():
-    """获取钉钉 OpenAPI 的 access_token"""
-    url = "https://api.dingtalk.com/v1.0/oauth2/accessToken"
-    payload = {
-        "appKey": settings.DINGTALK_APP_KEY,
-        "appSecret": settings.DINGTALK_APP_SECRET
-    }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("accessToken")
-        except Exception as e:
-            logger.error(f"Failed to get DingTalk access token: {e}")
-            return None
+    """获取钉钉 OpenAPI 的 access_token（与同步调用方共用缓存）"""
+    try:
+        return await token_manager.aget()
+    except Exception as e:
+        logger.error(f"Failed to get DingTalk access token: {e}")
+        return None
+
+async def _request_download_url(token, download_code, robot_code):
+    """请求单个 downloadCode 的下载链接，失败时抛出异常"""
+    response = await get_async_client('dingtalk_api').post(
+        f"{OPENAPI_ENDPOINT}/v1.0/robot/messageFiles/download",
+        headers={"x-acs-dingtalk-access-token": token},
+        json={
+            "downloadCode": download_code,
+            "robotCode": robot_code
+        },
+    )
+    if response.status_code == 401:
+        token_manager.invalidate(token)
+    response.raise_for_status()
+    download_url = response.json().get("downloadUrl")
+    if not download_url:
+        raise RuntimeError(f"响应中没有 downloadUrl: {response.text[:200]}")
+    return download_url
 
 async def get_download_url(download_code, robot_code):
     """通过 downloadCode 换取真实的临时下载链接"""
@@ -28,21 +42,39 @@ async def get_download_url(download_code, robot_code):
         logger.error("No access token available for DingTalk API.")
         return None
 
-    url = "https://api.dingtalk.com/v1.0/robot/messageFiles/download"
-    headers = {
-        "x-acs-dingtalk-access-token": token,
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "downloadCode": download_code,
-        "robotCode": robot_code
-    }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("downloadUrl")
-        except Exception as e:
-            logger.error(f"Failed to get download URL from DingTalk: {e}")
-            return None
\ No newline at end of file
+    try:
+        return await _request_download_url(token, download_code, robot_code)
+    except Exception as e:
+        logger.error(f"Failed to get download URL from DingTalk: {e}")
+        return None
+
+async def resolve_download_urls(download_codes, robot_code, concurrency=None):
+    """并发换取一条消息中所有 downloadCode 的下载链接。
+
+    返回与输入顺序一致的列表，每项为 {"code", "url", "error"}，
+    单个失败只记录在对应项的 error 中，不影响其他图片。
+    """
+    if not download_codes:
+        return []
+
+    token = await get_dingtalk_access_token()
+    if not token:
+        logger.error("No access token available for DingTalk API.")
+        return [{"code": code, "url": None, "error": "no access token"} for code in download_codes]
+
+    if concurrency is None:
+        concurrency = getattr(settings, 'DINGTALK_DOWNLOAD_CONCURRENCY', 5)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _resolve(code):
+        async with semaphore:
+            try:
+                return {"code": code, "url": await _request_download_url(token, code, robot_code), "error": None}
+            except Exception as e:
+                logger.error("Failed to get download URL for %s: %r", code, e)
+                return {"code": code, "url": None, "error": repr(e)}
+
+    results = await asyncio.gather(*(_resolve(code) for code in download_codes))
+    failed = sum(1 for item in results if item["error"])
+    logger.info("图片下载链接获取完毕: %d 成功, %d 失败", len(results) - failed, failed)
+    return results
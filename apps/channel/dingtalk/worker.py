@@ -0,0 +1,99 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWorkerPool:
+    """有界的进程内消息队列 + 固定数量的异步 worker。
+
+    Stream 回调只负责把原始 callback 放进队列并立即 ack，真正的处理流水线
+    由 worker 在后台执行，处理结果通过 sessionWebhook 回复给用户。
+
+    dingtalk_stream 断线重连时会用 asyncio.run 新建事件循环，队列和 worker
+    都绑定在事件循环上，所以每次 submit 都会检查当前循环，必要时重建，
+    旧队列里还没处理的消息转入新队列。循环结束时 worker 正在处理的消息会被取消，
+    这些消息同样放回新队列重新处理（已经 ack 过，不重新处理就丢了）。
+    退出时由 stop 在新的事件循环里把剩余消息处理完。
+    """
+
+    def __init__(self, handle, workers=4, queue_size=100):
+        self.handle = handle
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self._loop = None
+        self._queue = None
+        self._tasks = []
+        # worker 处理到一半被取消的消息
+        self._interrupted = []
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+
+        # 旧循环结束时 worker 已被取消，但队列里的消息还在；被取消的在处理消息排在最前面
+        pending, self._interrupted = self._interrupted, []
+        if self._queue is not None:
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+
+        self._loop = loop
+        # 转入的消息可能多于队列容量（队列满时 worker 手上还有消息），此时临时放宽容量
+        self._queue = asyncio.Queue(maxsize=max(self.queue_size, len(pending)))
+        for callback in pending:
+            self._queue.put_nowait(callback)
+        self._tasks = [loop.create_task(self._run(idx)) for idx in range(self.workers)]
+        if pending:
+            logger.warning("事件循环已切换，%d 条未处理完的消息已转入新队列", len(pending))
+        logger.info("消息 worker 池已启动: %d 个 worker，队列容量 %d", self.workers, self.queue_size)
+
+    async def _run(self, idx):
+        while True:
+            callback = await self._queue.get()
+            try:
+                await self.handle(callback)
+            except asyncio.CancelledError:
+                # 事件循环结束或 stop 超时：记下来，下一个事件循环接着处理
+                self._interrupted.append(callback)
+                raise
+            except Exception:
+                logger.exception("worker %d 处理消息异常", idx)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, callback) -> bool:
+        """尝试入队，队列已满时返回 False（由调用方负责回压处理）。"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(callback)
+        except asyncio.QueueFull:
+            logger.warning("消息队列已满 (%d)，拒绝新消息", self.queue_size)
+            return False
+        logger.debug("消息已入队，当前队列深度: %d", self._queue.qsize())
+        return True
+
+    async def stop(self, timeout: float | None = None) -> int:
+        """等待队列中的消息处理完毕后停止所有 worker，返回超时后放弃的消息数。
+
+        可以在原来的事件循环结束后用新的循环调用（如 asyncio.run(pool.stop(30))），
+        旧队列里的消息和旧循环结束时被取消的在处理消息会先转入新队列再处理。
+        """
+        if self._queue is None:
+            return 0
+        self._ensure_started()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        dropped = self._queue.qsize() + len(self._interrupted)
+        if dropped:
+            logger.warning("等待 %s 秒后仍有 %d 条消息未处理完，放弃处理", timeout, dropped)
+        self._tasks = []
+        self._interrupted = []
+        self._queue = None
+        self._loop = None
+        return dropped
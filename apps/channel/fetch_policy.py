@@ -0,0 +1,294 @@
+"""网页抓取的按域名重试与熔断策略。
+
+- 连接超时和读取超时分开配置：连不上的站点很快失败，能连上的站点给足读取时间
+- 超时、连接错误、429 / 5xx 视为可重试失败，按指数退避 + 全抖动等待后重试
+- 同一域名连续失败达到阈值后熔断，冷却期内直接失败，不再拖慢回复；
+  冷却结束后放行一个探测请求（半开），成功则恢复，失败则继续熔断
+- 每个域名的请求数、失败数、超时数、熔断拒绝数和平均耗时可通过 host_stats() 查看，
+  熔断状态变化写入日志
+
+同步（企业微信 url_parser）和异步（钉钉链接流水线）两条链路共用同一份域名状态。
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """域名处于熔断状态，请求未发出。"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"{host} 已熔断，{retry_after:.0f} 秒后再试")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class RetryableStatusError(Exception):
+    """服务端返回可重试的状态码。"""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def request_timeout() -> httpx.Timeout:
+    connect = _setting('PAGE_FETCH_CONNECT_TIMEOUT', 5.0)
+    read = _setting('PAGE_FETCH_READ_TIMEOUT', 15.0)
+    return httpx.Timeout(read, connect=connect, pool=connect)
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次失败后的等待时间（全抖动）：在 [0, min(上限, 基数 * 2^attempt)] 内随机。"""
+    base = _setting('PAGE_FETCH_BACKOFF_BASE', 0.5)
+    cap = _setting('PAGE_FETCH_BACKOFF_MAX', 4.0)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class HostState:
+    def __init__(self, host):
+        self.host = host
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+
+    def as_dict(self):
+        return {
+            'host': self.host,
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'requests': self.requests,
+            'successes': self.successes,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'avg_ms': round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+        }
+
+
+class HostBreaker:
+    """按域名记录失败次数并维护熔断状态，线程安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _get(self, host) -> HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(host)
+        return state
+
+    def before_request(self, host):
+        """熔断中且未到冷却时间时抛出 CircuitOpenError；冷却结束后只放行一个探测请求。"""
+        cooldown = _setting('PAGE_FETCH_BREAKER_COOLDOWN', 300)
+        with self._lock:
+            state = self._get(host)
+            if state.state == STATE_CLOSED:
+                return
+
+            remaining = state.opened_at + cooldown - time.monotonic()
+            if state.state == STATE_OPEN and remaining <= 0:
+                state.state = STATE_HALF_OPEN
+                state.probing = False
+                logger.info("域名 %s 熔断冷却结束，进入半开状态，放行探测请求", host)
+
+            if state.state == STATE_HALF_OPEN and not state.probing:
+                state.probing = True
+                return
+
+            state.rejected += 1
+            raise CircuitOpenError(host, max(remaining, 0))
+
+    def record(self, host, ok, elapsed_ms, timeout=False):
+        threshold = _setting('PAGE_FETCH_BREAKER_THRESHOLD', 3)
+        with self._lock:
+            state = self._get(host)
+            state.requests += 1
+            state.total_ms += elapsed_ms
+            if ok:
+                state.successes += 1
+                state.consecutive_failures = 0
+                if state.state != STATE_CLOSED:
+                    logger.info("域名 %s 探测成功，熔断恢复", host)
+                state.state = STATE_CLOSED
+                state.probing = False
+                return
+
+            state.failures += 1
+            state.consecutive_failures += 1
+            if timeout:
+                state.timeouts += 1
+            if state.state == STATE_HALF_OPEN or (
+                state.state == STATE_CLOSED and state.consecutive_failures >= threshold
+            ):
+                state.state = STATE_OPEN
+                state.opened_at = time.monotonic()
+                state.probing = False
+                logger.warning("域名 %s 连续失败 %d 次，熔断 %s 秒。统计: %s",
+                               host, state.consecutive_failures,
+                               _setting('PAGE_FETCH_BREAKER_COOLDOWN', 300), state.as_dict())
+
+    def release(self, host):
+        """请求因非网络原因中断（如解析异常）时释放半开探测名额。"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is not None:
+                state.probing = False
+
+    def is_open(self, host) -> bool:
+        with self._lock:
+            state = self._hosts.get(host)
+            return state is not None and state.state == STATE_OPEN
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            return sorted((s.as_dict() for s in self._hosts.values()), key=lambda s: -s['failures'])
+
+
+breaker = HostBreaker()
+
+
+def host_stats() -> list[dict]:
+    """各域名的抓取统计，失败次数多的排在前面。"""
+    return breaker.stats()
+
+
+def log_host_stats():
+    stats = [s for s in host_stats() if s['failures'] or s['rejected']]
+    if not stats:
+        return
+    logger.info("网页抓取域名统计（仅列出有失败的域名）:")
+    for s in stats:
+        logger.info("  %(host)s state=%(state)s requests=%(requests)d failures=%(failures)d "
+                    "timeouts=%(timeouts)d rejected=%(rejected)d avg_ms=%(avg_ms).1f", s)
+
+
+def _host(url):
+    return (urlsplit(url).hostname or '').lower()
+
+
+def _attempts():
+    return max(1, _setting('PAGE_FETCH_RETRIES', 3))
+
+
+def _check_status(response):
+    if response.status_code in RETRYABLE_STATUS:
+        raise RetryableStatusError(response)
+    return response
+
+
+class _Retry:
+    """一次抓取的重试状态：熔断检查、耗时记录、是否重试和退避时间都在这里，
+    call / call_sync 只负责发请求和等待。"""
+
+    def __init__(self, url):
+        self.url = url
+        self.host = _host(url)
+        self.timeout = request_timeout()
+        self.attempts = _attempts()
+        self.attempt = 0
+        self._start = 0.0
+
+    def begin(self):
+        """发出请求前调用，域名熔断时抛出 CircuitOpenError。"""
+        breaker.before_request(self.host)
+        self._start = time.perf_counter()
+
+    def _elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def succeeded(self, response):
+        breaker.record(self.host, True, self._elapsed_ms())
+        return response
+
+    def failed(self, error) -> float | None:
+        """记录一次可重试失败；还能重试时返回退避秒数，重试用尽或域名已熔断时返回 None。"""
+        elapsed_ms = self._elapsed_ms()
+        breaker.record(self.host, False, elapsed_ms, timeout=isinstance(error, httpx.TimeoutException))
+        logger.warning("抓取失败 (尝试 %d/%d, %.0f ms) %s: %r",
+                       self.attempt + 1, self.attempts, elapsed_ms, self.url, error)
+        if self.attempt == self.attempts - 1 or breaker.is_open(self.host):
+            return None
+        delay = backoff_delay(self.attempt)
+        self.attempt += 1
+        logger.info("%.2f 秒后重试 %s", delay, self.url)
+        return delay
+
+    def aborted(self):
+        """请求因非网络原因中断（包括任务取消），释放半开探测名额。"""
+        breaker.release(self.host)
+
+
+def _give_up(error):
+    """重试用尽：可重试状态码返回最后一次的响应，网络异常原样抛出。"""
+    if isinstance(error, RetryableStatusError):
+        return error.response
+    raise error
+
+
+async def call(url, send):
+    """按策略执行异步请求。send(timeout) 返回响应的 awaitable。
+
+    成功（包括 304 和非 429 的 4xx）直接返回响应；可重试失败按退避重试，
+    重试用尽后返回最后一次可重试状态码的响应，或抛出最后一次网络异常。
+    域名熔断时抛出 CircuitOpenError。
+    """
+    retry = _Retry(url)
+    while True:
+        retry.begin()
+        try:
+            response = _check_status(await send(retry.timeout))
+        except (httpx.TransportError, RetryableStatusError) as e:
+            delay = retry.failed(e)
+            if delay is None:
+                return _give_up(e)
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            retry.aborted()
+            raise
+        return retry.succeeded(response)
+
+
+def call_sync(url, send):
+    """call() 的同步版本，供企业微信 url_parser 等同步链路使用。"""
+    retry = _Retry(url)
+    while True:
+        retry.begin()
+        try:
+            response = _check_status(send(retry.timeout))
+        except (httpx.TransportError, RetryableStatusError) as e:
+            delay = retry.failed(e)
+            if delay is None:
+                return _give_up(e)
+            time.sleep(delay)
+            continue
+        except BaseException:
+            retry.aborted()
+            raise
+        return retry.succeeded(response)
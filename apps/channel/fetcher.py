@@ -0,0 +1,143 @@
+"""流式网页下载。
+
+先看响应头：图片/视频/音频/PDF 等二进制内容直接短路，不下载正文；
+HTML 按块读取，达到字节上限，或已经读完 <head> 且正文部分足够时提前停止。
+后续只会用到正文的前几千字，没必要把整个大页面读进内存。
+"""
+import logging
+from urllib.parse import unquote, urlsplit
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BINARY_CONTENT_TYPES = (
+    'image/', 'video/', 'audio/', 'font/',
+    'application/pdf', 'application/zip', 'application/x-rar', 'application/x-7z',
+    'application/octet-stream', 'application/msword', 'application/vnd.',
+)
+
+HEAD_END = b'</head>'
+
+
+def _max_bytes():
+    return getattr(settings, 'PAGE_FETCH_MAX_BYTES', 2 * 1024 * 1024)
+
+
+def _body_bytes():
+    return getattr(settings, 'PAGE_FETCH_BODY_BYTES', 1024 * 1024)
+
+
+def is_binary_content_type(content_type: str) -> bool:
+    content_type = (content_type or '').lower()
+    return any(content_type.startswith(prefix) for prefix in BINARY_CONTENT_TYPES)
+
+
+def filename_from_url(url: str) -> str:
+    path = urlsplit(url).path.rstrip('/')
+    return unquote(path.rsplit('/', 1)[-1]) if path else url
+
+
+class PageResponse:
+    """流式读取后的响应，接口与解析代码用到的 httpx.Response 属性保持一致。"""
+
+    def __init__(self, response, body: bytes = b'', truncated=False, media=False):
+        self._response = response
+        self.url = str(response.url)
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content_type = response.headers.get('Content-Type', '')
+        self.content = body
+        self.truncated = truncated
+        self.media = media
+        self.text = body.decode(response.encoding or 'utf-8', errors='replace') if body else ''
+
+    def raise_for_status(self):
+        self._response.raise_for_status()
+
+
+class _ByteBudget:
+    """累计读取的字节，判断是否可以提前停止。"""
+
+    def __init__(self, max_bytes, body_bytes):
+        self.max_bytes = max_bytes
+        self.body_bytes = body_bytes
+        self.buffer = bytearray()
+        self.head_end = -1
+
+    def feed(self, chunk: bytes) -> bool:
+        """追加一块数据，返回 True 表示已经读够了。"""
+        search_from = max(0, len(self.buffer) - len(HEAD_END))
+        self.buffer.extend(chunk)
+        if self.head_end < 0:
+            idx = bytes(self.buffer[search_from:]).lower().find(HEAD_END)
+            if idx >= 0:
+                self.head_end = search_from + idx
+        if len(self.buffer) >= self.max_bytes:
+            return True
+        return self.head_end >= 0 and len(self.buffer) - self.head_end >= self.body_bytes
+
+
+def _precheck(response, url, max_bytes):
+    """检查响应头，返回 (是否二进制媒体, 是否需要读取正文)。"""
+    if response.status_code != 200:
+        return False, False
+
+    content_type = response.headers.get('Content-Type', '')
+    if is_binary_content_type(content_type):
+        logger.info("URL 指向二进制内容 (%s)，跳过下载正文: %s", content_type, url)
+        return True, False
+
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > max_bytes:
+        logger.info("页面大小 %s 字节超过上限 %d，只读取前 %d 字节: %s", length, max_bytes, max_bytes, url)
+    return False, True
+
+
+async def fetch_page(client, url, headers=None, max_bytes=None, body_bytes=None, timeout=httpx.USE_CLIENT_DEFAULT) -> PageResponse:
+    """异步流式抓取网页。"""
+    max_bytes = max_bytes or _max_bytes()
+    budget = _ByteBudget(max_bytes, body_bytes or _body_bytes())
+    truncated = False
+
+    async with client.stream('GET', url, headers=headers, timeout=timeout) as response:
+        media, read_body = _precheck(response, url, max_bytes)
+        if read_body:
+            async for chunk in response.aiter_bytes():
+                if budget.feed(chunk):
+                    truncated = True
+                    break
+
+    if truncated:
+        logger.info("已读取 %d 字节，提前结束下载: %s", len(budget.buffer), url)
+    return PageResponse(response, bytes(budget.buffer[:max_bytes]), truncated=truncated, media=media)
+
+
+def fetch_page_sync(client, url, headers=None, max_bytes=None, body_bytes=None, timeout=httpx.USE_CLIENT_DEFAULT) -> PageResponse:
+    """同步流式抓取网页。"""
+    max_bytes = max_bytes or _max_bytes()
+    budget = _ByteBudget(max_bytes, body_bytes or _body_bytes())
+    truncated = False
+
+    with client.stream('GET', url, headers=headers, timeout=timeout) as response:
+        media, read_body = _precheck(response, url, max_bytes)
+        if read_body:
+            for chunk in response.iter_bytes():
+                if budget.feed(chunk):
+                    truncated = True
+                    break
+
+    if truncated:
+        logger.info("已读取 %d 字节，提前结束下载: %s", len(budget.buffer), url)
+    return PageResponse(response, bytes(budget.buffer[:max_bytes]), truncated=truncated, media=media)
+
+
+def media_page(response: PageResponse, url: str) -> dict:
+    """二进制媒体链接不解析正文，用文件名作为标题。"""
+    name = filename_from_url(response.url or url)
+    return {
+        'title': name,
+        'publish_date': None,
+        'content': f"该链接是 {response.content_type or '二进制'} 文件（{name}），未抓取正文。",
+    }
@@ -0,0 +1,152 @@
+"""进程级共享的 HTTP 客户端注册表。
+
+按 profile（请求头 / Cookie / 超时配置）复用长连接池，避免每条消息都重新
+建立 TLS 连接。安装了 h2 时自动启用 HTTP/2。
+
+异步客户端绑定在事件循环上：dingtalk_stream 断线重连会新建事件循环，
+所以异步客户端按 (事件循环, profile) 缓存。
+"""
+import asyncio
+import atexit
+import importlib.util
+import logging
+import os
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BROWSER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+POOL_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60.0)
+
+
+def _xiaohongshu_cookie():
+    return getattr(settings, 'XIAOHONGSHU_COOKIE', os.environ.get('XIAOHONGSHU_COOKIE', ''))
+
+
+PROFILES = {
+    'default': {
+        'headers': {'User-Agent': BROWSER_USER_AGENT},
+        'timeout': 30.0,
+    },
+    # url_parser 历史上关闭了证书校验，兼容部分证书不规范的站点
+    'insecure': {
+        'headers': {'User-Agent': BROWSER_USER_AGENT},
+        'timeout': 10.0,
+        'verify': False,
+    },
+    # 小红书需要独立的 Cookie 身份，不能和其他站点共用请求头
+    'xiaohongshu': {
+        'headers': {
+            'User-Agent': BROWSER_USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+        },
+        'cookie': _xiaohongshu_cookie,
+        'timeout': 15.0,
+    },
+    # 钉钉 OpenAPI（access_token、图片下载链接等）
+    'dingtalk_api': {
+        'headers': {'Content-Type': 'application/json'},
+        'timeout': 10.0,
+    },
+    # DashScope 大模型接口（apps/ai/dashscope_async.py），鉴权头按请求传入
+    'dashscope': {
+        'headers': {'Content-Type': 'application/json'},
+        'timeout': 60.0,
+    },
+}
+
+_lock = threading.Lock()
+_sync_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _client_kwargs(profile):
+    if profile not in PROFILES:
+        raise KeyError(f"未知的 HTTP profile: {profile}")
+    conf = PROFILES[profile]
+
+    headers = dict(conf.get('headers', {}))
+    cookie_getter = conf.get('cookie')
+    cookie = cookie_getter() if cookie_getter else ''
+    if cookie:
+        headers['Cookie'] = cookie
+        logger.info(f"profile={profile} 成功读取配置的 Cookie: {cookie[:15]}...")
+    elif cookie_getter:
+        logger.warning("profile=%s 未配置 Cookie，将以游客身份访问，很可能被拦截", profile)
+
+    return {
+        'headers': headers,
+        'timeout': conf.get('timeout', 30.0),
+        'verify': conf.get('verify', True),
+        'follow_redirects': True,
+        'http2': HTTP2_AVAILABLE,
+        'limits': POOL_LIMITS,
+    }
+
+
+def get_sync_client(profile='default') -> httpx.Client:
+    """获取指定 profile 的共享同步客户端。"""
+    client = _sync_clients.get(profile)
+    if client is not None and not client.is_closed:
+        return client
+
+    with _lock:
+        client = _sync_clients.get(profile)
+        if client is None or client.is_closed:
+            client = httpx.Client(**_client_kwargs(profile))
+            _sync_clients[profile] = client
+            logger.info("创建共享 HTTP 客户端 profile=%s (http2=%s)", profile, HTTP2_AVAILABLE)
+    return client
+
+
+def get_async_client(profile='default') -> httpx.AsyncClient:
+    """获取当前事件循环下指定 profile 的共享异步客户端。"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        clients = _async_clients[loop] = {}
+
+    client = clients.get(profile)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_kwargs(profile))
+        clients[profile] = client
+        logger.info("创建共享异步 HTTP 客户端 profile=%s (http2=%s)", profile, HTTP2_AVAILABLE)
+    return client
+
+
+async def aclose_clients():
+    """关闭当前事件循环下的所有异步客户端。"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.pop(loop, {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def close_clients():
+    """进程退出时关闭所有客户端（同步客户端 + 尚可关闭的异步客户端）。"""
+    with _lock:
+        for client in _sync_clients.values():
+            client.close()
+        _sync_clients.clear()
+
+    for loop, clients in list(_async_clients.items()):
+        if loop.is_closed() or loop.is_running():
+            # 事件循环已经结束，连接会随对象回收一起释放
+            continue
+        for client in clients.values():
+            try:
+                loop.run_until_complete(client.aclose())
+            except Exception:
+                logger.debug("关闭异步 HTTP 客户端失败", exc_info=True)
+    _async_clients.clear()
+
+
+atexit.register(close_clients)
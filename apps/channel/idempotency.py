@@ -0,0 +1,97 @@
+"""按平台消息ID 去重。
+
+钉钉 Stream 在未及时收到 ack 时会重新投递同一条消息（msgId 不变），
+如果重新走一遍流水线，会重复调用大模型、重复创建任务和 Notion 页面。
+
+两层保护：
+- 进程内：正在处理的 msgId 记录在 in-flight 表中，重复投递直接等待第一次处理的结果
+- 数据库：Message(platform, platform_message_id) 唯一约束，入站消息在任何耗时操作之前
+  先插入一条记录"占位"，流水线全部完成后才标记 processed。插入失败时：已标记 processed 的是重复投递；
+  未标记的说明上次处理中途进程退出（进程内仍在处理的已由第一层拦住），由这次投递接管重新处理
+
+消息ID 只需在重新投递的时间窗口内保持唯一，prune_message_ids 会定期清空过期的ID。
+"""
+import asyncio
+import logging
+import weakref
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_inflight = weakref.WeakKeyDictionary()
+
+
+def begin(platform, message_id):
+    """登记一条开始处理的消息。
+
+    如果同一条消息已在当前事件循环中处理，返回它的 Future，调用方应等待它而不是重新处理；
+    否则登记并返回 None，处理结束后必须调用 finish()。消息ID 为空时不做去重。
+    """
+    if not message_id:
+        return None
+    loop = asyncio.get_running_loop()
+    pending = _inflight.setdefault(loop, {})
+    key = (platform, message_id)
+    future = pending.get(key)
+    if future is not None:
+        return future
+    pending[key] = loop.create_future()
+    return None
+
+
+def finish(platform, message_id, result=None):
+    """处理结束，唤醒等待同一条消息的重复投递。"""
+    if not message_id:
+        return
+    pending = _inflight.get(asyncio.get_running_loop(), {})
+    future = pending.pop((platform, message_id), None)
+    if future is not None and not future.done():
+        future.set_result(result)
+
+
+def claim_message(**fields):
+    """插入入站消息记录作为处理占位，返回 Message；消息已处理完成时返回 None。
+
+    消息ID 已存在但还没有处理完成（上次处理中途进程退出）时接管这条记录，返回它重新处理。
+    """
+    from apps.channel.models import Message
+
+    try:
+        with transaction.atomic():
+            return Message.objects.create(**fields)
+    except IntegrityError:
+        message_id = fields.get('platform_message_id')
+        if not message_id:
+            raise
+
+    message = Message.objects.filter(platform=fields['platform'], platform_message_id=message_id).first()
+    if message is None or message.processed:
+        logger.info("消息 %s 已处理过，跳过重复投递", message_id)
+        return None
+
+    logger.warning("消息 %s 上次未处理完成，重新处理", message_id)
+    for name, value in fields.items():
+        setattr(message, name, value)
+    message.save(update_fields=list(fields))
+    return message
+
+
+def prune_message_ids(days=None) -> int:
+    """清空早于保留期的消息ID，返回清理条数。消息记录本身保留。"""
+    from apps.channel.models import Message
+
+    if days is None:
+        days = getattr(settings, 'MESSAGE_ID_RETENTION_DAYS', 7)
+    cutoff = timezone.now() - timedelta(days=days)
+    count = (
+        Message.objects.filter(created_at__lt=cutoff)
+        .exclude(platform_message_id='')
+        .update(platform_message_id='')
+    )
+    if count:
+        logger.info("已清空 %d 条超过 %d 天的消息ID", count, days)
+    return count
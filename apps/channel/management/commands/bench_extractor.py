@@ -0,0 +1,169 @@
+import re
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.channel.article_extractor import extract_article
+from apps.channel.sites import get_site_by_name, site_names
+
+FIXTURE_DIR = Path(__file__).resolve().parents[2] / 'bench_fixtures'
+
+
+def legacy_extract(html: str) -> dict:
+    """旧版 bot.py 中的解析链路：html.parser + 多次 soup.find + 整页正则，仅用于对比。"""
+    title = None
+    publish_date = None
+    soup = BeautifulSoup(html, 'html.parser')
+
+    og_title = soup.find('meta', property='og:title')
+    if og_title and og_title.get('content'):
+        title = og_title['content'].strip()
+    elif soup.title and soup.title.string:
+        title = soup.title.string.strip()
+
+    og_time = soup.find('meta', property='article:published_time') or soup.find('meta', property='og:article:published_time')
+    if og_time and og_time.get('content'):
+        publish_date = og_time['content'].strip()
+    else:
+        meta_time = soup.find('meta', attrs={'name': 'publishdate'}) or soup.find('meta', attrs={'name': 'pubdate'})
+        if meta_time and meta_time.get('content'):
+            publish_date = meta_time['content'].strip()
+        else:
+            time_match = re.search(r'create_time\s*=\s*"([^"]+)"', html) or re.search(r'ct\s*=\s*"(\d{10})"', html)
+            if time_match:
+                time_val = time_match.group(1)
+                if time_val.isdigit() and len(time_val) == 10:
+                    dt_utc = datetime.fromtimestamp(int(time_val), tz=timezone.utc)
+                    publish_date = dt_utc.astimezone(timezone(timedelta(hours=8))).isoformat()
+                else:
+                    publish_date = time_val
+            else:
+                date_match = re.search(r'\b(20[12]\d[-/年](0?[1-9]|1[012])[-/月](0?[1-9]|[12][0-9]|3[01])[日]?)\b', html)
+                if date_match:
+                    publish_date = date_match.group(1)
+
+    content = soup.get_text(separator='\n', strip=True)
+    return {'title': title, 'publish_date': publish_date, 'source': None, 'content': content}
+
+
+def _parser(name):
+    """old / new / site:<站点名> 对应的解析函数。"""
+    if name == 'old':
+        return legacy_extract
+    if name == 'new':
+        return lambda html: extract_article(html, '')
+    site = get_site_by_name(name.split(':', 1)[1])
+    return lambda html: site.parse(html, '')
+
+
+def _measure(func, html, repeat):
+    func(html)  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(html)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+    return result, elapsed_ms
+
+
+def _peak_rss_kb() -> int:
+    # Linux 上 ru_maxrss 在 exec 后保留父进程的值，优先读取当前地址空间的 VmHWM
+    status = Path('/proc/self/status')
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上单位是字节
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+# 预热用的最小页面：libxml2 第一次解析时会初始化解析器和编码表（约 500 KB，每个进程只发生一次），
+# 不预热的话这部分一次性开销会被算进第一页，掩盖每页真正的分配
+WARMUP_HTML = '<html><head><title>t</title></head><body><p>x</p></body></html>'
+
+
+def rss_probe(parser, path) -> int:
+    """预热后解析一次，返回峰值 RSS 的增量（KB）。"""
+    func = _parser(parser)
+    html = Path(path).read_text(encoding='utf-8')
+    func(WARMUP_HTML)
+    before = _peak_rss_kb()
+    func(html)
+    return _peak_rss_kb() - before
+
+
+# 子进程只导入本模块，不执行 django.setup()，避免启动阶段的内存高点盖过解析本身的分配
+PROBE_CODE = (
+    "import sys; from apps.channel.management.commands.bench_extractor import rss_probe; "
+    "print(rss_probe(sys.argv[1], sys.argv[2]))"
+)
+
+
+def _rss_delta(parser, path) -> int:
+    """在独立子进程里解析一次，返回解析引起的峰值 RSS 增量（KB），包含 lxml 等 C 扩展分配的内存。"""
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE_CODE, parser, str(path)],
+        cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+    )
+    return int(result.stdout.strip().splitlines()[-1])
+
+
+class Command(BaseCommand):
+    help = '对比新旧网页解析器在 HTML 样本上的单页耗时与内存峰值'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixtures', default=str(FIXTURE_DIR), help='HTML 样本目录')
+        parser.add_argument('--repeat', type=int, default=20, help='每个样本重复解析次数')
+        parser.add_argument('--site', choices=site_names(), help='只测量指定站点提取器的 parse，不与旧解析器对比')
+
+    def handle(self, *args, **options):
+        files = sorted(Path(options['fixtures']).glob('*.html'))
+        if not files:
+            self.stderr.write(self.style.ERROR(f"目录中没有 HTML 样本: {options['fixtures']}"))
+            return
+
+        repeat = max(1, options['repeat'])
+        if options['site']:
+            self._bench_site(get_site_by_name(options['site']), files, repeat)
+            return
+
+        self.stdout.write(f"{'样本':<24}{'大小KB':>8}{'旧耗时ms':>10}{'新耗时ms':>10}{'旧峰值KB':>10}{'新峰值KB':>10}{'旧正文':>8}{'新正文':>8}")
+        totals = [0.0, 0.0]
+        for path in files:
+            html = path.read_text(encoding='utf-8')
+            old, old_ms = _measure(_parser('old'), html, repeat)
+            new, new_ms = _measure(_parser('new'), html, repeat)
+            old_peak, new_peak = _rss_delta('old', path), _rss_delta('new', path)
+            totals[0] += old_ms
+            totals[1] += new_ms
+            self.stdout.write(
+                f"{path.name:<24}{len(html.encode('utf-8')) / 1024:>8.1f}{old_ms:>10.2f}{new_ms:>10.2f}"
+                f"{old_peak:>10.0f}{new_peak:>10.0f}{len(old['content']):>8}{len(new['content']):>8}"
+            )
+            self.stdout.write(f"    旧: {old['title']} | {old['publish_date']}")
+            self.stdout.write(f"    新: {new['title']} | {new['publish_date']} | {new['source']}")
+
+        self.stdout.write("注：峰值为独立子进程中预热后解析一次的峰值 RSS 增量（VmHWM / ru_maxrss），包含 lxml 的 C 层内存；"
+                          "不含 libxml2 首次解析时一次性的初始化开销。")
+        speedup = totals[0] / totals[1] if totals[1] else 0
+        self.stdout.write(self.style.SUCCESS(f"平均单页耗时: 旧 {totals[0] / len(files):.2f} ms，新 {totals[1] / len(files):.2f} ms（{speedup:.1f}x）"))
+
+    def _bench_site(self, site, files, repeat):
+        self.stdout.write(f"站点提取器: {site.name}")
+        self.stdout.write(f"{'样本':<24}{'大小KB':>8}{'耗时ms':>10}{'峰值KB':>10}{'正文':>8}")
+        for path in files:
+            html = path.read_text(encoding='utf-8')
+            page, elapsed_ms = _measure(_parser(f'site:{site.name}'), html, repeat)
+            peak = _rss_delta(f'site:{site.name}', path)
+            self.stdout.write(
+                f"{path.name:<24}{len(html.encode('utf-8')) / 1024:>8.1f}{elapsed_ms:>10.2f}"
+                f"{peak:>10.0f}{len(page['content'] or ''):>8}"
+            )
+            self.stdout.write(f"    {page['title']} | {page['publish_date']} | {page['source']}")
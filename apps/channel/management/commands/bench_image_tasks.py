@@ -0,0 +1,56 @@
+import time
+from itertools import cycle, islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.ai.extractor import IMAGE_TASK_MODES, extract_task, task_image_urls
+from apps.ai.recognizer import recognize_images_with_inputs
+
+
+def run_mode(mode, text, image_urls, sender_name=None):
+    """按指定模式执行图片识别 + 任务提取，与机器人中的流程一致，返回 (耗时秒, 任务列表)。
+
+    不读写图片识别缓存、循环复用的图片也分别识别，避免后运行的模式沾前面模式的光。
+    """
+    start = time.perf_counter()
+    descriptions, prepared = [], None
+    if mode != 'merged':
+        descriptions, prepared = recognize_images_with_inputs(
+            image_urls, keep_inputs=mode == 'multimodal', use_cache=False,
+        )
+    full_text = "\n".join(filter(None, [text, *descriptions]))
+    tasks = extract_task(
+        full_text, image_urls=task_image_urls(image_urls, mode), sender_name=sender_name, model_inputs=prepared,
+        recognized_images=len(descriptions),
+    )
+    return time.perf_counter() - start, tasks
+
+
+class Command(BaseCommand):
+    help = '对比不同 AI_IMAGE_TASK_MODE 下图片消息的端到端耗时（识别 + 任务提取）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', action='append', required=True, help='图片 URL，可重复指定')
+        parser.add_argument('--counts', default='1,3,6', help='每条消息的图片数量，逗号分隔；图片不足时循环使用')
+        parser.add_argument('--modes', default=','.join(IMAGE_TASK_MODES), help='要对比的模式，逗号分隔')
+        parser.add_argument('--text', default='这是图片消息，请提取图片中的任务信息', help='随图片一起发送的文本')
+
+    def handle(self, *args, **options):
+        if not settings.DASHSCOPE_API_KEY:
+            self.stderr.write(self.style.ERROR('请在 .env 中配置 DASHSCOPE_API_KEY'))
+            return
+
+        modes = [m for m in options['modes'].split(',') if m in IMAGE_TASK_MODES]
+        counts = [int(c) for c in options['counts'].split(',') if c.strip().isdigit()]
+
+        self.stdout.write(f"{'图片数':>6}" + ''.join(f"{m:>14}" for m in modes))
+        for count in counts:
+            image_urls = list(islice(cycle(options['image']), count))
+            row = f"{count:>6}"
+            for mode in modes:
+                elapsed, tasks = run_mode(mode, options['text'], image_urls)
+                row += f"{elapsed:>10.2f}s/{len(tasks) if isinstance(tasks, list) else 1:<2}"
+            self.stdout.write(row)
+
+        self.stdout.write("注：每格为 耗时/提取出的任务数；reuse 与 multimodal 都包含逐张识别的耗时，不使用图片识别缓存。")
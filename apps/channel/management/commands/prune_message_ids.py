@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.channel.idempotency import prune_message_ids
+
+
+class Command(BaseCommand):
+    help = '清空超过保留期的平台消息ID，控制去重索引的大小'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.MESSAGE_ID_RETENTION_DAYS,
+            help='消息ID 保留天数，早于该时间的消息不再参与去重',
+        )
+
+    def handle(self, *args, **options):
+        count = prune_message_ids(days=max(options['days'], 1))
+        self.stdout.write(self.style.SUCCESS(f'已清空 {count} 条过期消息ID'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-17 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channel', '0002_alter_channeluser_platform_alter_message_platform'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=2000, unique=True, verbose_name='规范化URL')),
+                ('title', models.CharField(blank=True, default='', max_length=500, verbose_name='标题')),
+                ('publish_date', models.CharField(blank=True, default='', max_length=50, verbose_name='发布时间')),
+                ('content', models.TextField(blank=True, default='', verbose_name='正文')),
+                ('etag', models.CharField(blank=True, default='', max_length=200, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, default='', max_length=100, verbose_name='Last-Modified')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='大小')),
+                ('validated_at', models.DateTimeField(verbose_name='校验时间')),
+                ('accessed_at', models.DateTimeField(db_index=True, verbose_name='访问时间')),
+            ],
+            options={
+                'verbose_name': '网页缓存',
+                'verbose_name_plural': '网页缓存',
+            },
+        ),
+    ]
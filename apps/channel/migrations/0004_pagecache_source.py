@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channel', '0003_pagecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagecache',
+            name='source',
+            field=models.CharField(blank=True, default='', max_length=200, verbose_name='来源'),
+        ),
+    ]
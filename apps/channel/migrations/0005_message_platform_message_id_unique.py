@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-17 15:48
+
+from django.db import migrations, models
+
+
+def blank_duplicate_message_ids(apps, schema_editor):
+    """历史数据中重复投递产生的多条记录只保留最早一条的消息ID，其余清空，避免建唯一约束失败。"""
+    Message = apps.get_model('channel', 'Message')
+    seen = set()
+    duplicate_ids = []
+    rows = (
+        Message.objects.exclude(platform_message_id='')
+        .order_by('created_at', 'id')
+        .values_list('id', 'platform', 'platform_message_id')
+    )
+    for pk, platform, message_id in rows.iterator():
+        key = (platform, message_id)
+        if key in seen:
+            duplicate_ids.append(pk)
+        else:
+            seen.add(key)
+    if duplicate_ids:
+        Message.objects.filter(id__in=duplicate_ids).update(platform_message_id='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channel', '0004_pagecache_source'),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_duplicate_message_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('platform_message_id', ''), _negated=True), fields=('platform', 'platform_message_id'), name='uniq_platform_message_id'),
+        ),
+    ]
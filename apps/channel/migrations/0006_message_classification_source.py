@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-17 15:55
+
+from django.db import migrations, models
+
+
+def mark_legacy_classifications(apps, schema_editor):
+    """字段上线前已分类的入站消息标记为 legacy，本地分类器据此区分历史标签和新的未分类消息。"""
+    Message = apps.get_model('channel', 'Message')
+    Message.objects.filter(direction='inbound').exclude(ai_classification='').update(classification_source='legacy')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channel', '0005_message_platform_message_id_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='classification_source',
+            field=models.CharField(blank=True, choices=[('llm', '大模型'), ('rules', '规则'), ('local', '本地模型'), ('default', '默认'), ('legacy', '历史数据')], default='', max_length=10, verbose_name='分类来源'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='classification_input',
+            field=models.TextField(blank=True, default='', verbose_name='分类输入'),
+        ),
+        migrations.RunPython(mark_legacy_classifications, migrations.RunPython.noop),
+    ]
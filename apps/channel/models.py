@@ -18,6 +18,15 @@ MESSAGE_TYPE_CHOICES = [
     ('file', '文件'),
 ]
 
+CLASSIFICATION_SOURCE_CHOICES = [
+    ('llm', '大模型'),
+    ('rules', '规则'),
+    ('local', '本地模型'),
+    ('default', '默认'),
+    # classification_source 字段上线前的分类结果（由 channel 0006 迁移标记），当时均由大模型给出
+    ('legacy', '历史数据'),
+]
+
 CLASSIFICATION_CHOICES = [
     ('urgent', '紧急'),
     ('important', '重要'),
@@ -53,13 +62,49 @@ class Message(models.Model):
     ai_classification = models.CharField(
         'AI分类', max_length=20, choices=CLASSIFICATION_CHOICES, blank=True, default='',
     )
+    # 区分标签来源：训练本地分类器时只使用大模型给出的标签
+    classification_source = models.CharField(
+        '分类来源', max_length=10, choices=CLASSIFICATION_SOURCE_CHOICES, blank=True, default='',
+    )
+    # 实际送去分类的文本（去掉 @ 后的正文 + 图片识别结果），本地分类器用它训练，和线上打分的输入保持一致
+    classification_input = models.TextField('分类输入', blank=True, default='')
     processed = models.BooleanField('已处理', default=False)
     created_at = models.DateTimeField('创建时间', auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            # 平台消息ID 作为幂等键：同一条消息重复投递时插入失败，不会重复处理；
+            # 过期的消息ID 会被 prune_message_ids 清空，不再占用索引
+            models.UniqueConstraint(
+                fields=['platform', 'platform_message_id'],
+                condition=~models.Q(platform_message_id=''),
+                name='uniq_platform_message_id',
+            ),
+        ]
         verbose_name = '消息'
         verbose_name_plural = '消息'
 
     def __str__(self):
         return f'[{self.get_direction_display()}] {self.content[:50]}'
+
+
+class PageCache(models.Model):
+    """抓取过的网页解析结果缓存，带 HTTP 校验信息用于条件请求。"""
+    url = models.CharField('规范化URL', max_length=2000, unique=True)
+    title = models.CharField('标题', max_length=500, blank=True, default='')
+    publish_date = models.CharField('发布时间', max_length=50, blank=True, default='')
+    source = models.CharField('来源', max_length=200, blank=True, default='')
+    content = models.TextField('正文', blank=True, default='')
+    etag = models.CharField('ETag', max_length=200, blank=True, default='')
+    last_modified = models.CharField('Last-Modified', max_length=100, blank=True, default='')
+    size = models.PositiveIntegerField('大小', default=0)
+    validated_at = models.DateTimeField('校验时间')
+    accessed_at = models.DateTimeField('访问时间', db_index=True)
+
+    class Meta:
+        verbose_name = '网页缓存'
+        verbose_name_plural = '网页缓存'
+
+    def __str__(self):
+        return self.title or self.url
@@ -0,0 +1,178 @@
+"""网页抓取结果缓存。
+
+按规范化 URL 缓存解析后的标题、发布时间、来源和正文，以及响应的 ETag /
+Last-Modified。TTL 内直接命中缓存；过期后带条件请求头重新校验，
+页面未变化时服务端返回 304，不需要重新下载和解析。
+缓存总大小超过上限时按最近访问时间淘汰（每写入 EVICT_CHECK_INTERVAL 条检查一次）。
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Sum
+from django.utils import timezone
+
+from apps.channel import fetch_policy, fetcher
+from apps.channel.blocking import run_blocking
+from apps.todo.knowledge_index import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# 每写入多少条检查一次缓存总大小，避免每次写入都对整张表做聚合
+EVICT_CHECK_INTERVAL = 20
+
+_writes_lock = threading.Lock()
+_writes = 0
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'PAGE_CACHE_TTL', 6 * 3600))
+
+
+def _as_page(entry):
+    return {
+        'title': entry.title,
+        'publish_date': entry.publish_date or None,
+        'source': entry.source or None,
+        'content': entry.content,
+    }
+
+
+def get_entry(url):
+    from apps.channel.models import PageCache
+    return PageCache.objects.filter(url=normalize_url(url)).first()
+
+
+def is_fresh(entry) -> bool:
+    return entry.validated_at + _ttl() > timezone.now()
+
+
+def conditional_headers(entry) -> dict:
+    headers = {}
+    if entry.etag:
+        headers['If-None-Match'] = entry.etag
+    if entry.last_modified:
+        headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+def touch(entry, revalidated=False):
+    """记录一次命中；revalidated 表示刚通过 304 校验，重置 TTL。"""
+    now = timezone.now()
+    entry.accessed_at = now
+    update_fields = ['accessed_at']
+    if revalidated:
+        entry.validated_at = now
+        update_fields.append('validated_at')
+    entry.save(update_fields=update_fields)
+
+
+def store(url, response, page: dict):
+    """写入/更新缓存，每写入 EVICT_CHECK_INTERVAL 条检查一次容量，超限时淘汰最久未访问的条目。
+
+    写入失败（如超长 URL）只记录日志，不影响已经抓取解析好的页面。
+    """
+    global _writes
+    from apps.channel.models import PageCache
+
+    now = timezone.now()
+    title = page.get('title') or ''
+    content = page.get('content') or ''
+    try:
+        PageCache.objects.update_or_create(
+            url=normalize_url(url),
+            defaults={
+                'title': title[:500],
+                'publish_date': page.get('publish_date') or '',
+                'source': (page.get('source') or '')[:200],
+                'content': content,
+                'etag': response.headers.get('ETag', ''),
+                'last_modified': response.headers.get('Last-Modified', ''),
+                'size': len(title.encode('utf-8')) + len(content.encode('utf-8')),
+                'validated_at': now,
+                'accessed_at': now,
+            },
+        )
+    except DatabaseError:
+        logger.exception("写入网页缓存失败: %s", url)
+        return
+
+    with _writes_lock:
+        _writes += 1
+        check = _writes % EVICT_CHECK_INTERVAL == 0
+    if check:
+        evict()
+
+
+def evict():
+    from apps.channel.models import PageCache
+
+    max_bytes = getattr(settings, 'PAGE_CACHE_MAX_BYTES', 50 * 1024 * 1024)
+    total = PageCache.objects.aggregate(total=Sum('size'))['total'] or 0
+    if total <= max_bytes:
+        return
+
+    removed = 0
+    for pk, size in PageCache.objects.order_by('accessed_at').values_list('id', 'size').iterator():
+        if total <= max_bytes:
+            break
+        PageCache.objects.filter(id=pk).delete()
+        total -= size
+        removed += 1
+    logger.info("网页缓存超过容量上限，淘汰 %d 条最久未访问的记录", removed)
+
+
+def fetch_page_sync(client, url, parse, fallback=None, **kwargs):
+    """同步版本的带缓存流式抓取，parse(response) 返回 {'title', 'publish_date', 'source', 'content'}。
+
+    返回页面字典；请求失败时抛出 httpx 异常，域名熔断时抛出 fetch_policy.CircuitOpenError。
+    parse 抛出异常或返回 fallback（解析失败时的兜底页面）时不写缓存。
+    """
+    entry = get_entry(url)
+    if entry and is_fresh(entry):
+        touch(entry)
+        logger.info("网页缓存命中: %s", url)
+        return _as_page(entry)
+
+    headers = conditional_headers(entry) if entry else {}
+    response = fetch_policy.call_sync(
+        url, lambda timeout: fetcher.fetch_page_sync(client, url, headers=headers, timeout=timeout, **kwargs)
+    )
+    if response.status_code == 304 and entry:
+        touch(entry, revalidated=True)
+        logger.info("网页未变化 (304)，使用缓存: %s", url)
+        return _as_page(entry)
+
+    response.raise_for_status()
+    page = fetcher.media_page(response, url) if response.media else parse(response)
+    if fallback is not None and page == fallback:
+        logger.warning("网页解析失败，不写入缓存: %s", url)
+    else:
+        store(url, response, page)
+    return page
+
+
+async def get_fresh_page(url):
+    """TTL 内的缓存命中直接返回页面字典，否则返回 (None, entry) 供条件请求使用。"""
+    entry = await run_blocking(get_entry)(url)
+    if entry and is_fresh(entry):
+        await run_blocking(touch)(entry)
+        logger.info("网页缓存命中: %s", url)
+        return _as_page(entry), entry
+    return None, entry
+
+
+async def revalidated_page(entry):
+    await run_blocking(touch)(entry, revalidated=True)
+    return _as_page(entry)
+
+
+def stale_page(entry):
+    """抓取失败（如域名熔断）时退回过期的缓存内容，不重置 TTL。"""
+    return _as_page(entry)
+
+
+async def astore(url, response, page: dict):
+    await run_blocking(store)(url, response, page)
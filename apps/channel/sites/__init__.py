@@ -0,0 +1,49 @@
+"""按域名选择站点提取器。
+
+新增站点只需在子模块中定义 SiteExtractor 子类并用 @register 注册，
+不需要修改链接处理流程。
+"""
+from urllib.parse import urlsplit
+
+from .base import FETCH_FULL, FETCH_STREAM, SiteExtractor
+
+_SITES_BY_HOST = {}
+_SITES_BY_NAME = {}
+_GENERIC = SiteExtractor()
+
+
+def register(cls):
+    site = cls()
+    _SITES_BY_NAME[site.name] = site
+    for host in cls.hosts:
+        _SITES_BY_HOST[host] = site
+    return cls
+
+
+def get_site(url: str) -> SiteExtractor:
+    """按域名查找提取器，依次尝试 a.b.example.com → b.example.com → example.com。"""
+    host = (urlsplit(url).hostname or '').lower()
+    while host:
+        site = _SITES_BY_HOST.get(host)
+        if site:
+            return site
+        _, _, host = host.partition('.')
+    return _GENERIC
+
+
+def get_site_by_name(name: str) -> SiteExtractor:
+    if name == _GENERIC.name:
+        return _GENERIC
+    return _SITES_BY_NAME[name]
+
+
+def site_names() -> list[str]:
+    return [_GENERIC.name, *_SITES_BY_NAME]
+
+
+from . import common, wechat, xiaohongshu  # noqa: E402,F401  注册内置站点
+
+__all__ = [
+    'FETCH_FULL', 'FETCH_STREAM', 'SiteExtractor',
+    'get_site', 'get_site_by_name', 'register', 'site_names',
+]
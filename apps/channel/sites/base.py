@@ -0,0 +1,42 @@
+import logging
+from urllib.parse import urlsplit
+
+from apps.channel.article_extractor import extract_article
+
+logger = logging.getLogger(__name__)
+
+# 抓取策略：
+# - stream: 流式下载（字节上限 + 二进制短路）并走网页缓存，适合普通文章页
+# - full: 完整下载且不缓存，适合需要 Cookie、正文藏在页面末尾状态数据里的站点
+FETCH_STREAM = 'stream'
+FETCH_FULL = 'full'
+
+
+class SiteExtractor:
+    """站点提取器基类。
+
+    子类通过 hosts 声明负责的域名（含子域名），并可覆盖请求 profile、
+    URL 规范化、抓取策略和解析逻辑。
+    """
+    name = 'generic'
+    source_name = ''
+    hosts = ()
+    profile = 'default'
+    fetch_strategy = FETCH_STREAM
+
+    def get_source_name(self, url: str) -> str:
+        return self.source_name or (urlsplit(url).hostname or '').lower()
+
+    def canonicalize(self, url: str) -> str:
+        """返回实际请求与缓存使用的 URL。"""
+        return url
+
+    def default_page(self, url: str) -> dict:
+        return {'title': url, 'publish_date': None, 'source': None, 'content': ''}
+
+    def parse(self, html: str, url: str) -> dict:
+        """解析 HTML，返回 {'title', 'publish_date', 'source', 'content'}。"""
+        page = self.default_page(url)
+        article = extract_article(html, url)
+        page.update({k: v for k, v in article.items() if v})
+        return page
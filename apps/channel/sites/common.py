@@ -0,0 +1,23 @@
+from . import register
+from .base import SiteExtractor
+
+
+@register
+class JuejinSite(SiteExtractor):
+    name = 'juejin'
+    source_name = '掘金'
+    hosts = ('juejin.cn', 'juejin.im')
+
+
+@register
+class CsdnSite(SiteExtractor):
+    name = 'csdn'
+    source_name = 'CSDN'
+    hosts = ('csdn.net',)
+
+
+@register
+class DouyinSite(SiteExtractor):
+    name = 'douyin'
+    source_name = '抖音'
+    hosts = ('douyin.com', 'iesdouyin.com')
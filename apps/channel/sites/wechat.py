@@ -0,0 +1,28 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from . import register
+from .base import SiteExtractor
+
+# 公众号文章链接中真正定位文章的参数，其余（chksm / scene / sessionid 等）都是分享追踪
+ARTICLE_PARAMS = ('__biz', 'mid', 'idx', 'sn')
+
+
+@register
+class WechatArticleSite(SiteExtractor):
+    """微信公众号文章。发布时间 (ct) 和公众号名称由通用提取器从脚本中读取。"""
+    name = 'wechat'
+    source_name = '公众号'
+    hosts = ('mp.weixin.qq.com',)
+
+    def canonicalize(self, url: str) -> str:
+        parts = urlsplit(url)
+        if parts.path.startswith('/s/'):
+            # 短链接形式 /s/<id>，参数都是追踪用的
+            return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        kept = [(k, params[k]) for k in ARTICLE_PARAMS if k in params]
+        if not kept:
+            # 临时链接（/s?src=…&timestamp=…&signature=…）靠全部参数定位文章，不能删减
+            return url
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(kept), ''))
@@ -0,0 +1,962 @@
+import asyncio
+import json
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from apps.channel import blocking, fetch_policy, fetcher, http_clients, idempotency, page_cache, tracing
+from apps.channel.article_extractor import extract_article
+from apps.ai.llm import StreamError
+from apps.channel.dingtalk import bot, links, utils
+from apps.channel.dingtalk.bot import YgaiBotHandler
+from apps.channel.dingtalk.token import TokenManager
+from apps.channel.dingtalk.worker import MessageWorkerPool
+from apps.channel.models import ChannelUser, Message
+from apps.channel.sites import get_site
+
+ARTICLE_HTML = """<html><head><title>测试文章</title></head><body><article>
+<h1>测试文章</h1><p>这是一段足够长的正文内容，用来让正文提取器识别出文章主体。</p>
+<p>第二段正文继续补充一些内容，保证提取结果里有正文。</p></article></body></html>"""
+
+
+def html_transport(body):
+    return httpx.MockTransport(lambda request: httpx.Response(
+        200, headers={'Content-Type': 'text/html; charset=utf-8'}, text=body,
+    ))
+
+
+class PageCacheStoreTests(TransactionTestCase):
+    """异步路径在 run_blocking 的线程里用独立连接读写缓存，不能包在测试事务里。"""
+    url = 'https://example.com/post/1'
+
+    def fetch_sync(self, parse):
+        site = get_site(self.url)
+        client = httpx.Client(transport=html_transport(ARTICLE_HTML))
+        return page_cache.fetch_page_sync(client, self.url, parse, fallback=site.default_page(self.url))
+
+    def test_sync_parse_fallback_is_not_cached(self):
+        site = get_site(self.url)
+        page = self.fetch_sync(lambda response: site.default_page(self.url))
+
+        self.assertEqual(page, site.default_page(self.url))
+        self.assertIsNone(page_cache.get_entry(self.url))
+
+    def test_sync_parse_error_is_not_cached(self):
+        def parse(response):
+            raise ValueError('bad html')
+
+        with self.assertRaises(ValueError):
+            self.fetch_sync(parse)
+        self.assertIsNone(page_cache.get_entry(self.url))
+
+    def test_sync_parsed_page_is_cached(self):
+        site = get_site(self.url)
+        page = self.fetch_sync(lambda response: site.parse(response.text, self.url))
+
+        self.assertEqual(page['title'], '测试文章')
+        self.assertIsNotNone(page_cache.get_entry(self.url))
+
+    def test_long_url_is_cached(self):
+        url = 'https://example.com/post?q=' + 'x' * 1500
+        site = get_site(url)
+        client = httpx.Client(transport=html_transport(ARTICLE_HTML))
+        page_cache.fetch_page_sync(client, url, lambda response: site.parse(response.text, url),
+                                   fallback=site.default_page(url))
+
+        self.assertIsNotNone(page_cache.get_entry(url))
+
+    def test_store_error_keeps_fetched_page(self):
+        site = get_site(self.url)
+        with mock.patch('apps.channel.models.PageCache.objects.update_or_create',
+                        side_effect=DatabaseError('value too long')):
+            page = self.fetch_sync(lambda response: site.parse(response.text, self.url))
+
+        self.assertEqual(page['title'], '测试文章')
+        self.assertIsNone(page_cache.get_entry(self.url))
+
+    def test_eviction_checked_every_n_writes(self):
+        response = httpx.Response(200, headers={'ETag': '"v1"'})
+        page = {'title': '标题', 'content': '正文'}
+        with mock.patch.object(page_cache, '_writes', 0), mock.patch.object(page_cache, 'evict') as evict:
+            for i in range(page_cache.EVICT_CHECK_INTERVAL * 2 + 1):
+                page_cache.store(f'https://example.com/evict/{i}', response, page)
+
+        self.assertEqual(evict.call_count, 2)
+
+    @override_settings(PAGE_CACHE_MAX_BYTES=100)
+    def test_evict_removes_least_recently_accessed(self):
+        response = httpx.Response(200)
+        for i in range(3):
+            page_cache.store(f'https://example.com/lru/{i}', response, {'title': '', 'content': 'x' * 60})
+        page_cache.touch(page_cache.get_entry('https://example.com/lru/0'))
+
+        page_cache.evict()
+
+        self.assertIsNotNone(page_cache.get_entry('https://example.com/lru/0'))
+        self.assertIsNone(page_cache.get_entry('https://example.com/lru/1'))
+        self.assertIsNone(page_cache.get_entry('https://example.com/lru/2'))
+
+    async def fetch_streamed(self, parse_error=False):
+        site = get_site(self.url)
+        client = httpx.AsyncClient(transport=html_transport(ARTICLE_HTML))
+        with mock.patch.object(links, 'get_async_client', return_value=client):
+            if parse_error:
+                with mock.patch.object(type(site), 'parse', side_effect=ValueError('bad html')):
+                    return await links._fetch_streamed(site, self.url)
+            return await links._fetch_streamed(site, self.url)
+
+    async def test_streamed_parse_error_is_not_cached(self):
+        page = await self.fetch_streamed(parse_error=True)
+        cached, _ = await page_cache.get_fresh_page(self.url)
+
+        self.assertEqual(page, get_site(self.url).default_page(self.url))
+        self.assertIsNone(cached)
+
+    async def test_streamed_parsed_page_is_cached(self):
+        page = await self.fetch_streamed()
+        cached, _ = await page_cache.get_fresh_page(self.url)
+
+        self.assertEqual(page['title'], '测试文章')
+        self.assertEqual(cached['title'], '测试文章')
+
+
+class IngestUrlsTests(SimpleTestCase):
+    async def ingest(self, urls, concurrency):
+        running = peak = 0
+
+        async def ingest_url(url, sender_nick):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            try:
+                # 越靠前的链接越慢，完成顺序与输入顺序相反
+                await asyncio.sleep(0.01 * (len(urls) - urls.index(url)))
+                if 'boom' in url:
+                    raise RuntimeError('boom')
+                if 'skip' in url:
+                    return None
+                return {'url': url, 'sender': sender_nick}
+            finally:
+                running -= 1
+
+        with mock.patch.object(links, 'ingest_url', ingest_url):
+            results = await links.ingest_urls(urls, '张三', concurrency=concurrency)
+        return results, peak
+
+    async def test_results_keep_input_order(self):
+        urls = [f'https://example.com/{i}' for i in range(4)]
+        results, _ = await self.ingest(urls, concurrency=4)
+
+        self.assertEqual([info['url'] for info in results], urls)
+        self.assertTrue(all(info['sender'] == '张三' for info in results))
+
+    async def test_failed_url_does_not_affect_others(self):
+        urls = ['https://example.com/a', 'https://example.com/boom', 'https://example.com/skip', 'https://example.com/b']
+        with self.assertLogs('apps.channel.dingtalk.links', level='ERROR'):
+            results, _ = await self.ingest(urls, concurrency=4)
+
+        self.assertEqual([info['url'] for info in results], ['https://example.com/a', 'https://example.com/b'])
+
+    async def test_concurrency_limit(self):
+        urls = [f'https://example.com/{i}' for i in range(6)]
+        results, peak = await self.ingest(urls, concurrency=2)
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(peak, 2)
+
+    async def test_empty_urls(self):
+        self.assertEqual(await links.ingest_urls([], '张三'), [])
+
+
+class ArticleExtractorTests(SimpleTestCase):
+    fixtures_dir = Path(__file__).resolve().parent / 'bench_fixtures'
+
+    def fixture(self, name):
+        return extract_article((self.fixtures_dir / name).read_text(encoding='utf-8'))
+
+    def test_blog_fixture(self):
+        page = self.fixture('blog_post.html')
+
+        self.assertEqual(page['title'], 'Practical RAG pipelines | Example Engineering Blog')
+        self.assertEqual(page['publish_date'], '2024-02-27T09:30:00+00:00')
+        self.assertEqual(page['source'], 'Example Engineering')
+        self.assertTrue(page['content'])
+
+    def test_wechat_fixture(self):
+        page = self.fixture('wechat_article.html')
+
+        self.assertEqual(page['title'], '一文讲透 AI Agent 的工程化落地')
+        self.assertEqual(page['publish_date'], '2024-02-27T13:00:00+08:00')
+        # 公众号名称优先于 og:site_name（微信公众平台）
+        self.assertEqual(page['source'], '智能体工程笔记')
+
+    def test_meta_and_main_container(self):
+        body = '这是正文段落，包含足够多的文字。' * 20
+        page = extract_article(f"""<html><head><title>页面标题</title>
+            <meta property="og:title" content="分享标题">
+            <meta name="pubdate" content="2024-03-01">
+            <meta property="og:site_name" content="示例站点"></head>
+            <body><nav><a href="/">首页</a><a href="/a">归档</a></nav>
+            <div class="sidebar">侧边栏推荐</div>
+            <article><h1>分享标题</h1><p>{body}</p><div class="share">分享到微博</div></article>
+            <footer>版权所有</footer></body></html>""")
+
+        self.assertEqual(page['title'], '分享标题')
+        self.assertEqual(page['publish_date'], '2024-03-01T00:00:00+08:00')
+        self.assertEqual(page['source'], '示例站点')
+        self.assertIn(body, page['content'])
+        for boilerplate in ('首页', '侧边栏推荐', '分享到微博', '版权所有'):
+            self.assertNotIn(boilerplate, page['content'])
+
+    def test_wechat_script_time_and_nickname(self):
+        page = extract_article("""<html><head><title>公众号文章</title>
+            <script>var nickname = htmlDecode("技术周刊"); var ct = "1709010000";</script></head>
+            <body><div id="js_content"><p>正文</p></div></body></html>""")
+
+        self.assertEqual(page['title'], '公众号文章')
+        self.assertEqual(page['publish_date'], '2024-02-27T13:00:00+08:00')
+        self.assertEqual(page['source'], '技术周刊')
+        self.assertEqual(page['content'], '正文')
+
+    def test_date_from_body_and_link_lines_dropped(self):
+        page = extract_article("""<html><body>
+            <p><a href="/1">上一篇</a> <a href="/2">下一篇</a></p>
+            <p>发布于 2023年11月8日，作者张三</p></body></html>""")
+
+        self.assertIsNone(page['title'])
+        self.assertEqual(page['publish_date'], '2023-11-08T00:00:00+08:00')
+        self.assertEqual(page['content'], '发布于 2023年11月8日，作者张三')
+
+    def test_malformed_html(self):
+        empty = {'title': None, 'publish_date': None, 'source': None, 'content': ''}
+        self.assertEqual(extract_article(''), empty)
+        self.assertEqual(extract_article('   '), empty)
+
+        xml = extract_article('<?xml version="1.0" encoding="utf-8"?><html><body><p>XML 头</p></body></html>')
+        self.assertEqual(xml['content'], 'XML 头')
+
+        broken = extract_article('<html><head><title>标签错乱</title><body><div><p>第一段<p>第二段</div></span><b>结尾')
+        self.assertEqual(broken['title'], '标签错乱')
+        self.assertEqual(broken['content'], '第一段\n第二段\n结尾')
+
+        nested = extract_article('<div>' * 2000 + '深层内容' + '</div>' * 2000)
+        self.assertIn('深层内容', nested['content'])
+
+
+class WechatCanonicalizeTests(SimpleTestCase):
+    def canonicalize(self, url):
+        return get_site(url).canonicalize(url)
+
+    def test_keeps_article_params_only(self):
+        url = 'https://mp.weixin.qq.com/s?__biz=MzA&mid=22&idx=1&sn=abc&chksm=x&scene=21#wechat_redirect'
+        self.assertEqual(self.canonicalize(url), 'https://mp.weixin.qq.com/s?__biz=MzA&mid=22&idx=1&sn=abc')
+
+    def test_short_link_drops_tracking(self):
+        url = 'https://mp.weixin.qq.com/s/AbCdEf?scene=1'
+        self.assertEqual(self.canonicalize(url), 'https://mp.weixin.qq.com/s/AbCdEf')
+
+    def test_temporary_link_unchanged(self):
+        url = 'https://mp.weixin.qq.com/s?src=11&timestamp=1700000000&ver=1&signature=abc*def'
+        self.assertEqual(self.canonicalize(url), url)
+
+
+class RunBlockingTests(SimpleTestCase):
+    async def test_worker_thread_connections_cleaned_up(self):
+        calls = []
+
+        def record(name):
+            return lambda: calls.append((name, threading.get_ident()))
+
+        def lookup(url):
+            calls.append(('call', threading.get_ident()))
+            raise RuntimeError(url)
+
+        with mock.patch.object(blocking, 'close_old_connections', side_effect=record('before')), \
+                mock.patch.object(blocking.connections, 'close_all', side_effect=record('after')):
+            with self.assertRaises(RuntimeError):
+                await blocking.run_blocking(lookup)('https://example.com')
+
+        self.assertEqual([name for name, _ in calls], ['before', 'call', 'after'])
+        self.assertEqual(len({ident for _, ident in calls}), 1)
+        self.assertNotEqual(calls[0][1], threading.get_ident())
+
+
+class IdempotencyTests(TestCase):
+    async def test_duplicate_waits_for_first_result(self):
+        self.assertIsNone(idempotency.begin('dingtalk', 'msg-1'))
+        pending = idempotency.begin('dingtalk', 'msg-1')
+        self.assertIsNotNone(pending)
+
+        idempotency.finish('dingtalk', 'msg-1', ('ok', 'OK'))
+
+        self.assertEqual(await pending, ('ok', 'OK'))
+        self.assertIsNone(idempotency.begin('dingtalk', 'msg-1'))
+        idempotency.finish('dingtalk', 'msg-1')
+
+    async def test_empty_message_id_not_tracked(self):
+        self.assertIsNone(idempotency.begin('dingtalk', ''))
+        self.assertIsNone(idempotency.begin('dingtalk', ''))
+
+    def test_claim_message_once(self):
+        user = ChannelUser.objects.create(platform='dingtalk', platform_user_id='u1', name='张三')
+        fields = {'channel_user': user, 'platform': 'dingtalk', 'content': '你好', 'platform_message_id': 'msg-2'}
+
+        message = idempotency.claim_message(**fields)
+        Message.objects.filter(pk=message.pk).update(processed=True)
+
+        self.assertIsNone(idempotency.claim_message(**fields))
+        self.assertEqual(Message.objects.filter(platform_message_id='msg-2').count(), 1)
+
+    def test_unprocessed_claim_taken_over(self):
+        user = ChannelUser.objects.create(platform='dingtalk', platform_user_id='u1', name='张三')
+        fields = {'channel_user': user, 'platform': 'dingtalk', 'content': '你好', 'platform_message_id': 'msg-4'}
+        first = idempotency.claim_message(**fields)
+
+        again = idempotency.claim_message(**fields)
+
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(Message.objects.filter(platform_message_id='msg-4').count(), 1)
+
+    async def test_redelivery_after_crash_is_processed(self):
+        user = await ChannelUser.objects.acreate(platform='dingtalk', platform_user_id='u1', name='张三')
+        # 第一次投递只来得及占位，进程就退出了
+        await Message.objects.acreate(channel_user=user, platform='dingtalk', content='周五前交周报',
+                                      platform_message_id='msg-5')
+        callback = SimpleNamespace(data={
+            'msgId': 'msg-5', 'msgtype': 'text', 'text': {'content': '周五前交周报'},
+            'senderStaffId': 'u1', 'senderNick': '张三', 'conversationType': '2',
+        })
+
+        classify = mock.AsyncMock(return_value=('ignore', 'llm'))
+        with mock.patch.object(bot, 'aclassify_message_with_source', classify):
+            await YgaiBotHandler().handle_message(callback)
+
+        message = await Message.objects.aget(platform_message_id='msg-5')
+        classify.assert_awaited_once()
+        self.assertTrue(message.processed)
+        self.assertEqual(message.ai_classification, 'ignore')
+
+    async def test_redelivery_handled_once(self):
+        handler = YgaiBotHandler()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def handle(callback):
+            started.set()
+            await release.wait()
+            return 'OK', 'done'
+
+        callback = SimpleNamespace(data={'msgId': 'msg-3'})
+        with mock.patch.object(handler, '_handle_message', side_effect=handle) as inner:
+            first = asyncio.ensure_future(handler.handle_message(callback))
+            await started.wait()
+            second = asyncio.ensure_future(handler.handle_message(callback))
+            await asyncio.sleep(0)
+            release.set()
+            results = await asyncio.gather(first, second)
+
+        self.assertEqual(results, [('OK', 'done'), ('OK', 'done')])
+        self.assertEqual(inner.await_count, 1)
+
+
+@override_settings(PAGE_FETCH_BREAKER_THRESHOLD=2, PAGE_FETCH_BREAKER_COOLDOWN=60)
+class HostBreakerTests(SimpleTestCase):
+    host = 'example.com'
+
+    def setUp(self):
+        self.breaker = fetch_policy.HostBreaker()
+        self.now = 1000.0
+        patcher = mock.patch.object(fetch_policy.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail(self):
+        self.breaker.before_request(self.host)
+        self.breaker.record(self.host, ok=False, elapsed_ms=10)
+
+    def state(self):
+        return self.breaker.stats()[0]['state']
+
+    def test_opens_after_threshold(self):
+        self.fail()
+        self.assertEqual(self.state(), fetch_policy.STATE_CLOSED)
+        self.fail()
+        self.assertEqual(self.state(), fetch_policy.STATE_OPEN)
+
+        with self.assertRaises(fetch_policy.CircuitOpenError):
+            self.breaker.before_request(self.host)
+        self.assertEqual(self.breaker.stats()[0]['rejected'], 1)
+
+    def test_success_resets_failure_count(self):
+        self.fail()
+        self.breaker.record(self.host, ok=True, elapsed_ms=10)
+        self.fail()
+        self.assertEqual(self.state(), fetch_policy.STATE_CLOSED)
+
+    def test_half_open_allows_one_probe_and_recovers(self):
+        self.fail()
+        self.fail()
+        self.now += 61
+
+        self.breaker.before_request(self.host)
+        self.assertEqual(self.state(), fetch_policy.STATE_HALF_OPEN)
+        with self.assertRaises(fetch_policy.CircuitOpenError):
+            self.breaker.before_request(self.host)
+
+        self.breaker.record(self.host, ok=True, elapsed_ms=10)
+        self.assertEqual(self.state(), fetch_policy.STATE_CLOSED)
+        self.breaker.before_request(self.host)
+
+    def test_failed_probe_reopens(self):
+        self.fail()
+        self.fail()
+        self.now += 61
+        self.fail()
+
+        self.assertEqual(self.state(), fetch_policy.STATE_OPEN)
+        with self.assertRaises(fetch_policy.CircuitOpenError):
+            self.breaker.before_request(self.host)
+
+    def test_release_frees_probe_slot(self):
+        self.fail()
+        self.fail()
+        self.now += 61
+        self.breaker.before_request(self.host)
+        self.breaker.release(self.host)
+        self.breaker.before_request(self.host)
+
+
+@override_settings(PAGE_FETCH_RETRIES=3, PAGE_FETCH_BREAKER_THRESHOLD=5)
+class FetchPolicyCallTests(SimpleTestCase):
+    """call 和 call_sync 共用同一套重试 / 熔断逻辑，两者的行为应完全一致。"""
+    url = 'https://example.com/a'
+
+    def setUp(self):
+        for patcher in (mock.patch.object(fetch_policy, 'breaker', fetch_policy.HostBreaker()),
+                        mock.patch.object(fetch_policy, 'backoff_delay', return_value=0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def responses(self, *outcomes):
+        outcomes = iter(outcomes)
+        sent = []
+
+        def send(timeout):
+            sent.append(timeout)
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return httpx.Response(outcome)
+        return send, sent
+
+    async def run_both(self, *outcomes):
+        """分别用 call_sync 和 call 执行，返回两次的 (结果或异常, 发送次数)。"""
+        results = []
+        for is_async in (False, True):
+            fetch_policy.breaker = fetch_policy.HostBreaker()
+            send, sent = self.responses(*outcomes)
+            try:
+                if is_async:
+                    async def asend(timeout):
+                        return send(timeout)
+                    result = await fetch_policy.call(self.url, asend)
+                else:
+                    result = fetch_policy.call_sync(self.url, send)
+            except Exception as e:
+                result = e
+            results.append((result, len(sent)))
+        return results
+
+    async def test_retries_until_success(self):
+        for result, sent in await self.run_both(503, httpx.ConnectError('down'), 200):
+            self.assertEqual((result.status_code, sent), (200, 3))
+
+    async def test_returns_last_retryable_response(self):
+        for result, sent in await self.run_both(503, 502, 429):
+            self.assertEqual((result.status_code, sent), (429, 3))
+
+    async def test_raises_last_network_error(self):
+        for result, sent in await self.run_both(httpx.ConnectError('a'), httpx.ConnectError('b'), httpx.ReadTimeout('c')):
+            self.assertIsInstance(result, httpx.ReadTimeout)
+            self.assertEqual(sent, 3)
+            self.assertEqual(fetch_policy.breaker.stats()[0]['timeouts'], 1)
+
+    async def test_non_retryable_status_returned_immediately(self):
+        for result, sent in await self.run_both(404):
+            self.assertEqual((result.status_code, sent), (404, 1))
+
+    @override_settings(PAGE_FETCH_BREAKER_THRESHOLD=2)
+    async def test_stops_retrying_once_breaker_opens(self):
+        for result, sent in await self.run_both(503, 503, 200):
+            self.assertEqual((result.status_code, sent), (503, 2))
+            self.assertTrue(fetch_policy.breaker.is_open('example.com'))
+
+
+class StreamReplyCardTests(SimpleTestCase):
+    async def test_interrupted_stream_marks_card_failed(self):
+        async def astream_reply(text):
+            yield '半截'
+            raise StreamError('timeout')
+
+        card = mock.Mock(start=mock.AsyncMock(return_value=True), update=mock.AsyncMock(),
+                         finish=mock.AsyncMock(), fail=mock.AsyncMock(), updates=1)
+        with mock.patch.object(bot, 'StreamingCard', return_value=card), \
+                mock.patch.object(bot, 'astream_reply', astream_reply):
+            reply = await YgaiBotHandler()._stream_reply('你好', {})
+
+        self.assertEqual(reply, '半截' + bot.STREAM_INTERRUPTED_NOTE)
+        card.fail.assert_awaited_once_with(reply)
+        card.finish.assert_not_awaited()
+
+
+@override_settings(DINGTALK_STREAM_CARD_INTERVAL=0.05)
+class StreamingCardThrottleTests(SimpleTestCase):
+    def card(self):
+        from apps.channel.dingtalk.cards import StreamingCard
+
+        card = StreamingCard({})
+        card.started = True
+        card.sent = []
+
+        async def request(method, path, body):
+            if path == '/v1.0/card/streaming':
+                card.sent.append((body['content'], body['isFinalize']))
+            return True
+        card._request = request
+        return card
+
+    async def test_throttled_updates_flushed_once_at_window_end(self):
+        card = self.card()
+        await card.update('你')
+        await card.update('你好')
+        await card.update('你好，')
+        self.assertEqual(card.sent, [('你', False)])
+
+        await asyncio.sleep(0.08)
+        self.assertEqual(card.sent, [('你', False), ('你好，', False)])
+
+        await card.finish('你好，世界')
+        self.assertEqual(card.sent[-1], ('你好，世界', True))
+        self.assertEqual(card.updates, 3)
+
+    async def test_finish_drops_pending_trailing_update(self):
+        card = self.card()
+        await card.update('你')
+        await card.update('你好')
+        await card.finish('你好！')
+        await asyncio.sleep(0.08)
+
+        self.assertEqual(card.sent, [('你', False), ('你好！', True)])
+
+    async def test_force_sends_immediately(self):
+        card = self.card()
+        await card.update('你')
+        await card.update('你好', force=True)
+        await asyncio.sleep(0.08)
+
+        self.assertEqual(card.sent, [('你', False), ('你好', False)])
+
+
+class MessageWorkerPoolTests(SimpleTestCase):
+    async def test_full_queue_rejects(self):
+        release = asyncio.Event()
+
+        async def handle(callback):
+            await release.wait()
+
+        pool = MessageWorkerPool(handle, workers=1, queue_size=2)
+        self.assertTrue(pool.submit('a'))
+        await asyncio.sleep(0)  # worker 取走 a
+        self.assertTrue(pool.submit('b'))
+        self.assertTrue(pool.submit('c'))
+        self.assertFalse(pool.submit('d'))
+
+        release.set()
+        self.assertEqual(await pool.stop(timeout=1), 0)
+
+    async def test_concurrency_limited_to_workers(self):
+        running = peak = 0
+
+        async def handle(callback):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        pool = MessageWorkerPool(handle, workers=2, queue_size=10)
+        for i in range(6):
+            self.assertTrue(pool.submit(i))
+        await pool.stop(timeout=1)
+
+        self.assertEqual(peak, 2)
+
+    async def test_stop_drains_queue(self):
+        handled = []
+
+        async def handle(callback):
+            await asyncio.sleep(0)
+            handled.append(callback)
+
+        pool = MessageWorkerPool(handle, workers=1, queue_size=10)
+        for i in range(5):
+            pool.submit(i)
+
+        self.assertEqual(await pool.stop(timeout=1), 0)
+        self.assertEqual(handled, [0, 1, 2, 3, 4])
+
+    async def test_stop_timeout_reports_dropped(self):
+        async def handle(callback):
+            await asyncio.sleep(10)
+
+        pool = MessageWorkerPool(handle, workers=1, queue_size=10)
+        for i in range(3):
+            pool.submit(i)
+        await asyncio.sleep(0)
+
+        # 两条在队列里，一条在处理中被取消
+        self.assertEqual(await pool.stop(timeout=0.01), 3)
+
+    def test_pending_messages_survive_loop_switch(self):
+        handled = []
+        attempts = []
+
+        async def handle(callback):
+            attempts.append(callback)
+            if attempts.count(callback) == 1 and callback == 'busy':
+                await asyncio.Event().wait()
+            handled.append(callback)
+
+        pool = MessageWorkerPool(handle, workers=1, queue_size=10)
+
+        async def enqueue():
+            for callback in ('busy', 1, 2):
+                pool.submit(callback)
+            await asyncio.sleep(0)
+
+        # 循环结束时唯一的 worker 还卡在 busy 上，1 和 2 留在旧队列里
+        asyncio.run(enqueue())
+        self.assertEqual(handled, [])
+
+        # 被取消的 busy 和队列里的消息都在新循环里处理
+        self.assertEqual(asyncio.run(pool.stop(timeout=1)), 0)
+        self.assertEqual(handled, ['busy', 1, 2])
+
+    def test_interrupted_messages_fit_past_queue_size(self):
+        handled = []
+        block = True
+
+        async def handle(callback):
+            if block:
+                await asyncio.Event().wait()
+            handled.append(callback)
+
+        pool = MessageWorkerPool(handle, workers=1, queue_size=1)
+
+        async def fill():
+            self.assertTrue(pool.submit('a'))
+            await asyncio.sleep(0)
+            self.assertTrue(pool.submit('b'))
+            self.assertFalse(pool.submit('c'))
+
+        asyncio.run(fill())
+        block = False
+
+        self.assertEqual(asyncio.run(pool.stop(timeout=1)), 0)
+        self.assertEqual(handled, ['a', 'b'])
+
+
+class RunBotCommandTests(SimpleTestCase):
+    @override_settings(DINGTALK_ASYNC_ACK=True)
+    def test_async_ack_can_be_disabled(self):
+        from apps.channel.dingtalk.management.commands.run_dingtalk_bot import Command
+
+        parser = Command().create_parser('manage.py', 'run_dingtalk_bot')
+
+        self.assertTrue(parser.parse_args([]).async_ack)
+        self.assertFalse(parser.parse_args(['--no-async-ack']).async_ack)
+
+
+class HttpClientsTests(SimpleTestCase):
+    def test_sync_client_shared_per_profile(self):
+        client = http_clients.get_sync_client()
+
+        self.assertIs(http_clients.get_sync_client('default'), client)
+        self.assertIsNot(http_clients.get_sync_client('insecure'), client)
+
+        client.close()
+        self.assertIsNot(http_clients.get_sync_client(), client)
+
+    def test_async_client_shared_within_loop(self):
+        async def pair():
+            return http_clients.get_async_client(), http_clients.get_async_client()
+
+        first, again = asyncio.run(pair())
+        second, _ = asyncio.run(pair())
+
+        self.assertIs(first, again)
+        self.assertIsNot(first, second)
+
+    @override_settings(XIAOHONGSHU_COOKIE='a1=abc; web_session=xyz')
+    def test_profile_headers(self):
+        self.assertEqual(http_clients._client_kwargs('xiaohongshu')['headers']['Cookie'], 'a1=abc; web_session=xyz')
+        self.assertNotIn('Cookie', http_clients._client_kwargs('default')['headers'])
+        self.assertFalse(http_clients._client_kwargs('insecure')['verify'])
+
+    def test_unknown_profile(self):
+        with self.assertRaises(KeyError):
+            http_clients.get_sync_client('nope')
+
+
+class StreamingFetchTests(SimpleTestCase):
+    url = 'https://example.com/page'
+
+    def transport(self, content_type, chunks, sent):
+        def body():
+            for chunk in chunks:
+                sent.append(chunk)
+                yield chunk
+
+        return httpx.MockTransport(lambda request: httpx.Response(
+            200, headers={'Content-Type': content_type}, content=body(),
+        ))
+
+    def fetch(self, content_type, chunks, **kwargs):
+        sent = []
+        client = httpx.Client(transport=self.transport(content_type, chunks, sent))
+        return fetcher.fetch_page_sync(client, self.url, **kwargs), sent
+
+    def test_binary_content_not_downloaded(self):
+        page, sent = self.fetch('application/pdf', [b'%PDF' * 100] * 10)
+
+        self.assertTrue(page.media)
+        self.assertEqual(page.content, b'')
+        self.assertEqual(sent, [])
+        self.assertIn('page', fetcher.media_page(page, self.url)['title'])
+
+    def test_byte_cap(self):
+        page, sent = self.fetch('text/html', [b'x' * 100] * 10, max_bytes=250)
+
+        self.assertTrue(page.truncated)
+        self.assertEqual(len(page.content), 250)
+        self.assertEqual(len(sent), 3)
+
+    def test_stops_after_head_and_enough_body(self):
+        chunks = [b'<html><head><title>t</title></head>', b'<body>' + b'a' * 50, b'b' * 50, b'c' * 50]
+        page, sent = self.fetch('text/html; charset=utf-8', chunks, max_bytes=10000, body_bytes=80)
+
+        self.assertTrue(page.truncated)
+        self.assertEqual(len(sent), 3)
+        self.assertTrue(page.text.startswith('<html><head><title>t</title></head>'))
+
+    def test_small_page_read_whole(self):
+        page, _ = self.fetch('text/html', [ARTICLE_HTML.encode()])
+
+        self.assertFalse(page.truncated)
+        self.assertEqual(page.text, ARTICLE_HTML)
+
+    async def test_async_byte_cap(self):
+        async def body():
+            for _ in range(10):
+                yield b'x' * 100
+
+        transport = httpx.MockTransport(lambda request: httpx.Response(
+            200, headers={'Content-Type': 'text/html'}, content=body(),
+        ))
+        async with httpx.AsyncClient(transport=transport) as client:
+            page = await fetcher.fetch_page(client, self.url, max_bytes=250)
+
+        self.assertTrue(page.truncated)
+        self.assertEqual(len(page.content), 250)
+
+
+@override_settings(DINGTALK_TOKEN_REFRESH_MARGIN=300)
+class TokenManagerTests(SimpleTestCase):
+    def manager(self, expires_in=7200, delay=0.0):
+        calls = []
+
+        def fetch():
+            calls.append(threading.get_ident())
+            time.sleep(delay)
+            return f'token-{len(calls)}', expires_in
+
+        return TokenManager(fetch=fetch), calls
+
+    def test_cached_until_margin(self):
+        manager, calls = self.manager()
+
+        self.assertEqual(manager.get(), 'token-1')
+        self.assertEqual(manager.get(), 'token-1')
+        self.assertEqual(len(calls), 1)
+
+        manager._expires_at = time.time() + 100  # 进入刷新窗口
+        self.assertEqual(manager.get(), 'token-2')
+
+    def test_single_flight_across_threads(self):
+        manager, calls = self.manager(delay=0.05)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(manager.get())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['token-1'] * 8)
+
+    def test_old_token_served_while_refreshing(self):
+        manager, _ = self.manager()
+        manager.get()
+        manager._expires_at = time.time() + 100
+
+        with manager._lock:
+            self.assertEqual(manager.get(), 'token-1')
+
+    async def test_async_callers_share_refresh(self):
+        manager, calls = self.manager(delay=0.05)
+
+        tokens = await asyncio.gather(*(manager.aget() for _ in range(5)))
+
+        self.assertEqual(tokens, ['token-1'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    async def test_async_refresh_uses_one_thread(self):
+        manager, calls = self.manager(delay=0.05)
+        with mock.patch.object(manager, 'get', wraps=manager.get) as get:
+            tokens = await asyncio.gather(*(manager.aget() for _ in range(5)))
+
+        self.assertEqual(tokens, ['token-1'] * 5)
+        self.assertEqual(get.call_count, 1)
+
+    async def test_cancelled_waiter_does_not_cancel_refresh(self):
+        manager, calls = self.manager(delay=0.05)
+        first = asyncio.ensure_future(manager.aget())
+        second = asyncio.ensure_future(manager.aget())
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        self.assertEqual(await second, 'token-1')
+        self.assertTrue(first.cancelled())
+        self.assertEqual(len(calls), 1)
+
+    async def test_async_old_token_served_while_refreshing(self):
+        manager, calls = self.manager(delay=0.05)
+        manager.get()
+        manager._expires_at = time.time() + 100
+        refresh = asyncio.ensure_future(manager.aget())
+        await asyncio.sleep(0)
+
+        self.assertEqual(await manager.aget(), 'token-1')
+        self.assertEqual(await refresh, 'token-2')
+
+    def test_invalidate_forces_refresh(self):
+        manager, calls = self.manager()
+        manager.get()
+        manager.invalidate()
+
+        self.assertEqual(manager.get(), 'token-2')
+        self.assertEqual(manager.refreshes, 2)
+
+    def test_invalidate_of_replaced_token_is_ignored(self):
+        manager, calls = self.manager()
+        old = manager.get()
+        manager.invalidate(old)
+        new = manager.get()
+
+        # 用旧 token 发出的请求晚于刷新才返回 401，不应清掉新 token
+        manager.invalidate(old)
+        self.assertEqual(manager.get(), new)
+        manager.invalidate(new)
+        self.assertEqual(manager.get(), 'token-3')
+
+
+class ResolveDownloadUrlsTests(SimpleTestCase):
+    async def resolve(self, codes, token='token', **kwargs):
+        running = peak = 0
+
+        async def request(token, code, robot_code):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            if code == 'bad':
+                raise RuntimeError('boom')
+            return f'https://download/{code}'
+
+        with mock.patch.object(utils.token_manager, 'aget', mock.AsyncMock(return_value=token)), \
+                mock.patch.object(utils, '_request_download_url', side_effect=request):
+            return await utils.resolve_download_urls(codes, 'robot', **kwargs), peak
+
+    async def test_results_keep_order_and_isolate_failures(self):
+        results, _ = await self.resolve(['a', 'bad', 'c'])
+
+        self.assertEqual([item['url'] for item in results], ['https://download/a', None, 'https://download/c'])
+        self.assertIsNone(results[0]['error'])
+        self.assertIn('boom', results[1]['error'])
+
+    async def test_concurrency_limit(self):
+        results, peak = await self.resolve([str(i) for i in range(6)], concurrency=2)
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(peak, 2)
+
+    async def test_missing_token(self):
+        with mock.patch.object(utils.token_manager, 'aget', mock.AsyncMock(side_effect=RuntimeError('down'))):
+            results = await utils.resolve_download_urls(['a', 'b'], 'robot')
+
+        self.assertEqual([item['error'] for item in results], ['no access token'] * 2)
+
+
+@override_settings(MESSAGE_TRACE_ENABLED=True, MESSAGE_TRACE_SLOW_MS=60000)
+class TracingTests(SimpleTestCase):
+    def summary(self, logs):
+        return json.loads(logs.output[0].split('trace ', 1)[1])
+
+    @override_settings(MESSAGE_TRACE_ENABLED=False)
+    def test_disabled_is_noop(self):
+        self.assertIsNone(tracing.start_trace('dingtalk', 'msg-1'))
+        self.assertIs(tracing.span('classify'), tracing.NULL_SPAN)
+        tracing.finish_trace(None)
+
+    async def test_nested_and_concurrent_spans(self):
+        async def link(url):
+            with tracing.span('link', url=url):
+                with tracing.span('fetch'):
+                    await asyncio.sleep(0)
+
+        trace = tracing.start_trace('dingtalk', 'msg-2')
+        with tracing.span('ingest'):
+            await asyncio.gather(link('a'), link('b'))
+        with tracing.span('classify') as classify:
+            classify.set(label='urgent')
+        tracing.annotate(message_type='text')
+        with self.assertLogs('apps.channel.tracing', level='INFO') as logs:
+            tracing.finish_trace(trace)
+
+        summary = self.summary(logs)
+        self.assertEqual(summary['trace'], 'msg-2')
+        self.assertEqual(summary['message_type'], 'text')
+        ingest, classify = summary['spans']
+        self.assertEqual([child['url'] for child in ingest['spans']], ['a', 'b'])
+        self.assertEqual(ingest['spans'][0]['spans'][0]['name'], 'fetch')
+        self.assertEqual(classify['label'], 'urgent')
+        self.assertIs(tracing.span('after'), tracing.NULL_SPAN)
+
+    @override_settings(MESSAGE_TRACE_SLOW_MS=0)
+    def test_error_and_slow_log(self):
+        trace = tracing.start_trace('dingtalk', 'msg-3')
+        with self.assertRaises(ValueError):
+            with tracing.span('save'):
+                raise ValueError('db')
+        with self.assertLogs('apps.channel.tracing', level='INFO') as logs:
+            tracing.finish_trace(trace)
+
+        self.assertEqual(self.summary(logs)['spans'][0]['error'], 'ValueError')
+        self.assertTrue(any(line.startswith('WARNING:apps.channel.tracing.slow') for line in logs.output))
@@ -0,0 +1,146 @@
+"""单条消息处理流水线的分阶段耗时追踪。
+
+回复慢的时候只看零散的日志很难判断时间花在了哪里（Notion 查重、网页抓取、视觉模型、分类、任务提取、写库……）。
+开启 MESSAGE_TRACE_ENABLED 后，每条消息以 msgId 作为关联 ID 建立一个 trace：
+- 用 `with span('classify'):` 包住各个阶段，span 可以嵌套；并发的子任务（如每个链接的处理）继承当前 span，
+  记录为它的子 span
+- 处理结束时输出一行 JSON 摘要（总耗时 + 各 span 的起始偏移和耗时）
+- 总耗时不低于 MESSAGE_TRACE_SLOW_MS 的消息再写一份到慢消息日志（logger: apps.channel.tracing.slow，
+  配置 MESSAGE_TRACE_SLOW_LOG 时单独写入该文件）
+
+未开启或不在 trace 内时 span() 返回同一个空对象，只多一次 ContextVar 读取。
+"""
+import contextvars
+import json
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger(__name__ + '.slow')
+
+_current_trace = contextvars.ContextVar('message_trace', default=None)
+_current_span = contextvars.ContextVar('message_span', default=None)
+
+
+def tracing_enabled() -> bool:
+    return getattr(settings, 'MESSAGE_TRACE_ENABLED', False)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'attrs', 'children', 'start', 'duration', 'error', '_token')
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.start = 0.0
+        self.duration = 0.0
+        self.error = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        parent = _current_span.get()
+        (parent.children if parent is not None else self.trace.spans).append(self)
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _current_span.reset(self._token)
+        return False
+
+    def set(self, **attrs):
+        """补充 span 属性（如分类结果、是否命中缓存）。"""
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin) -> dict:
+        data = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000),
+            'ms': round(self.duration * 1000),
+            **self.attrs,
+        }
+        if self.error:
+            data['error'] = self.error
+        if self.children:
+            data['spans'] = [child.to_dict(origin) for child in sorted(self.children, key=lambda s: s.start)]
+        return data
+
+
+class Trace:
+    __slots__ = ('kind', 'trace_id', 'attrs', 'spans', 'start', '_tokens')
+
+    def __init__(self, kind, trace_id):
+        self.kind = kind
+        self.trace_id = trace_id
+        self.attrs = {}
+        self.spans = []
+        self.start = time.perf_counter()
+
+    def summary(self) -> dict:
+        return {
+            'trace': self.trace_id,
+            'kind': self.kind,
+            'total_ms': round((time.perf_counter() - self.start) * 1000),
+            **self.attrs,
+            'spans': [span.to_dict(self.start) for span in sorted(self.spans, key=lambda s: s.start)],
+        }
+
+
+def start_trace(kind: str, trace_id: str) -> Trace | None:
+    """开始追踪一条消息；未开启时返回 None。必须与 finish_trace 成对调用。"""
+    if not tracing_enabled():
+        return None
+    trace = Trace(kind, trace_id)
+    trace._tokens = (_current_trace.set(trace), _current_span.set(None))
+    return trace
+
+
+def finish_trace(trace: Trace | None):
+    """结束追踪并输出摘要；超过阈值的同时写入慢消息日志。"""
+    if trace is None:
+        return
+    _current_span.reset(trace._tokens[1])
+    _current_trace.reset(trace._tokens[0])
+
+    summary = trace.summary()
+    line = json.dumps(summary, ensure_ascii=False, default=str)
+    logger.info("trace %s", line)
+    if summary['total_ms'] >= getattr(settings, 'MESSAGE_TRACE_SLOW_MS', 5000):
+        slow_logger.warning("slow %s", line)
+
+
+def span(name: str, **attrs):
+    """在当前 trace 内记录一个阶段；不在 trace 内时返回空对象。"""
+    trace = _current_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return Span(trace, name, attrs)
+
+
+def annotate(**attrs):
+    """给当前 trace 的摘要补充字段（如消息类型、分类结果）。"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
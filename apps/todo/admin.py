@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Task
+from .models import KnowledgeLink, Task
 
 
 @admin.register(Task)
@@ -8,3 +8,11 @@ class TaskAdmin(admin.ModelAdmin):
     list_filter = ['priority', 'status', 'source']
     search_fields = ['title', 'description']
     list_editable = ['priority', 'status']
+
+
+@admin.register(KnowledgeLink)
+class KnowledgeLinkAdmin(admin.ModelAdmin):
+    list_display = ['title', 'category', 'rating', 'url', 'updated_at']
+    list_filter = ['category', 'rating']
+    search_fields = ['title', 'url', 'normalized_url']
+    readonly_fields = ['created_at', 'updated_at']
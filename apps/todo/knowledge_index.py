@@ -0,0 +1,110 @@
+import logging
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# 分享链接上常见的追踪参数，不影响页面内容，规范化时去掉
+TRACKING_PARAMS = {
+    'spm', 'from', 'isappinstalled', 'scene', 'clicktime', 'enterid',
+    'share_source', 'share_medium', 'share_from', 'share_id', 'share_channel',
+    'app_platform', 'app_version', 'apptime', 'sharer_shareinfo', 'sharer_shareinfo_first',
+}
+
+
+def normalize_url(url: str) -> str:
+    """规范化 URL，作为本地索引的 key。
+
+    小写 scheme/host，去掉默认端口、fragment、追踪参数和末尾的 /，其余参数排序。
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and not ((scheme == 'http' and parts.port == 80) or (scheme == 'https' and parts.port == 443)):
+        host = f'{host}:{parts.port}'
+
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith('utm_') and k.lower() not in TRACKING_PARAMS
+    ]
+    query.sort()
+
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def lookup_link(url: str) -> dict | None:
+    """从本地索引查询链接，命中返回与 check_link_exists_in_knowledge_base 相同结构的字典。"""
+    from apps.todo.models import KnowledgeLink
+
+    link = KnowledgeLink.objects.filter(normalized_url=normalize_url(url)).first()
+    if not link:
+        return None
+    return {
+        "exists": True,
+        "page_id": link.page_id,
+        "title": link.title or url,
+        "category": link.category,
+        "rating": link.rating,
+        "summary": link.summary,
+    }
+
+
+def index_link(url: str, page_id: str = '', title: str = '', category: str = '其他',
+               rating: str = '⭐⭐⭐', summary: str = ''):
+    """写入或更新一条本地索引记录，失败只记录日志，不影响主流程。"""
+    from apps.todo.models import KnowledgeLink
+
+    try:
+        KnowledgeLink.objects.update_or_create(
+            normalized_url=normalize_url(url),
+            defaults={
+                'url': url,
+                'page_id': page_id or '',
+                'title': title or '',
+                'category': category or '其他',
+                'rating': rating or '⭐⭐⭐',
+                'summary': summary or '',
+            },
+        )
+    except Exception as e:
+        logger.warning(f"Failed to index KB link {url}: {e}")
+
+
+def bulk_index_links(items: list[dict]) -> int:
+    """批量写入本地索引（items 为 parse_kb_page 的结果），返回写入条数。"""
+    from apps.todo.models import KnowledgeLink
+
+    links = {}
+    for item in items:
+        if not item.get('url'):
+            continue
+        # 单条 URL 异常（如端口非法）只跳过该条，不影响整批写入
+        try:
+            normalized = normalize_url(item['url'])
+        except ValueError as e:
+            logger.warning(f"Skip indexing KB link {item['url']}: {e}")
+            continue
+        if len(normalized) > KnowledgeLink._meta.get_field('normalized_url').max_length:
+            logger.warning(f"Skip indexing KB link {item['url']}: normalized URL too long")
+            continue
+        links[normalized] = KnowledgeLink(
+            normalized_url=normalized,
+            url=item['url'],
+            page_id=item.get('page_id', ''),
+            title=item.get('title', ''),
+            category=item.get('category', '其他'),
+            rating=item.get('rating', '⭐⭐⭐'),
+            summary=item.get('summary', ''),
+        )
+
+    if links:
+        KnowledgeLink.objects.bulk_create(
+            list(links.values()),
+            update_conflicts=True,
+            unique_fields=['normalized_url'],
+            update_fields=['url', 'page_id', 'title', 'category', 'rating', 'summary', 'updated_at'],
+        )
+    return len(links)
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.todo.knowledge_index import bulk_index_links
+from apps.todo.notion_client import query_knowledge_base_pages
+
+
+class Command(BaseCommand):
+    help = '从 Notion 知识库分页拉取全部链接，预热本地链接索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='每次分页查询的条数（Notion 上限 100）')
+
+    def handle(self, *args, **options):
+        if not settings.NOTION_API_KEY or not settings.NOTION_KB_DATABASE_ID:
+            self.stderr.write(self.style.ERROR('请在 .env 中配置 NOTION_API_KEY 和 NOTION_KB_DATABASE_ID'))
+            return
+
+        page_size = min(max(options['page_size'], 1), 100)
+        batch = []
+        total = 0
+        for item in query_knowledge_base_pages(page_size=page_size):
+            batch.append(item)
+            if len(batch) >= page_size:
+                total += bulk_index_links(batch)
+                batch = []
+        total += bulk_index_links(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'本地知识库索引预热完成，共写入 {total} 条链接'))
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0003_alter_task_task_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_url', models.CharField(max_length=2000, unique=True, verbose_name='规范化URL')),
+                ('url', models.URLField(max_length=2000, verbose_name='原始URL')),
+                ('page_id', models.CharField(blank=True, default='', max_length=100, verbose_name='Notion ID')),
+                ('title', models.CharField(blank=True, default='', max_length=500, verbose_name='标题')),
+                ('category', models.CharField(blank=True, default='其他', max_length=50, verbose_name='分类')),
+                ('rating', models.CharField(blank=True, default='⭐⭐⭐', max_length=20, verbose_name='评分')),
+                ('summary', models.TextField(blank=True, default='', verbose_name='概要')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '知识库链接',
+                'verbose_name_plural': '知识库链接',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -41,3 +41,24 @@ class Task(models.Model):
 
     def __str__(self):
         return f'[{self.get_priority_display()}] {self.title}'
+
+
+class KnowledgeLink(models.Model):
+    """Notion 知识库链接的本地索引，用于链接查重时避免每次查询 Notion。"""
+    normalized_url = models.CharField('规范化URL', max_length=2000, unique=True)
+    url = models.URLField('原始URL', max_length=2000)
+    page_id = models.CharField('Notion ID', max_length=100, blank=True, default='')
+    title = models.CharField('标题', max_length=500, blank=True, default='')
+    category = models.CharField('分类', max_length=50, blank=True, default='其他')
+    rating = models.CharField('评分', max_length=20, blank=True, default='⭐⭐⭐')
+    summary = models.TextField('概要', blank=True, default='')
+    created_at = models.DateTimeField('创建时间', auto_now_add=True)
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = '知识库链接'
+        verbose_name_plural = '知识库链接'
+
+    def __str__(self):
+        return f'[{self.category}] {self.title or self.url}'
@@ -318,11 +318,74 @@ def query_last_week_completed_tasks() -> list[dict]:
         }
     )
 
+def parse_kb_page(page: dict) -> dict:
+    """将知识库数据库中的 page 解析为简单字典。"""
+    props = page.get('properties', {})
+
+    url = props.get('URL', {}).get('url') or ''
+
+    title_prop = props.get('标题', {}).get('title', [])
+    title = title_prop[0]['text']['content'] if title_prop else url
+
+    category = props.get('分类', {}).get('select', {}).get('name', '其他') if props.get('分类', {}).get('select') else '其他'
+    rating = props.get('评分', {}).get('select', {}).get('name', '⭐⭐⭐') if props.get('评分', {}).get('select') else '⭐⭐⭐'
+
+    summary_prop = props.get('概要', {}).get('rich_text', [])
+    summary = summary_prop[0]['text']['content'] if summary_prop else '暂无摘要'
+
+    return {
+        "url": url,
+        "page_id": page.get('id', ''),
+        "title": title,
+        "category": category,
+        "rating": rating,
+        "summary": summary
+    }
+
+
+def query_knowledge_base_pages(page_size=100):
+    """
+    Iterate over all pages of the Knowledge Base database using cursor pagination.
+    Yields parsed page dictionaries.
+    """
+    kb_db_id = settings.NOTION_KB_DATABASE_ID
+    if not settings.NOTION_API_KEY or not kb_db_id:
+        logger.warning("Notion API Key or KB Database ID not configured.")
+        return
+
+    body = {'page_size': page_size}
+    while True:
+        resp = httpx.post(
+            f'{NOTION_API}/databases/{kb_db_id}/query',
+            headers=_notion_headers(),
+            json=body,
+            timeout=30,
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        for page in data.get('results', []):
+            yield parse_kb_page(page)
+
+        if not data.get('has_more') or not data.get('next_cursor'):
+            break
+        body['start_cursor'] = data['next_cursor']
+
+
 def check_link_exists_in_knowledge_base(url):
     """
     Check if a given URL already exists in the Knowledge Base database.
+    Looks up the local index first and only queries Notion on a miss.
     Returns a dictionary with existing page info if found, otherwise None.
     """
+    from apps.todo.knowledge_index import index_link, lookup_link
+
+    try:
+        local_info = lookup_link(url)
+        if local_info:
+            return local_info
+    except Exception as e:
+        logger.warning(f"Failed to query local KB index for URL {url}: {e}")
+
     kb_db_id = settings.NOTION_KB_DATABASE_ID
     if not settings.NOTION_API_KEY or not kb_db_id:
         return None
@@ -349,25 +412,16 @@ def check_link_exists_in_knowledge_base(url):
         results = data.get('results', [])
 
         if results:
-            # 获取已经存在的记录信息返回
-            page = results[0]
-            props = page.get('properties', {})
-
-            title_prop = props.get('标题', {}).get('title', [])
-            title = title_prop[0]['text']['content'] if title_prop else url
-
-            category = props.get('分类', {}).get('select', {}).get('name', '其他') if props.get('分类', {}).get('select') else '其他'
-            rating = props.get('评分', {}).get('select', {}).get('name', '⭐⭐⭐') if props.get('评分', {}).get('select') else '⭐⭐⭐'
-
-            summary_prop = props.get('概要', {}).get('rich_text', [])
-            summary = summary_prop[0]['text']['content'] if summary_prop else '暂无摘要'
-
+            # 获取已经存在的记录信息返回，并回填本地索引
+            info = parse_kb_page(results[0])
+            index_link(url, info['page_id'], info['title'], info['category'], info['rating'], info['summary'])
             return {
                 "exists": True,
-                "title": title,
-                "category": category,
-                "rating": rating,
-                "summary": summary
+                "page_id": info['page_id'],
+                "title": info['title'],
+                "category": info['category'],
+                "rating": info['rating'],
+                "summary": info['summary']
             }
         return None
     except Exception as e:
@@ -449,6 +503,9 @@ def save_link_to_knowledge_base(url, title, source_name, category, publish_date=
         )
         page_id = response.get("id")
         logger.info(f"Successfully created Notion KB page for URL {url}: {page_id}")
+
+        from apps.todo.knowledge_index import index_link
+        index_link(url, page_id, title, category, rating, summary)
         return page_id
     except Exception as e:
         logger.error(f"Failed to save URL {url} to Notion KB: {e}")
@@ -1,12 +1,12 @@
 import logging
 from datetime import datetime, timedelta, date
-from http import HTTPStatus
-import dashscope
-from dashscope import Generation
 from django.conf import settings
 from django.utils import timezone
 import chinese_calendar
 
+from apps.ai.cache import cache_get, cache_key, cache_set
+from apps.ai.llm import complete_route
+from apps.ai.routing import select
 from apps.todo.notion_client import query_incomplete_tasks, query_last_week_completed_tasks, query_notion_tasks
 from apps.channel.dingtalk.client import send_message
 
@@ -14,21 +14,23 @@ logger = logging.getLogger(__name__)
 
 
 def _call_ai(prompt: str) -> str:
-    """调用 qwen-max 生成摘要文本。"""
+    """按 scheduler_summary 路由（默认 qwen-max）生成摘要文本。"""
     if not settings.DASHSCOPE_API_KEY:
         logger.warning("DASHSCOPE_API_KEY 未配置，跳过 AI 摘要")
         return ''
 
-    dashscope.api_key = settings.DASHSCOPE_API_KEY
-    response = Generation.call(
-        model='qwen-max',
-        messages=[{'role': 'user', 'content': prompt}],
-        result_format='message',
-    )
-    if response.status_code == HTTPStatus.OK:
-        return response.output.choices[0].message.content.strip()
-    logger.error("AI 摘要失败: %s - %s", response.code, response.message)
-    return ''
+    route = select('scheduler_summary', chars=len(prompt))
+    # 任务列表没有变化时提示词完全相同，直接复用上次的摘要
+    key = cache_key('scheduler_summary', route.model, 'v1', prompt)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+
+    summary = complete_route('AI 摘要', route, [{'role': 'user', 'content': prompt}])
+    if summary is None:
+        return ''
+    cache_set(key, summary)
+    return summary
 
 
 def _format_task_list(tasks: list[dict]) -> str:
@@ -269,12 +271,32 @@ def last_week_summary_job():
         _notify(f"📝 上周工作总结 (共完成 {len(tasks)} 项)\n\n{_format_task_list(tasks)}")
 
 
+def runtime_stats_job():
+    """输出机器人进程内自启动以来的累计运行统计（抓取域名、缓存、分类、正文压缩、模型路由、微批）。"""
+    from apps.ai.batching import log_batch_stats
+    from apps.ai.cache import log_cache_stats
+    from apps.ai.compaction import log_compaction_stats
+    from apps.ai.local_classifier import log_local_stats
+    from apps.ai.routing import log_route_stats
+    from apps.ai.rules import log_rule_stats
+    from apps.channel.fetch_policy import log_host_stats
+
+    log_host_stats()
+    log_cache_stats()
+    log_rule_stats()
+    log_local_stats()
+    log_compaction_stats()
+    log_route_stats()
+    log_batch_stats()
+
+
 # ---- 调度器 ----
 
 def start_scheduler():
     """初始化 APScheduler 并注册定时任务。"""
     from apscheduler.schedulers.background import BackgroundScheduler
     from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
 
     scheduler = BackgroundScheduler(timezone='Asia/Shanghai')
 
@@ -310,5 +332,32 @@ def start_scheduler():
         replace_existing=True,
     )
 
+    # 每天 3:00 清空过期的平台消息ID（去重只需覆盖重新投递的时间窗口）
+    from apps.channel.idempotency import prune_message_ids
+    scheduler.add_job(
+        prune_message_ids,
+        CronTrigger(hour=3, minute=0),
+        id='prune_message_ids',
+        replace_existing=True,
+    )
+
+    # 每天 3:10 删除过期的图片识别缓存
+    from apps.ai.recognizer import prune_recognized_images
+    scheduler.add_job(
+        prune_recognized_images,
+        CronTrigger(hour=3, minute=10),
+        id='prune_recognized_images',
+        replace_existing=True,
+    )
+
+    # 每隔 RUNTIME_STATS_INTERVAL 分钟输出运行统计（统计都在进程内，只有机器人进程里才有数据）
+    if settings.RUNTIME_STATS_INTERVAL > 0:
+        scheduler.add_job(
+            runtime_stats_job,
+            IntervalTrigger(minutes=settings.RUNTIME_STATS_INTERVAL),
+            id='runtime_stats',
+            replace_existing=True,
+        )
+
     scheduler.start()
     logger.info("APScheduler 已启动，注册了 %d 个定时任务", len(scheduler.get_jobs()))
@@ -0,0 +1,52 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.todo import scheduler
+from apps.todo.knowledge_index import bulk_index_links, lookup_link
+from apps.todo.models import KnowledgeLink
+
+
+class BulkIndexLinksTests(TestCase):
+    def test_bad_items_are_skipped(self):
+        long_url = 'https://example.com/' + 'a' * 1990 + '?q=' + '中' * 10
+        count = bulk_index_links([
+            {'url': 'https://example.com/ok?utm_source=x', 'page_id': 'p1', 'title': '正常链接'},
+            {'url': 'http://example.com:99999/bad-port', 'page_id': 'p2'},
+            {'url': long_url, 'page_id': 'p3'},
+            {'url': '', 'page_id': 'p4'},
+        ])
+
+        self.assertEqual(count, 1)
+        self.assertEqual(KnowledgeLink.objects.count(), 1)
+        self.assertEqual(lookup_link('https://EXAMPLE.com/ok/')['page_id'], 'p1')
+
+    def test_long_url_fits_normalized_field(self):
+        url = 'https://example.com/' + 'a' * 1500
+        self.assertEqual(bulk_index_links([{'url': url, 'page_id': 'p1'}]), 1)
+        self.assertEqual(lookup_link(url)['page_id'], 'p1')
+
+
+class RuntimeStatsJobTests(SimpleTestCase):
+    def job_ids(self):
+        with mock.patch('apscheduler.schedulers.background.BackgroundScheduler.start'):
+            with mock.patch('apscheduler.schedulers.background.BackgroundScheduler.add_job') as add_job:
+                scheduler.start_scheduler()
+        return [call.kwargs['id'] for call in add_job.call_args_list]
+
+    @override_settings(RUNTIME_STATS_INTERVAL=30)
+    def test_registered_when_interval_set(self):
+        self.assertIn('runtime_stats', self.job_ids())
+
+    @override_settings(RUNTIME_STATS_INTERVAL=0)
+    def test_disabled_with_zero_interval(self):
+        self.assertNotIn('runtime_stats', self.job_ids())
+
+    def test_logs_live_counters(self):
+        from apps.ai import routing
+
+        routing.record('generate_reply', 'stats-test-model', 0.1, 'ok')
+        with self.assertLogs('apps.ai.routing', level='INFO') as logs:
+            scheduler.runtime_stats_job()
+
+        self.assertTrue(any('generate_reply/stats-test-model' in line for line in logs.output))
@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'apps.ai',
     'apps.todo',
     'apps.channel',
     'apps.channel.dingtalk',
@@ -86,9 +87,81 @@ REST_FRAMEWORK = {
 # DingTalk
 DINGTALK_APP_KEY = env('DINGTALK_APP_KEY', default='')
 DINGTALK_APP_SECRET = env('DINGTALK_APP_SECRET', default='')
+# access_token 在过期前多少秒开始刷新
+DINGTALK_TOKEN_REFRESH_MARGIN = env.int('DINGTALK_TOKEN_REFRESH_MARGIN', default=300)
+# 单条消息内同时换取图片下载链接的请求数上限
+DINGTALK_DOWNLOAD_CONCURRENCY = env.int('DINGTALK_DOWNLOAD_CONCURRENCY', default=5)
+# 单条消息内同时处理的链接数上限
+DINGTALK_LINK_CONCURRENCY = env.int('DINGTALK_LINK_CONCURRENCY', default=4)
+# 立即 ack 并交给后台 worker 池处理消息（可被 run_dingtalk_bot 参数覆盖）
+DINGTALK_ASYNC_ACK = env.bool('DINGTALK_ASYNC_ACK', default=False)
+DINGTALK_WORKERS = env.int('DINGTALK_WORKERS', default=4)
+DINGTALK_QUEUE_SIZE = env.int('DINGTALK_QUEUE_SIZE', default=100)
+# 退出时等待队列中剩余消息处理完的最长秒数
+DINGTALK_DRAIN_TIMEOUT = env.float('DINGTALK_DRAIN_TIMEOUT', default=20)
+# 单聊普通消息的流式回复：AI 卡片模板 ID（留空则等完整回复后一次发送）、模板里的内容变量名、两次卡片更新的最小间隔（秒）
+DINGTALK_STREAM_CARD_TEMPLATE_ID = env('DINGTALK_STREAM_CARD_TEMPLATE_ID', default='')
+DINGTALK_STREAM_CARD_CONTENT_KEY = env('DINGTALK_STREAM_CARD_CONTENT_KEY', default='content')
+DINGTALK_STREAM_CARD_INTERVAL = env.float('DINGTALK_STREAM_CARD_INTERVAL', default=0.5)
+# 平台消息ID 用于识别重复投递，超过保留天数后清空
+MESSAGE_ID_RETENTION_DAYS = env.int('MESSAGE_ID_RETENTION_DAYS', default=7)
+
+# 网页抓取缓存：TTL 内直接命中，过期后条件请求校验；总大小超限按最近访问淘汰
+PAGE_CACHE_TTL = env.int('PAGE_CACHE_TTL', default=6 * 3600)
+PAGE_CACHE_MAX_BYTES = env.int('PAGE_CACHE_MAX_BYTES', default=50 * 1024 * 1024)
+
+# 流式抓取网页的字节上限；读完 <head> 后正文再读 PAGE_FETCH_BODY_BYTES 字节即停止
+PAGE_FETCH_MAX_BYTES = env.int('PAGE_FETCH_MAX_BYTES', default=2 * 1024 * 1024)
+PAGE_FETCH_BODY_BYTES = env.int('PAGE_FETCH_BODY_BYTES', default=1024 * 1024)
+# 网页抓取的连接 / 读取超时（秒），以及失败重试次数和指数退避（全抖动）参数
+PAGE_FETCH_CONNECT_TIMEOUT = env.float('PAGE_FETCH_CONNECT_TIMEOUT', default=5.0)
+PAGE_FETCH_READ_TIMEOUT = env.float('PAGE_FETCH_READ_TIMEOUT', default=15.0)
+PAGE_FETCH_RETRIES = env.int('PAGE_FETCH_RETRIES', default=3)
+PAGE_FETCH_BACKOFF_BASE = env.float('PAGE_FETCH_BACKOFF_BASE', default=0.5)
+PAGE_FETCH_BACKOFF_MAX = env.float('PAGE_FETCH_BACKOFF_MAX', default=4.0)
+# 同一域名连续失败 N 次后熔断，冷却期内直接跳过抓取
+PAGE_FETCH_BREAKER_THRESHOLD = env.int('PAGE_FETCH_BREAKER_THRESHOLD', default=3)
+PAGE_FETCH_BREAKER_COOLDOWN = env.int('PAGE_FETCH_BREAKER_COOLDOWN', default=300)
 
 # DashScope (Qwen)
 DASHSCOPE_API_KEY = env('DASHSCOPE_API_KEY', default='')
+# 机器人内的异步大模型调用（apps/ai/dashscope_async.py）：接口地址、连接超时和单次调用整体超时（秒）
+DASHSCOPE_BASE_URL = env('DASHSCOPE_BASE_URL', default='https://dashscope.aliyuncs.com/api/v1')
+DASHSCOPE_CONNECT_TIMEOUT = env.float('DASHSCOPE_CONNECT_TIMEOUT', default=5.0)
+DASHSCOPE_TIMEOUT = env.float('DASHSCOPE_TIMEOUT', default=60.0)
+# 图片消息的任务提取方式：reuse（识别一次，文本模型提取）/ multimodal（识别后再带图提取）/ merged（一次多模态调用）
+AI_IMAGE_TASK_MODE = env('AI_IMAGE_TASK_MODE', default='reuse')
+# 消息分类的规则前置判断：规则置信度不低于阈值时不调用大模型（规则表见 apps/ai/rules.py）
+AI_RULES_ENABLED = env.bool('AI_RULES_ENABLED', default=True)
+AI_RULES_MIN_CONFIDENCE = env.float('AI_RULES_MIN_CONFIDENCE', default=0.9)
+# 本地消息分类器（train_message_classifier 训练，需要 scikit-learn）：最高类别概率不低于阈值时不调用大模型
+AI_LOCAL_CLASSIFIER_ENABLED = env.bool('AI_LOCAL_CLASSIFIER_ENABLED', default=True)
+AI_LOCAL_CLASSIFIER_PATH = env('AI_LOCAL_CLASSIFIER_PATH', default=str(BASE_DIR / 'data' / 'message_classifier.joblib'))
+AI_LOCAL_CLASSIFIER_THRESHOLD = env.float('AI_LOCAL_CLASSIFIER_THRESHOLD', default=0.8)
+# 文章分析前正文压缩后的 token 预算（去掉模板行 / 重复行，按信息密度挑选段落），不超过旧做法截取前 5000 字的 token 数
+AI_ARTICLE_TOKEN_BUDGET = env.int('AI_ARTICLE_TOKEN_BUDGET', default=2000)
+# 模型路由：按调用类型和输入长度选择 qwen 档位，主模型超时 / 出错时换用降级模型（默认路由表见 apps/ai/routing.py）
+# 可在此定义 AI_MODEL_ROUTES / AI_MODEL_FALLBACKS 字典覆盖默认路由和降级顺序
+AI_MODEL_FALLBACK_ENABLED = env.bool('AI_MODEL_FALLBACK_ENABLED', default=True)
+# 消息分类微批处理：窗口期（秒）内到达的分类请求合并为一次调用，攒满 MAX_SIZE 条立即发送
+AI_CLASSIFY_BATCH_ENABLED = env.bool('AI_CLASSIFY_BATCH_ENABLED', default=False)
+AI_CLASSIFY_BATCH_WINDOW = env.float('AI_CLASSIFY_BATCH_WINDOW', default=0.2)
+AI_CLASSIFY_BATCH_MAX_SIZE = env.int('AI_CLASSIFY_BATCH_MAX_SIZE', default=10)
+# 大模型结果缓存：进程内 LRU 条数、数据库最多保留条数；各调用方 TTL 见 apps/ai/cache.py
+LLM_CACHE_ENABLED = env.bool('LLM_CACHE_ENABLED', default=True)
+LLM_CACHE_MEMORY_SIZE = env.int('LLM_CACHE_MEMORY_SIZE', default=512)
+LLM_CACHE_MAX_ENTRIES = env.int('LLM_CACHE_MAX_ENTRIES', default=5000)
+# 单条消息内同时识别的图片数上限
+AI_RECOGNIZE_CONCURRENCY = env.int('AI_RECOGNIZE_CONCURRENCY', default=4)
+# 图片识别缓存保留天数，过期后重新识别，每天由定时任务清理
+AI_RECOGNIZED_IMAGE_TTL_DAYS = env.int('AI_RECOGNIZED_IMAGE_TTL_DAYS', default=30)
+# 发给视觉模型前的图片预处理（需要 Pillow）：最长边、编码格式（JPEG / WEBP / PNG）和质量，高宽比超过 TILE_RATIO 的长图切块（0 关闭切块）
+AI_IMAGE_PREPROCESS = env.bool('AI_IMAGE_PREPROCESS', default=True)
+AI_IMAGE_MAX_EDGE = env.int('AI_IMAGE_MAX_EDGE', default=1600)
+AI_IMAGE_FORMAT = env('AI_IMAGE_FORMAT', default='JPEG')
+AI_IMAGE_QUALITY = env.int('AI_IMAGE_QUALITY', default=85)
+AI_IMAGE_TILE_RATIO = env.float('AI_IMAGE_TILE_RATIO', default=3.0)
+AI_IMAGE_MAX_TILES = env.int('AI_IMAGE_MAX_TILES', default=4)
 
 # Notion
 NOTION_API_KEY = env('NOTION_API_KEY', default='')
@@ -103,6 +176,14 @@ WECHAT_ENCODING_AES_KEY = env('WECHAT_ENCODING_AES_KEY', default='')
 # DingTalk 通知
 DINGTALK_NOTIFY_USER_ID = env('DINGTALK_NOTIFY_USER_ID', default='')
 
+# 消息处理分阶段耗时追踪（apps/channel/tracing.py）：每条消息输出一行 JSON 摘要，
+# 总耗时超过 MESSAGE_TRACE_SLOW_MS 毫秒的写入慢消息日志，配置 MESSAGE_TRACE_SLOW_LOG 时单独写入该文件
+MESSAGE_TRACE_ENABLED = env.bool('MESSAGE_TRACE_ENABLED', default=False)
+MESSAGE_TRACE_SLOW_MS = env.int('MESSAGE_TRACE_SLOW_MS', default=5000)
+MESSAGE_TRACE_SLOW_LOG = env('MESSAGE_TRACE_SLOW_LOG', default='')
+# 每隔多少分钟输出一次运行统计（抓取域名、大模型缓存、分类、正文压缩、模型路由、微批），0 表示只在退出时输出
+RUNTIME_STATS_INTERVAL = env.int('RUNTIME_STATS_INTERVAL', default=60)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -123,3 +204,15 @@ LOGGING = {
         },
     },
 }
+
+if MESSAGE_TRACE_SLOW_LOG:
+    LOGGING['handlers']['slow_messages'] = {
+        'class': 'logging.FileHandler',
+        'filename': MESSAGE_TRACE_SLOW_LOG,
+        'encoding': 'utf-8',
+    }
+    LOGGING['loggers']['apps.channel.tracing.slow'] = {
+        'handlers': ['slow_messages'],
+        'level': 'INFO',
+        'propagate': False,
+    }